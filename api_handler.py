@@ -3,12 +3,22 @@ import json
 import os
 import csv
 import io
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import messagebox
 
 # Assume utils.py and file_handler.py are accessible
 # Need get_game_folder_path to know where to save results
 from process_handler import get_game_folder_path
+from config import AI_CONTEXT_CACHE, AI_MAP_REDUCE, AI_REQUEST_TIMEOUT, DEFAULT_SETTINGS, GEMINI_API_URL
+import context_cache
+import game_manifest
+import response_cache
+from rate_limiter import THROTTLE_STATUS_CODES, parse_retry_after
+from review_index import ReviewIndex
+from token_counter import count_line_tokens, count_tokens, record_usage
 # Need generate_xlsx_from_csv from file_handler (we'll create this file next)
 # Forward declaration - will import properly later
 # from file_handler import generate_xlsx_from_csv
@@ -20,12 +30,337 @@ def generate_xlsx_from_csv(csv_filepath, xlsx_filepath, log_func):
      return True
 
 
+# Check model documentation for optimal maxOutputTokens; 8192 is large.
+GENERATION_CONFIG = {
+    "maxOutputTokens": 8192,
+    # Add temperature, topP, topK if needed
+    # "temperature": 0.7,
+}
+
+# Tags around the CSV block the prompts ask for
+CSV_START_TAG = "<CSV_START>"
+CSV_END_TAG = "<CSV_END>"
+
+# Instruction shared by every prompt that must answer in the <CSV_START>/<CSV_END> contract
+CSV_INSTRUCTIONS = (
+    f"If the query asks for structured data (like pros/cons, feature mentions, bug types), "
+    f"present that data as a standard CSV block enclosed ONLY by <CSV_START> and <CSV_END> tags. "
+    f"Include a header row in the CSV data. Do not include the tags themselves within the CSV content.\n"
+    f"Provide any textual explanation or summary *outside* of these CSV tags.\n\n"
+)
+
+
+def build_prompt(game_name, query_text, reviews_text, note=""):
+    """The analysis prompt for one block of review text; `note` goes right above the query."""
+    # Consider providing more structure/instructions for CSV output if needed
+    return (
+        f"You are analyzing Steam reviews for the game '{game_name}'.\n"
+        f"Based *only* on the provided review text below, answer the following query:\n"
+        f"{note}"
+        f"QUERY: {query_text}\n\n"
+        f"{CSV_INSTRUCTIONS}"
+        f"---\nREVIEW TEXT START\n---\n{reviews_text}\n---\nREVIEW TEXT END\n---"
+    )
+
+
+def build_context_prompt(game_name, reviews_text):
+    """The query-independent part of the prompt, uploaded once as Gemini cached content (context_cache.py)."""
+    return (
+        f"You are analyzing Steam reviews for the game '{game_name}'.\n"
+        f"---\nREVIEW TEXT START\n---\n{reviews_text}\n---\nREVIEW TEXT END\n---"
+    )
+
+
+def build_cached_query_prompt(query_text, note=""):
+    """The per-query part sent alongside cached content made by build_context_prompt."""
+    return (
+        f"Based *only* on the review text provided above, answer the following query:\n"
+        f"{note}"
+        f"QUERY: {query_text}\n\n"
+        f"{CSV_INSTRUCTIONS}"
+    )
+
+
+def build_reduce_prompt(game_name, query_text, partial_texts, final=True):
+    """Prompt that merges partial answers (map outputs or earlier merges) into one answer in the same format."""
+    parts = "\n\n".join(f"### Part {number}\n{text.strip()}" for number, text in enumerate(partial_texts, 1))
+    task = "one final answer to the query" if final else "one combined partial result (it will be merged with others later)" # noqa
+    return (
+        f"You are analyzing Steam reviews for the game '{game_name}'.\n"
+        f"The reviews were split into parts that were analyzed separately for the query below. Merge the "
+        f"{len(partial_texts)} partial results into {task}, as if you had read all the reviews yourself: "
+        f"combine rows that describe the same thing (adding up counts where the rows have counts), keep a "
+        f"single header row, and reconcile the notes instead of listing them part by part.\n"
+        f"QUERY: {query_text}\n\n"
+        f"{CSV_INSTRUCTIONS}"
+        f"---\nPARTIAL RESULTS START\n---\n{parts}\n---\nPARTIAL RESULTS END\n---"
+    )
+
+
+def post_with_retries(api_url, payload, log_func, retries=0, label="", stream=False):
+    """
+    POSTs a Gemini request. Throttling (429/503), other 5xx statuses, timeouts and connection errors
+    are retried `retries` times, honouring Retry-After; after that (and for any other HTTP error) the
+    requests exception is raised to the caller. Returns the successful response.
+    """
+    headers = {"Content-Type": "application/json"}
+    for attempt in range(retries + 1):
+        try:
+            response = requests.post(api_url, json=payload, headers=headers, timeout=AI_REQUEST_TIMEOUT, stream=stream) # 5 min timeout (between chunks when streaming) # noqa
+            response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+            return response
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
+            status = e.response.status_code if isinstance(e, requests.exceptions.HTTPError) else None
+            if attempt >= retries or (status is not None and status not in THROTTLE_STATUS_CODES and status < 500): raise
+            pause = (parse_retry_after(e.response.headers.get('Retry-After')) if status is not None else None) or 2.0 ** attempt # noqa
+            log_func(f"{label}AI request failed ({status or type(e).__name__}), retry {attempt + 1}/{retries} in {pause:.1f}s.") # noqa
+            time.sleep(pause)
+
+
+def read_sse_stream(response, on_text):
+    """
+    Reads a streamGenerateContent (alt=sse) response: every `data:` event carries the next piece of
+    the candidate text; on_text(text so far) is called after each one. Returns the events merged into
+    one generateContent-shaped response (full text; last finishReason, safetyRatings, usageMetadata).
+    """
+    response.encoding = 'utf-8' # SSE is UTF-8; requests would otherwise hand out bytes
+    pieces = []; merged = {}; candidate = {}
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'): continue # Blank separators, comments, other fields
+        event = json.loads(line[5:].strip())
+        if 'promptFeedback' in event: merged['promptFeedback'] = event['promptFeedback']
+        if 'usageMetadata' in event: merged['usageMetadata'] = event['usageMetadata']
+        for part in ((event.get('candidates') or [{}])[0].get('content') or {}).get('parts') or []:
+            if part.get('text'): pieces.append(part['text'])
+        for field in ('finishReason', 'safetyRatings'):
+            if field in (event.get('candidates') or [{}])[0]: candidate[field] = event['candidates'][0][field]
+        if pieces: on_text(''.join(pieces))
+    if pieces or candidate:
+        merged['candidates'] = [dict(candidate, content={'role': 'model', 'parts': [{'text': ''.join(pieces)}]})]
+    return merged
+
+
+def generate_content(api_key, model_id, prompt_text, log_func, retries=0, label="", raw_responses=None, on_text=None, cached_content=None, calibration_text=None): # noqa
+    """
+    One Gemini request. Returns (generated_text, finish_reason, usage_metadata); problems inside a
+    successful response (blocked prompt, no candidates/parts) come back as "Error: ..." text. With
+    `on_text` the request uses streamGenerateContent over SSE and on_text(text so far) is called as
+    the answer arrives. Failed requests are retried as described in post_with_retries. Every response's
+    promptTokenCount feeds the token calibration (measured against `calibration_text` when the prompt
+    is not the whole input, i.e. with `cached_content`, the name of a cachedContents entry to answer
+    from), and its JSON is appended to `raw_responses` when given (for the response cache).
+    """
+    # Define payload
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": prompt_text}]}],
+        "generationConfig": GENERATION_CONFIG,
+        # Add safety settings if necessary (e.g., block fewer categories)
+        # "safetySettings": [
+        #     { "category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE" },
+        #     # ... other categories
+        # ]
+    }
+    if cached_content: payload["cachedContent"] = cached_content
+
+    if on_text is None:
+        api_url = f"{GEMINI_API_URL}/models/{model_id}:generateContent?key={api_key}"
+        response = post_with_retries(api_url, payload, log_func, retries, label)
+        log_func(f"{label}AI request successful (HTTP Status: {response.status_code}).")
+        response_data = response.json()
+    else:
+        api_url = f"{GEMINI_API_URL}/models/{model_id}:streamGenerateContent?alt=sse&key={api_key}"
+        with post_with_retries(api_url, payload, log_func, retries, label, stream=True) as response:
+            log_func(f"{label}AI stream started (HTTP Status: {response.status_code}).")
+            response_data = read_sse_stream(response, on_text)
+    if raw_responses is not None: raw_responses.append(response_data)
+    return parse_generate_response(response_data, calibration_text or prompt_text, model_id, log_func, label)
+
+
+def parse_generate_response(response_data, prompt_text, model_id, log_func, label=""):
+    """Answer text, finish reason and usage metadata of a generateContent response (see generate_content)."""
+    generated_text_from_api = "Error: API call failed or no valid response received." # Default error
+    finish_reason = "UNKNOWN"
+    usage_metadata = {}
+    # --- Safely Parse API Response ---
+    try:
+        # Check for prompt feedback first (indicates blocking)
+        prompt_feedback = response_data.get('promptFeedback')
+        if prompt_feedback:
+            block_reason = prompt_feedback.get('blockReason')
+            if block_reason:
+                 safety_ratings = prompt_feedback.get('safetyRatings', [])
+                 log_func(f"{label}AI Error: Request blocked by API. Reason: {block_reason}. Safety Ratings: {safety_ratings}") # noqa
+                 generated_text_from_api = f"Error: Content blocked by API safety filters (Reason: {block_reason}). Please modify the input reviews or query." # noqa
+                 # Don't proceed with candidate parsing if blocked
+                 raise ValueError("Content blocked by API") # Use exception to jump to outer catch
+
+        # If not blocked, proceed to parse candidates
+        candidates = response_data.get('candidates')
+        if candidates and isinstance(candidates, list) and len(candidates) > 0:
+            candidate = candidates[0] # Get the first candidate
+            content = candidate.get('content', {})
+            parts = content.get('parts', [])
+            if parts and isinstance(parts, list) and len(parts) > 0:
+                generated_text_from_api = parts[0].get('text', "Error: Text part missing in API response.") # noqa
+            else:
+                generated_text_from_api = "Error: No 'parts' found in API response content."
+
+            finish_reason = candidate.get('finishReason', 'UNKNOWN')
+            safety_ratings = candidate.get('safetyRatings', []) # Log safety ratings even if not blocked
+            log_func(f"{label}AI Finish Reason: {finish_reason}. Safety Ratings: {safety_ratings}")
+            if finish_reason not in ["STOP", "MAX_TOKENS", "UNSPECIFIED", None]: # Log unusual reasons
+                  log_func(f"{label}Warning: Unusual finish reason received: '{finish_reason}'. Response might be incomplete or malformed.") # noqa
+            elif finish_reason == "MAX_TOKENS":
+                 log_func(f"{label}Warning: AI response potentially truncated due to maximum output tokens limit.") # noqa
+
+            usage_metadata = response_data.get('usageMetadata', {})
+            log_func(f"{label}API Usage Metadata: {usage_metadata}")
+            prompt_estimate = count_tokens(prompt_text, model_id) # Before this sample joins the calibration
+            if record_usage(model_id, prompt_text, usage_metadata.get('promptTokenCount')):
+                log_func(f"{label}Token calibration: estimated ~{prompt_estimate:,}, actual {usage_metadata['promptTokenCount']:,} prompt tokens.") # noqa
+
+        else:
+             generated_text_from_api = "Error: No valid 'candidates' found in API response."
+
+    except ValueError as block_e:
+         # This catches the "Content blocked" exception raised above
+         # Error message already set in generated_text_from_api
+         pass # Continue to processing/saving the error message
+    except Exception as parse_e:
+        log_func(f"{label}Error parsing successful AI response structure: {parse_e}\nResponse Snippet: {str(response_data)[:500]}") # noqa
+        generated_text_from_api = f"Error: Failed to parse the structure of the AI response. {parse_e}"
+
+    return generated_text_from_api, finish_reason, usage_metadata
+
+
+def preview_streamed_response(text):
+    """
+    What a partial (streaming) answer shows so far: (display text, CSV rows or None). The CSV block is
+    replaced by a placeholder in the text, and only its complete rows are returned: whole lines after
+    <CSV_START>, minus a last row whose quoted field is still open.
+    """
+    start_index = text.find(CSV_START_TAG)
+    if start_index == -1: return text, None
+    body_start = start_index + len(CSV_START_TAG)
+    end_index = text.find(CSV_END_TAG, body_start)
+    if end_index == -1:
+        region = text[body_start:text.rfind('\n') + 1] if text.rfind('\n') >= body_start else ""; text_after = "" # noqa
+    else:
+        region = text[body_start:end_index]; text_after = text[end_index + len(CSV_END_TAG):].lstrip()
+    rows = [row for row in csv.reader(io.StringIO(region.strip())) if any(field.strip() for field in row)]
+    if region.count('"') % 2 and rows: rows.pop() # A quoted field continues on the next line
+    placeholder = "[CSV data streaming into the 'Extracted Data' tab...]" if end_index == -1 else "[CSV data extracted - see 'Extracted Data' tab or saved files]" # noqa
+    display = "\n\n".join(part for part in (text[:start_index].rstrip(), placeholder, text_after) if part)
+    return display, rows or None
+
+
+def split_review_chunks(reviews_text, chunk_tokens, model_id=None):
+    """Cuts review text at line boundaries into chunks of at most `chunk_tokens` (a longer single line is its own chunk).""" # noqa
+    lines = reviews_text.splitlines()
+    chunks = []; current = []; current_tokens = 0
+    for line, tokens in zip(lines, count_line_tokens(lines, model_id)):
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append("\n".join(current)); current = []; current_tokens = 0
+        current.append(line); current_tokens += tokens
+    if current: chunks.append("\n".join(current))
+    return chunks
+
+
+def group_by_tokens(texts, budget, model_id=None):
+    """Consecutive groups of texts whose token sum stays within `budget`; every group has at least two texts."""
+    groups = []; current = []; current_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text, model_id)
+        if len(current) >= 2 and current_tokens + tokens > budget:
+            groups.append(current); current = []; current_tokens = 0
+        current.append(text); current_tokens += tokens
+    if len(current) == 1 and groups: groups[-1].append(current[0]) # No group of one: it would not shrink
+    elif current: groups.append(current)
+    return groups
+
+
+def map_reduce_analysis(api_key, model_id, game_name, query_text, reviews_text, note, log_func, raw_responses=None, on_text=None): # noqa
+    """
+    Answers the query over review text of any size: the text is cut into AI_MAP_REDUCE['chunk_tokens']
+    chunks, each chunk is analyzed by its own request (AI_MAP_REDUCE['workers'] in flight at once) and
+    returns notes plus CSV rows for its part, and reduce requests merge those partial results into one
+    answer in the <CSV_START>/<CSV_END> format. When the partial results themselves exceed a chunk,
+    they are merged in consecutive groups first, level by level. Returns the final generated text
+    ("Error: ..." if no part produced a usable answer); requests exceptions propagate once retries are spent.
+    With `on_text` the request that produces the final answer is streamed (see generate_content).
+    """
+    chunk_tokens = AI_MAP_REDUCE['chunk_tokens']; retries = AI_MAP_REDUCE['retries']
+    log_lock = threading.Lock()
+    def worker_log(message): # One log line at a time from the pool threads
+        with log_lock: log_func(message)
+    chunks = split_review_chunks(reviews_text, chunk_tokens, model_id)
+    started = time.perf_counter()
+    log_func(f"Map-reduce: {len(chunks)} chunk{'s' if len(chunks) != 1 else ''} of up to ~{chunk_tokens:,} tokens, {min(AI_MAP_REDUCE['workers'], len(chunks))} in parallel.") # noqa
+
+    def run_all(prompts, stage):
+        with ThreadPoolExecutor(max_workers=max(1, min(AI_MAP_REDUCE['workers'], len(prompts)))) as pool:
+            futures = [pool.submit(generate_content, api_key, model_id, prompt, worker_log, retries, f"[{stage} {number}/{len(prompts)}] ", raw_responses) for number, prompt in enumerate(prompts, 1)] # noqa
+            results = [future.result()[0] for future in futures] # Raises the first failed request's exception
+        usable = [text for text in results if not text.startswith("Error:")]
+        if len(usable) < len(results): log_func(f"Map-reduce: {len(results) - len(usable)} of {len(results)} {stage} responses were errors and are left out.") # noqa
+        return usable
+
+    if len(chunks) == 1: # Fits one request: no merge needed
+        return generate_content(api_key, model_id, build_prompt(game_name, query_text, chunks[0], note), log_func, retries, "", raw_responses, on_text)[0] # noqa
+
+    map_note = f"{note}This text is one part of a larger set of reviews; answer for this part only. Keep the notes short and factual (counts, recurring points, short quotes) and give every CSV row this part supports, since the parts are merged afterwards.\n" # noqa
+    prompts = [build_prompt(game_name, query_text, chunk, map_note.replace("one part", f"part {number} of {len(chunks)}", 1)) for number, chunk in enumerate(chunks, 1)] # noqa
+    partials = run_all(prompts, "map")
+    if not partials: return "Error: Every map request failed or was blocked; no partial results to merge."
+
+    level = 1
+    while len(partials) > 1 and count_tokens("\n\n".join(partials), model_id) > chunk_tokens:
+        groups = group_by_tokens(partials, chunk_tokens, model_id)
+        if len(groups) == 1: break # The final merge takes them all at once
+        log_func(f"Map-reduce: Merging {len(partials)} partial results in {len(groups)} groups (level {level}).")
+        partials = run_all([build_reduce_prompt(game_name, query_text, group, final=False) for group in groups], f"merge L{level}") # noqa
+        if not partials: return "Error: Every intermediate merge request failed or was blocked."
+        level += 1
+
+    log_func(f"Map-reduce: Final merge of {len(partials)} partial result{'s' if len(partials) != 1 else ''}.")
+    final_text, _, _ = generate_content(api_key, model_id, build_reduce_prompt(game_name, query_text, partials), log_func, retries, "[reduce] ", raw_responses, on_text) # noqa
+    log_func(f"Map-reduce finished in {time.perf_counter() - started:.1f}s.")
+    return final_text
+
+
 # --- AI Interaction ---
 # (Moved from actions.py - Modified to use passed log_func)
-def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
+def cached_context_analysis(api_key, model_id, game_name, query_text, reviews_text, note, log_func, raw_responses=None, on_text=None): # noqa
+    """
+    Answers the query from a Gemini cachedContents entry holding the review text (context_cache.py):
+    created on first use, reused by later queries, re-created when the text changed or the entry expired
+    or was rejected. Returns the generated text, or None if no entry could be created (send the full prompt).
+    """
+    context_text = build_context_prompt(game_name, reviews_text)
+    query_prompt = build_cached_query_prompt(query_text, note)
+    for attempt in range(2):
+        cache_name = context_cache.ensure(api_key, model_id, context_text, game_name, log_func)
+        if not cache_name: return None
+        try:
+            generated_text, _, usage_metadata = generate_content(api_key, model_id, query_prompt, log_func, raw_responses=raw_responses, on_text=on_text, cached_content=cache_name, calibration_text=context_text + "\n" + query_prompt) # noqa
+        except requests.exceptions.HTTPError as http_e:
+            status = http_e.response.status_code if http_e.response is not None else None
+            if attempt or status not in (400, 403, 404): raise
+            log_func(f"Context cache: '{cache_name}' was rejected (HTTP {status}), re-creating it.") # Expired or deleted early
+            context_cache.forget(cache_name)
+            continue
+        if usage_metadata.get('cachedContentTokenCount'):
+            log_func(f"Context cache: {usage_metadata['cachedContentTokenCount']:,} of {usage_metadata.get('promptTokenCount', 0):,} prompt tokens served from the cache.") # noqa
+        return generated_text
+    return None
+
+
+def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file, on_stream=None):
     """
     Sends chosen review file (optimized or original) to Gemini, with token warning.
-    Saves modified text, extracts/saves CSV & XLSX.
+    Saves modified text, extracts/saves CSV & XLSX (each file replaced atomically at the end).
+    With "Stream response" ticked and `on_stream` given, the answer is streamed and
+    on_stream(display_text, csv_rows_so_far) is called from this thread as it arrives.
     Returns tuple: (success_bool, csv_data_list_or_None, modified_full_text_or_None)
     """
     # Import here to avoid circular dependency if file_handler imports this
@@ -42,11 +377,24 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
     steam_app_id = ""
     selected_model_name = ""
     query_text = ""
+    use_retrieval = False
+    use_map_reduce = False
+    bypass_cache = False
+    use_streaming = False
+    use_context_cache = False
+    retrieval_budget = DEFAULT_SETTINGS['retrieval_token_budget']
     try:
         if widgets.get('game_name_entry'): game_name = widgets['game_name_entry'].get().strip()
         if widgets.get('steam_id_entry'): steam_app_id = widgets['steam_id_entry'].get().strip()
         if widgets.get('model_combobox'): selected_model_name = widgets['model_combobox'].get()
         if widgets.get('ai_query_text'): query_text = widgets['ai_query_text'].get("1.0", "end-1c").strip()
+        if widgets.get('ai_retrieval_checkbox'): use_retrieval = widgets['ai_retrieval_checkbox'].get() == 1
+        if widgets.get('ai_map_reduce_checkbox'): use_map_reduce = widgets['ai_map_reduce_checkbox'].get() == 1
+        if widgets.get('ai_cache_bypass_checkbox'): bypass_cache = widgets['ai_cache_bypass_checkbox'].get() == 1
+        if widgets.get('ai_context_cache_checkbox'): use_context_cache = widgets['ai_context_cache_checkbox'].get() == 1
+        if widgets.get('ai_stream_checkbox'): use_streaming = widgets['ai_stream_checkbox'].get() == 1 and on_stream is not None # noqa
+        if use_retrieval and widgets.get('ai_retrieval_budget_entry'): retrieval_budget = int(widgets['ai_retrieval_budget_entry'].get().strip() or retrieval_budget) # noqa
+        if retrieval_budget < 1: raise ValueError("Retrieval budget must be >= 1")
     except Exception as e:
         log_func(f"Error getting AI inputs from widgets: {e}")
         messagebox.showerror("Input Error", "Could not read inputs for AI analysis.")
@@ -104,6 +452,7 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
     csv_saved = False
     txt_saved = False
     reviews_text = ""
+    retrieval_note = ""
 
     try: # Main try for interaction (Read file -> Optional Warn -> API -> Process)
         # --- Read Input File ---
@@ -120,20 +469,37 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
             messagebox.showerror("File Error", f"Cannot read the {file_description} file or it is empty:\n{os.path.basename(input_filename)}") # noqa
             return False, None, None
 
+        # --- Query-aware Retrieval (optional): only the best BM25 matches, up to the token budget ---
+        if use_retrieval and use_optimized_file:
+            try:
+                index = ReviewIndex.open(input_filename, log_func) # Extended in place if the file only grew
+                selected_lines, selected_tokens, matched = index.select(query_text, retrieval_budget, model_id)
+                if selected_lines:
+                    reviews_text = "\n".join(selected_lines) + "\n"
+                    retrieval_note = f"The reviews below are the {len(selected_lines):,} most relevant to the query out of {len(index.offsets):,}, not all of them.\n" # noqa
+                    log_func(f"Retrieval: {len(selected_lines):,} of {matched:,} matching reviews selected (~{selected_tokens:,} tokens, budget {retrieval_budget:,}).") # noqa
+                else:
+                    log_func("Retrieval: No review matches the query terms. Sending the whole optimized file.")
+            except (OSError, ValueError) as e:
+                log_func(f"Retrieval Error: {e}. Sending the whole optimized file.")
+        elif use_retrieval:
+            log_func("Retrieval applies to the OPTIMIZED file only. Sending the original file unfiltered.")
+
+        # Calibrated offline estimate (token_counter.py) for the selected model, of what will be sent
+        estimated_tokens = count_tokens(reviews_text, model_id)
+
         # --- Token Warning (ONLY for ORIGINAL file) ---
         if not use_optimized_file:
-            # Simple word count estimation (very rough)
-            estimated_tokens = len(reviews_text.split())
-            log_func(f"Estimated tokens for original file (word count): ~{estimated_tokens:,}")
-            # Define a threshold for warning - adjust as needed
-            token_warning_threshold = 700_000 # Example: warn if over ~700k words
+            log_func(f"Estimated tokens for original file: ~{estimated_tokens:,}")
+            # Warn above the same budget Optimize trims to
+            token_warning_threshold = DEFAULT_SETTINGS['token_threshold']
             # Note: Gemini 1.5 Pro has a large context, but requests can still timeout or be costly.
             # Gemini Flash has smaller limits. Adjust based on typical model usage.
             # The API payload itself has a size limit too (e.g., 2MB for generateContent).
 
             if estimated_tokens > token_warning_threshold:
                 warning_message = (
-                    f"The selected ORIGINAL review file is large (~{estimated_tokens:,} estimated words/tokens).\n\n"
+                    f"The selected ORIGINAL review file is large (~{estimated_tokens:,} estimated tokens).\n\n"
                     f"Sending it to the AI might:\n"
                     f"- Take a long time\n"
                     f"- Consume significant API quota/cost\n"
@@ -146,98 +512,34 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
                     return False, None, None # User cancelled
 
         # --- Prepare API Call ---
-        # Construct prompt
-        # Consider providing more structure/instructions for CSV output if needed
-        prompt_text = (
-            f"You are analyzing Steam reviews for the game '{game_name}'.\n"
-            f"Based *only* on the provided review text below, answer the following query:\n"
-            f"QUERY: {query_text}\n\n"
-            # Instruction for CSV extraction
-            f"If the query asks for structured data (like pros/cons, feature mentions, bug types), "
-            f"present that data as a standard CSV block enclosed ONLY by <CSV_START> and <CSV_END> tags. "
-            f"Include a header row in the CSV data. Do not include the tags themselves within the CSV content.\n"
-            f"Provide any textual explanation or summary *outside* of these CSV tags.\n\n"
-            f"---\nREVIEW TEXT START\n---\n{reviews_text}\n---\nREVIEW TEXT END\n---"
-        )
-
-        # Define payload
-        # Check model documentation for optimal maxOutputTokens; 8192 is large.
-        payload = {
-            "contents": [{"role": "user", "parts": [{"text": prompt_text}]}],
-            "generationConfig": {
-                "maxOutputTokens": 8192,
-                # Add temperature, topP, topK if needed
-                # "temperature": 0.7,
-            },
-            # Add safety settings if necessary (e.g., block fewer categories)
-            # "safetySettings": [
-            #     { "category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE" },
-            #     # ... other categories
-            # ]
-        }
-
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_id}:generateContent?key={api_key}"
-        headers = {"Content-Type": "application/json"}
-
-        log_func(f"Sending request to Gemini model: {model_display_name}...")
+        # Map-reduce when asked for, or when one request would exceed the single-request limit
+        use_map_reduce = use_map_reduce or estimated_tokens > AI_MAP_REDUCE['auto_above_tokens']
+
+        log_func(f"Sending request to Gemini model: {model_display_name}..." if not use_map_reduce else f"Sending map-reduce requests to Gemini model: {model_display_name}...") # noqa
+
+        # --- Response Cache: same model, prompt, input file and generationConfig -> stored answer ---
+        prompt_text = build_prompt(game_name, query_text, reviews_text, retrieval_note)
+        cache_prompts = [f"map-reduce chunk_tokens={AI_MAP_REDUCE['chunk_tokens']}", prompt_text] if use_map_reduce else prompt_text # noqa
+        input_sha256 = response_cache.file_sha256(input_filename)
+        cache_key = response_cache.cache_key(model_id, cache_prompts, input_sha256, GENERATION_CONFIG)
+        cached_entry = None if bypass_cache else response_cache.get(cache_key)
+        raw_responses = []
+        on_text = (lambda text: on_stream(*preview_streamed_response(text))) if use_streaming else None
+        # Context cache: only for a whole review file (retrieval picks different reviews per query) sent in one request
+        use_context_cache = use_context_cache and not use_map_reduce and not retrieval_note and estimated_tokens >= AI_CONTEXT_CACHE['min_tokens'] # noqa
 
         # --- Execute API Call ---
         generated_text_from_api = "Error: API call failed or no valid response received." # Default error
-        finish_reason = "UNKNOWN"
-        usage_metadata = {}
-        response_data = None
         try:
-            response = requests.post(api_url, json=payload, headers=headers, timeout=300) # 5 min timeout
-            response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-
-            log_func(f"AI request successful (HTTP Status: {response.status_code}).")
-            response_data = response.json()
-
-            # --- Safely Parse API Response ---
-            try:
-                # Check for prompt feedback first (indicates blocking)
-                prompt_feedback = response_data.get('promptFeedback')
-                if prompt_feedback:
-                    block_reason = prompt_feedback.get('blockReason')
-                    if block_reason:
-                         safety_ratings = prompt_feedback.get('safetyRatings', [])
-                         log_func(f"AI Error: Request blocked by API. Reason: {block_reason}. Safety Ratings: {safety_ratings}") # noqa
-                         generated_text_from_api = f"Error: Content blocked by API safety filters (Reason: {block_reason}). Please modify the input reviews or query." # noqa
-                         # Don't proceed with candidate parsing if blocked
-                         raise ValueError("Content blocked by API") # Use exception to jump to outer catch
-
-                # If not blocked, proceed to parse candidates
-                candidates = response_data.get('candidates')
-                if candidates and isinstance(candidates, list) and len(candidates) > 0:
-                    candidate = candidates[0] # Get the first candidate
-                    content = candidate.get('content', {})
-                    parts = content.get('parts', [])
-                    if parts and isinstance(parts, list) and len(parts) > 0:
-                        generated_text_from_api = parts[0].get('text', "Error: Text part missing in API response.") # noqa
-                    else:
-                        generated_text_from_api = "Error: No 'parts' found in API response content."
-
-                    finish_reason = candidate.get('finishReason', 'UNKNOWN')
-                    safety_ratings = candidate.get('safetyRatings', []) # Log safety ratings even if not blocked
-                    log_func(f"AI Finish Reason: {finish_reason}. Safety Ratings: {safety_ratings}")
-                    if finish_reason not in ["STOP", "MAX_TOKENS", "UNSPECIFIED", None]: # Log unusual reasons
-                          log_func(f"Warning: Unusual finish reason received: '{finish_reason}'. Response might be incomplete or malformed.") # noqa
-                    elif finish_reason == "MAX_TOKENS":
-                         log_func(f"Warning: AI response potentially truncated due to maximum output tokens limit.") # noqa
-
-                    usage_metadata = response_data.get('usageMetadata', {})
-                    log_func(f"API Usage Metadata: {usage_metadata}")
-
-                else:
-                     generated_text_from_api = "Error: No valid 'candidates' found in API response."
-
-            except ValueError as block_e:
-                 # This catches the "Content blocked" exception raised above
-                 # Error message already set in generated_text_from_api
-                 pass # Continue to processing/saving the error message
-            except Exception as parse_e:
-                log_func(f"Error parsing successful AI response structure: {parse_e}\nResponse Snippet: {str(response_data)[:500]}") # noqa
-                generated_text_from_api = f"Error: Failed to parse the structure of the AI response. {parse_e}"
+            if cached_entry is not None:
+                generated_text_from_api = cached_entry['text']
+                log_func(f"Response cache hit ({cache_key[:12]}, saved {time.strftime('%Y-%m-%d %H:%M', time.localtime(cached_entry.get('created', 0)))}). No request sent; tick 'Bypass cache' to ask again.") # noqa
+            elif use_map_reduce:
+                generated_text_from_api = map_reduce_analysis(api_key, model_id, game_name, query_text, reviews_text, retrieval_note, log_func, raw_responses, on_text) # noqa
+            else:
+                cached_text = cached_context_analysis(api_key, model_id, game_name, query_text, reviews_text, retrieval_note, log_func, raw_responses, on_text) if use_context_cache else None # noqa
+                if cached_text is not None: generated_text_from_api = cached_text
+                else: generated_text_from_api, _, _ = generate_content(api_key, model_id, prompt_text, log_func, raw_responses=raw_responses, on_text=on_text) # noqa
 
         # Handle API request exceptions
         except requests.exceptions.Timeout:
@@ -270,7 +572,7 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
 
         # Prepare text for file display (excluding CSV block if present)
         text_for_file_display = full_generated_text_api # Default to full response
-        start_tag = "<CSV_START>"; end_tag = "<CSV_END>"
+        start_tag = CSV_START_TAG; end_tag = CSV_END_TAG
         start_index = full_generated_text_api.find(start_tag)
         end_index = full_generated_text_api.find(end_tag)
 
@@ -297,8 +599,9 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
         # Save Modified Text (excluding CSV block) to TXT file
         try:
             log_func(f"Saving AI response text (excluding CSV) to: '{os.path.basename(full_response_txt_filename)}'")
-            with open(full_response_txt_filename, "w", encoding="utf-8") as txt_file:
+            with open(full_response_txt_filename + ".tmp", "w", encoding="utf-8") as txt_file:
                 txt_file.write(text_for_file_display)
+            os.replace(full_response_txt_filename + ".tmp", full_response_txt_filename) # Readers never see a half-written file # noqa
             log_func("Successfully saved AI response text file.")
             txt_saved = True
         except IOError as io_e:
@@ -320,9 +623,10 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
                 if parsed_csv_data:
                     log_func(f"Parsed {len(parsed_csv_data)} rows from CSV block.")
                     # Save the parsed data to the CSV file
-                    with open(extracted_csv_filename, "w", encoding="utf-8", newline="") as extracted_f:
+                    with open(extracted_csv_filename + ".tmp", "w", encoding="utf-8", newline="") as extracted_f:
                         writer = csv.writer(extracted_f, quoting=csv.QUOTE_MINIMAL)
                         writer.writerows(parsed_csv_data)
+                    os.replace(extracted_csv_filename + ".tmp", extracted_csv_filename)
                     log_func(f"Extracted CSV data saved to: '{os.path.basename(extracted_csv_filename)}'")
                     csv_saved = True
 
@@ -366,8 +670,18 @@ def send_to_ai(widgets, api_key_func, models, log_func, use_optimized_file):
 
         # Overall success is true if *either* the text file was saved or the CSV was saved
         overall_success = txt_saved or csv_saved
+
+        # Store fresh, non-error answers for the next identical request
+        if cached_entry is None and not full_generated_text_api.startswith("Error:"):
+            cache_entry = {'game_folder': folder_basename, 'model_id': model_id, 'query': query_text, 'input_file': os.path.basename(input_filename), # noqa
+                           'input_sha256': input_sha256, 'raw_responses': raw_responses,
+                           'text': full_generated_text_api, 'display_text': text_for_file_display, 'csv': parsed_csv_data}
+            if response_cache.put(cache_key, cache_entry): log_func(f"Response cached ({cache_key[:12]}).")
+            else: log_func("Warning: Could not write the response cache entry.")
         if overall_success:
-             log_func("AI interaction and processing completed.")
+            ai_mode = "map-reduce" if use_map_reduce else "retrieval" if retrieval_note else "context cache" if use_context_cache else "single request" # noqa
+            game_manifest.record_ai_run(game_folder_path, model_id, query_text, input_filename, len(parsed_csv_data) if parsed_csv_data else None, cached_entry is not None, ai_mode) # noqa
+            log_func("AI interaction and processing completed.")
         elif not full_generated_text_api.startswith("Error:"):
              # If no error from API, but nothing saved (e.g., file IO errors)
              log_func("AI interaction completed, but failed to save results.")
@@ -0,0 +1,158 @@
+# cleaned_corpus.py
+"""
+The optimizer's stream before the token threshold is applied: every cleaned (and near-duplicate
+collapsed) line of a game's _reviews.txt in the order optimize.py keeps them, saved as
+<game>_reviews_cleaned.txt with a prefix-sum token index next to it (PREFIX_SUFFIX).
+
+optimize.py --corpus writes both while it optimizes. Since the threshold only ever keeps the longest
+prefix of that stream that fits, the optimized file for any other threshold is a binary search over
+the cumulative token counts plus one bulk copy of the corpus's first bytes, with no cleaning or token
+counting. The index records the input's SHA-256 and the settings the stream depends on (token model,
+dedupe threshold); a corpus whose input or token model changed is not used. Counts are per line as
+optimize.py budgets them (with `model`'s correction factor); cutting for another model rescales the
+budget by the ratio of the two factors.
+
+    python cleaned_corpus.py CORPUS --threshold N [--model ID] [--output OUT]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from token_counter import get_estimator
+
+PREFIX_SUFFIX = '.prefix.idx' # Written next to the corpus
+PREFIX_MAGIC = b'RVPS'
+PREFIX_VERSION = 1
+HEADER = struct.Struct('<4sIQI') # magic, version, line count, meta JSON length; then cumulative tokens and end offsets (uint64 each) # noqa
+COPY_BLOCK_BYTES = 1024 * 1024
+
+
+def prefix_path_for(corpus_path):
+    return corpus_path + PREFIX_SUFFIX
+
+
+def _uint64_array(data):
+    values = array('Q'); values.frombytes(data)
+    if sys.byteorder == 'big': values.byteswap() # Stored little-endian
+    return values
+
+
+def _uint64_bytes(values):
+    values = array('Q', values)
+    if sys.byteorder == 'big': values.byteswap()
+    return values.tobytes()
+
+
+class CorpusWriter:
+    """
+    Writes the corpus line by line (add(cleaned, tokens)) and its prefix-sum index on close(); the
+    index is only written once the corpus is complete, so an interrupted run leaves no usable pair.
+    `meta` describes the stream: {'model', 'dedupe_threshold', 'source_sha256', ...}.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path; self.meta = dict(meta)
+        self.cumulative = array('Q'); self.ends = array('Q'); self.tokens = 0; self.offset = 0
+        if os.path.exists(prefix_path_for(path)): os.remove(prefix_path_for(path))
+        self._corpus = open(path, 'wb') # Binary: '\n' line ends on every platform, so offsets are exact
+
+    def add(self, cleaned, tokens):
+        data = cleaned.encode('utf-8') + b'\n'
+        self._corpus.write(data)
+        self.tokens += tokens; self.offset += len(data)
+        self.cumulative.append(self.tokens); self.ends.append(self.offset)
+
+    def close(self):
+        self._corpus.close()
+        estimator = get_estimator()
+        meta = dict(self.meta, fingerprint=estimator.fingerprint(), model_factor=estimator.factor(self.meta.get('model')), corpus_bytes=self.offset) # noqa
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        tmp_path = prefix_path_for(self.path) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(PREFIX_MAGIC, PREFIX_VERSION, len(self.ends), len(meta_bytes)) + meta_bytes)
+            f.write(_uint64_bytes(self.cumulative)); f.write(_uint64_bytes(self.ends))
+        os.replace(tmp_path, prefix_path_for(self.path))
+
+    def __enter__(self): return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None: self.close()
+        else: self._corpus.close() # No index for a partial corpus
+
+
+class TokenPrefixIndex:
+    """
+    Loaded prefix-sum index of a corpus: `cumulative[n]` is the tokens of lines 0..n and `ends[n]` the
+    byte offset just past line n. load() returns None for a missing, unreadable or out-of-date index.
+    """
+
+    def __init__(self, corpus_path, meta, cumulative, ends):
+        self.corpus_path = corpus_path; self.meta = meta; self.cumulative = cumulative; self.ends = ends
+
+    @classmethod
+    def load(cls, corpus_path):
+        try:
+            with open(prefix_path_for(corpus_path), 'rb') as f:
+                magic, version, count, meta_length = HEADER.unpack(f.read(HEADER.size))
+                if magic != PREFIX_MAGIC or version != PREFIX_VERSION: return None
+                meta = json.loads(f.read(meta_length).decode('utf-8'))
+                cumulative = _uint64_array(f.read(count * 8)); ends = _uint64_array(f.read(count * 8))
+            if len(ends) != count or os.path.getsize(corpus_path) != meta.get('corpus_bytes'): return None
+        except (OSError, ValueError, struct.error): return None
+        if meta.get('fingerprint') != get_estimator().fingerprint(): return None # Token model refitted since
+        return cls(corpus_path, meta, cumulative, ends)
+
+    def __len__(self): return len(self.ends)
+
+    def matches(self, source_sha256, dedupe_threshold):
+        """True if the corpus was made from this input with this near-duplicate setting."""
+        return self.meta.get('source_sha256') == source_sha256 and self.meta.get('dedupe_threshold') == dedupe_threshold
+
+    def _scale(self, model):
+        """Tokens under `model` per stored token (the stored counts use the corpus's model)."""
+        return get_estimator().factor(model) / (self.meta.get('model_factor') or 1.0)
+
+    def cut(self, threshold, model=None):
+        """(lines, tokens, bytes) of the longest prefix whose tokens under `model` fit `threshold`."""
+        scale = self._scale(model)
+        lines = bisect_right(self.cumulative, threshold / scale)
+        if not lines: return 0, 0, 0
+        return lines, round(self.cumulative[lines - 1] * scale), self.ends[lines - 1]
+
+    def write_cut(self, output_path, threshold, model=None):
+        """Writes the cut() prefix of the corpus to `output_path` (atomically). Returns (lines, tokens)."""
+        lines, tokens, size = self.cut(threshold, model)
+        tmp_path = output_path + '.tmp'
+        with open(self.corpus_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            remaining = size
+            while remaining > 0:
+                block = src.read(min(COPY_BLOCK_BYTES, remaining))
+                if not block: raise OSError(f"Corpus ended early: {self.corpus_path}")
+                dst.write(block); remaining -= len(block)
+        os.replace(tmp_path, output_path)
+        return lines, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut an optimized review file for a token threshold from a cleaned corpus.") # noqa
+    parser.add_argument('corpus', help="Corpus written by optimize.py --corpus, e.g. <game>_reviews_cleaned.txt")
+    parser.add_argument('--threshold', type=int, required=True, help="Token threshold to cut at")
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose token correction factor to apply")
+    parser.add_argument('--output', type=str, default="", help="Write the cut here (default: only report it)")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    index = TokenPrefixIndex.load(args.corpus)
+    if index is None: print(f"Error: No usable prefix index for {args.corpus} (re-run optimize.py --corpus).", file=sys.stderr); sys.exit(1) # noqa
+    if args.output: lines, tokens = index.write_cut(args.output, args.threshold, args.model)
+    else: lines, tokens, _ = index.cut(args.threshold, args.model)
+    total = round(index.cumulative[-1] * index._scale(args.model)) if len(index) else 0
+    print(f"{lines:,} of {len(index):,} lines, ~{tokens:,} of ~{total:,} tokens" + (f" -> {args.output}" if args.output else "") + f" ({(time.perf_counter() - started) * 1000:.1f} ms)") # noqa
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,20 @@
 # config.py
+import os
 import sys
 
 # --- File Configuration ---
 AITEXT_FILENAME = "AITEXT.txt"
 BASE_REVIEW_DIR = "Games_Reviews" # Main directory for all game data
+AI_CACHE_DIR = "ai_cache" # Cached AI answers (response_cache.py)
+AI_CONTEXT_CACHE_FILE = "ai_context_caches.json" # Gemini cachedContents entries created for review files (context_cache.py)
+TOKEN_CALIBRATION_FILE = "token_calibration.jsonl" # usageMetadata.promptTokenCount samples that calibrate token_counter.py
 
 # --- API Configuration ---
 API_KEY = "YOUR_VALID_GEMINI_API_KEY_PLACEHOLDER"
+# Steam store base URL (appreviews / api/appdetails); set STEAM_STORE_URL to point at mock_steam.py
+STEAM_STORE_URL = os.environ.get('STEAM_STORE_URL', "https://store.steampowered.com").rstrip('/')
+# Gemini API base URL (generateContent, cachedContents); set GEMINI_API_URL to point at a local stand-in
+GEMINI_API_URL = os.environ.get('GEMINI_API_URL', "https://generativelanguage.googleapis.com/v1beta").rstrip('/')
 
 # --- Model Definitions ---
 SUPPORTED_MODELS = [
@@ -22,6 +30,26 @@ SUPPORTED_MODELS = [
 if not SUPPORTED_MODELS:
     print("Error: config.py - SUPPORTED_MODELS list cannot be empty!", file=sys.stderr)
 
+# --- AI Requests (api_handler.py) ---
+AI_REQUEST_TIMEOUT = 300 # Seconds per generateContent request
+# Map-reduce analysis: the review text is split into chunks analyzed in parallel, then merged
+AI_MAP_REDUCE = {
+    'chunk_tokens': 150000, # Review tokens per map request (partial results are merged in groups of this size too)
+    'workers': 4, # Requests in flight at once
+    'retries': 3, # Per request, on 429/503, other 5xx, timeouts and connection errors
+    'auto_above_tokens': 1000000, # Inputs estimated above this always use map-reduce (one request would not fit)
+}
+
+# Response cache (response_cache.py): identical requests are answered from disk
+AI_CACHE_MAX_BYTES = 200 * 1024 * 1024 # Least recently used entries are evicted beyond this
+
+# Context caching (context_cache.py): the review text is uploaded once and referenced by later queries
+AI_CONTEXT_CACHE = {
+    'ttl_seconds': 3600, # Lifetime of a cachedContents entry (storage is billed per hour)
+    'min_tokens': 4096, # Smaller inputs are sent whole (Gemini rejects tiny caches, and they would not pay off)
+    'expiry_margin_seconds': 120, # An entry this close to expiring is re-created instead of reused
+}
+
 # --- Steam Filter Options ---
 # (Values should correspond to Steam API parameter values)
 STEAM_LANGUAGES = {
@@ -56,6 +84,10 @@ DEFAULT_SETTINGS = {
     'num_per_page': 100,
     # Optimization
     'token_threshold': 950000,
+    'optimize_sampling': "first", # optimize.py --sampling: 'first' (file order) or 'stratified' (keep the Rec/playtime/month mix)
+    'optimize_dedupe': False, # Collapse near-duplicate reviews into one "[xN] " line (optimize.py without --no_dedupe; cleans the whole input) # noqa
+    # AI Retrieval
+    'retrieval_token_budget': 200000, # Review tokens sent when "Relevant reviews only" (BM25, review_index.py) is ticked
     # --- NEW Steam Filter Defaults ---
     'steam_language': "all", # API value
     'steam_review_type': "all", # API value
@@ -64,8 +96,22 @@ DEFAULT_SETTINGS = {
     'steam_playtime': "0", # API value (min hours)
     'steam_filter_by': "all", # API value ('filter' parameter)
     'steam_beta': "0", # API value ('review_beta_enabled') 0=No, 1=Yes
+    'scrape_partitions': "", # reviews.py --partition value ('' = single cursor chain)
+    'scrape_incremental': False, # Append only reviews newer than the saved _reviews.txt (reviews.py --incremental)
+}
+
+# Shared Steam request-rate controller (rate_limiter.py): token bucket steered by AIMD, rates in requests/second
+STEAM_RATE_LIMIT = {
+    'rate': 1 / 1.5, # Starting rate (reviews.py seeds it from --sleep)
+    'min_rate': 0.2, 'max_rate': 5.0, # Bounds for the adaptive rate
+    'increase': 0.1, # Added per successful response
+    'decrease': 0.5, # Multiplier on 429/503, timeouts and server errors
+    'burst': 2, # Requests that may go out back-to-back after an idle spell
 }
 
+# Filters split into parallel cursor chains when "Parallel Partitions" is ticked
+PARALLEL_SCRAPE_PARTITIONS = "review_type,purchase_type"
+
 DEFAULT_MULTILINE_PROMPT = ""
 
 # --- Appearance ---
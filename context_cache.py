@@ -0,0 +1,119 @@
+# context_cache.py
+"""
+Gemini context caching for repeated queries over the same reviews: the review text is uploaded once as
+a `cachedContents` entry, and later queries send only the question plus a reference to it, instead of
+re-uploading (and paying full price for) the whole file every time.
+
+Entries are tracked locally in AI_CONTEXT_CACHE_FILE by the SHA-256 of the cached text and the model,
+with their server name, expiry time and token count. An entry is reused until shortly before it expires;
+a changed review file hashes differently, so it gets a new entry and the old one for the same game and
+model is deleted on the server. All requests go to GEMINI_API_URL, so a local stand-in can serve them.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from config import AI_CONTEXT_CACHE, AI_CONTEXT_CACHE_FILE, AI_REQUEST_TIMEOUT, GEMINI_API_URL
+
+FRACTION_PATTERN = re.compile(r'\.(\d+)') # RFC 3339 fractions may carry nanoseconds
+
+_lock = threading.Lock()
+
+
+def parse_expire_time(value):
+    """Epoch seconds of an RFC 3339 timestamp such as '2025-01-01T12:00:00.123456789Z' (None if unparsable)."""
+    if not value: return None
+    value = FRACTION_PATTERN.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), value.strip(), count=1)
+    try: return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError: return None
+
+
+def context_key(model_id, context_text):
+    return f"{model_id}:{hashlib.sha256(context_text.encode('utf-8')).hexdigest()}"
+
+
+def load_records(path=AI_CONTEXT_CACHE_FILE):
+    """{key: {'name', 'model_id', 'display_name', 'expire_time', 'tokens', 'created'}}; expired records dropped."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f: records = json.load(f)
+        if not isinstance(records, dict): return {}
+    except (OSError, ValueError): return {}
+    now = time.time()
+    return {key: record for key, record in records.items() if (record.get('expire_time') or 0) > now}
+
+
+def save_records(records, path=AI_CONTEXT_CACHE_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(records, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _api_url(path, api_key):
+    return f"{GEMINI_API_URL}/{path}?key={api_key}"
+
+
+def create(api_key, model_id, context_text, display_name, ttl_seconds=None):
+    """Creates a cachedContents entry holding `context_text` as a user turn; returns its record. Raises requests errors.""" # noqa
+    payload = {
+        "model": f"models/{model_id}",
+        "displayName": display_name[:128],
+        "contents": [{"role": "user", "parts": [{"text": context_text}]}],
+        "ttl": f"{ttl_seconds or AI_CONTEXT_CACHE['ttl_seconds']}s",
+    }
+    response = requests.post(_api_url("cachedContents", api_key), json=payload, headers={"Content-Type": "application/json"}, timeout=AI_REQUEST_TIMEOUT) # noqa
+    response.raise_for_status()
+    data = response.json()
+    expire_time = parse_expire_time(data.get('expireTime')) or time.time() + (ttl_seconds or AI_CONTEXT_CACHE['ttl_seconds']) # noqa
+    return {'name': data['name'], 'model_id': model_id, 'display_name': display_name, 'expire_time': expire_time,
+            'tokens': (data.get('usageMetadata') or {}).get('totalTokenCount'), 'created': time.time()}
+
+
+def delete(api_key, name):
+    """Deletes a server entry; best effort (it expires on its own anyway). Returns True on success."""
+    try: return requests.delete(_api_url(name, api_key), timeout=AI_REQUEST_TIMEOUT).ok
+    except requests.exceptions.RequestException: return False
+
+
+def ensure(api_key, model_id, context_text, display_name, log_func, path=AI_CONTEXT_CACHE_FILE):
+    """
+    Name of a live cachedContents entry for this text and model: the recorded one if it is still valid
+    for AI_CONTEXT_CACHE['expiry_margin_seconds'], otherwise a new one (replacing the game's older entries).
+    None if the entry cannot be created (model without caching support, text below its minimum, ...).
+    """
+    key = context_key(model_id, context_text)
+    with _lock: records = load_records(path)
+    record = records.get(key)
+    if record and record['expire_time'] - time.time() > AI_CONTEXT_CACHE['expiry_margin_seconds']:
+        log_func(f"Context cache: Reusing '{record['name']}' ({record.get('tokens') or '?'} tokens, expires {time.strftime('%H:%M', time.localtime(record['expire_time']))}).") # noqa
+        return record['name']
+    log_func(f"Context cache: Uploading the review text for {display_name} (TTL {AI_CONTEXT_CACHE['ttl_seconds']}s)...")
+    try: record = create(api_key, model_id, context_text, display_name)
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        details = getattr(getattr(e, 'response', None), 'text', '') or str(e)
+        log_func(f"Context cache: Could not create the entry ({details[:300]}). Sending the full prompt instead.")
+        return None
+    log_func(f"Context cache: Created '{record['name']}' ({record.get('tokens') or '?'} tokens).")
+    with _lock:
+        records = load_records(path)
+        for stale_key in [k for k, r in records.items() if k != key and r.get('model_id') == model_id and r.get('display_name') == display_name]: # noqa
+            delete(api_key, records.pop(stale_key)['name']) # Superseded by the new file contents
+        records[key] = record
+        try: save_records(records, path)
+        except OSError as e: log_func(f"Warning: Could not save '{path}': {e}")
+    return record['name']
+
+
+def forget(name, path=AI_CONTEXT_CACHE_FILE):
+    """Drops the local record of an entry the server no longer accepts."""
+    with _lock:
+        records = load_records(path)
+        remaining = {key: record for key, record in records.items() if record.get('name') != name}
+        if len(remaining) != len(records):
+            try: save_records(remaining, path)
+            except OSError: pass
@@ -17,6 +17,9 @@ except ImportError:
 # Assume utils.py and config.py are accessible
 # Need get_game_folder_path from process_handler
 from process_handler import get_game_folder_path
+from response_cache import file_sha256, find_latest
+from utils import get_selected_model_id
+import game_manifest
 
 
 # --- XLSX Generation ---
@@ -37,8 +40,9 @@ def generate_xlsx_from_csv(csv_filepath, xlsx_filepath, log_func):
         # Read CSV using pandas
         df = pd.read_csv(csv_filepath)
 
-        # Write to Excel using openpyxl engine
-        with pd.ExcelWriter(xlsx_filepath, engine='openpyxl') as writer:
+        # Write to Excel using openpyxl engine (to a temporary name, swapped in once complete)
+        tmp_xlsx_filepath = os.path.splitext(xlsx_filepath)[0] + ".tmp.xlsx"
+        with pd.ExcelWriter(tmp_xlsx_filepath, engine='openpyxl') as writer:
             df.to_excel(writer, index=False, sheet_name='Sheet1')
 
             # Auto-adjust column widths (within the ExcelWriter context)
@@ -67,6 +71,7 @@ def generate_xlsx_from_csv(csv_filepath, xlsx_filepath, log_func):
                          worksheet.column_dimensions[col_letter].width = 20
                     except Exception:
                          pass # Ignore if even fallback fails
+        os.replace(tmp_xlsx_filepath, xlsx_filepath)
 
         log_func(f"Successfully generated XLSX file: '{os.path.basename(xlsx_filepath)}'.")
         return True
@@ -91,13 +96,19 @@ def generate_xlsx_from_csv(csv_filepath, xlsx_filepath, log_func):
 # --- Load Existing Data ---
 # (load_existing_data stays the same)
 def load_existing_data(widgets, log_func):
-    """Loads existing processed data (CSV and AI Text) for the selected game."""
+    """
+    Loads existing processed data (CSV and AI Text) for the selected game. If the response cache holds
+    an answer to the current query with the selected model over the game's current review file, that
+    answer is loaded instead of the last saved one.
+    """
     game_name = ""
     steam_app_id = ""
+    query_text = ""
     # Safely get widget values
     try:
         if widgets.get('game_name_entry'): game_name = widgets['game_name_entry'].get().strip()
         if widgets.get('steam_id_entry'): steam_app_id = widgets['steam_id_entry'].get().strip()
+        if widgets.get('ai_query_text'): query_text = widgets['ai_query_text'].get("1.0", "end-1c").strip()
     except Exception as e:
         log_func(f"Error getting game/ID from widgets for loading: {e}")
         messagebox.showwarning("Input Error", "Could not read Game Name or Steam ID.")
@@ -116,6 +127,18 @@ def load_existing_data(widgets, log_func):
     log_func(f"Attempting to load existing processed data for {game_name}...")
     folder_basename = os.path.basename(game_folder_path)
 
+    # Cached answer for the current query/model over the current optimized or original review file
+    model_id = get_selected_model_id(widgets)
+    if query_text and model_id:
+        try:
+            review_files = [os.path.join(game_folder_path, f"{folder_basename}_reviews{suffix}.txt") for suffix in ("_optimized", "")] # noqa
+            cached_entry = find_latest(folder_basename, model_id, query_text, [file_sha256(path) for path in review_files if os.path.exists(path)]) # noqa
+        except OSError as e:
+            log_func(f"Response cache lookup failed: {e}"); cached_entry = None
+        if cached_entry is not None and (cached_entry.get('csv') or cached_entry.get('display_text')):
+            log_func(f"Loaded the cached AI answer to the current query ({cached_entry.get('input_file', 'review file')}, {model_id}).") # noqa
+            return True, cached_entry.get('csv'), cached_entry.get('display_text')
+
     # Define expected file paths
     extracted_csv_path = os.path.join(game_folder_path, f"{folder_basename}_ai_extracted_data.csv")
     # Load the text file that EXCLUDES the CSV block (created by api_handler.send_to_ai)
@@ -290,6 +313,7 @@ def strip_review_metadata(widgets, log_func):
                 # Replace the original optimized file with the temporary stripped file
                 shutil.move(temp_file_path, optimized_file_path)
                 log_func(f"Successfully overwrote '{os.path.basename(optimized_file_path)}' with stripped content.")
+                game_manifest.record_strip(game_folder_path, log_func) # Fewer tokens now
                 # Return True only after successful move/overwrite
                 return True
             except OSError as move_err:
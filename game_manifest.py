@@ -0,0 +1,216 @@
+# game_manifest.py
+"""
+Per-game manifest: MANIFEST_FILENAME in each game folder holds what the GUI shows about a game without
+opening its review files: the game's name and app ID, per review file its size, mtime, line and review
+counts and token total, the settings of the last scrape and the last AI run.
+
+Every pipeline stage refreshes the entries of the files it wrote (record_files, record_scrape,
+record_ai_run). Readers validate an entry with one stat() of its file (same size and mtime_ns) plus the
+token model's fingerprint, and only stale or missing entries are recounted, from the review store or
+the file's line index. Token totals are stored without a model's correction factor and scaled on read.
+
+    python game_manifest.py GAME_FOLDER... [--refresh] [--model ID]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from config import BASE_REVIEW_DIR
+from line_index import LINE_NEGATIVE, LINE_POSITIVE, LineIndex
+from review_store import ReviewStore, store_path_for
+from token_counter import get_estimator
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+REVIEW_FILES = {'reviews': '_reviews.txt', 'optimized': '_reviews_optimized.txt'} # Role -> suffix after the folder name
+
+_lock = threading.Lock() # One read-modify-write of a manifest at a time (GUI refresh vs. worker threads)
+
+
+def manifest_path_for(game_folder_path):
+    return os.path.join(game_folder_path, MANIFEST_FILENAME)
+
+
+def review_file_path(game_folder_path, role):
+    return os.path.join(game_folder_path, os.path.basename(game_folder_path) + REVIEW_FILES[role])
+
+
+def parse_folder_name(folder_name):
+    """(display name, app ID) of a '<sanitized name>_<app id>' folder, or None."""
+    parts = folder_name.rsplit('_', 1)
+    if len(parts) != 2 or not parts[1].isdigit(): return None
+    return parts[0].replace('_', ' '), parts[1]
+
+
+def load(game_folder_path):
+    """The folder's manifest, or an empty one if it is missing, unreadable or from another version."""
+    try:
+        with open(manifest_path_for(game_folder_path), 'r', encoding='utf-8') as f: manifest = json.load(f)
+        if isinstance(manifest, dict) and manifest.get('version') == MANIFEST_VERSION: return manifest
+    except (OSError, ValueError): pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+
+def _save(game_folder_path, manifest):
+    tmp_path = manifest_path_for(game_folder_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path_for(game_folder_path)) # Readers never see a half-written manifest
+
+
+def _update(game_folder_path, change):
+    """Applies change(manifest) and saves it; returns the manifest. Silently skipped if the folder is gone."""
+    with _lock:
+        manifest = load(game_folder_path)
+        change(manifest)
+        try: _save(game_folder_path, manifest)
+        except OSError: pass # The manifest is only a cache; the next reader recounts
+        return manifest
+
+
+def is_fresh(entry, path, fingerprint=None):
+    """True if `entry` still describes `path` (one stat(), no reads)."""
+    try: st = os.stat(path)
+    except OSError: return False
+    if fingerprint is None: fingerprint = get_estimator().fingerprint()
+    return bool(entry) and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns and entry.get('fingerprint') == fingerprint # noqa
+
+
+def file_entry(path, log_func=None):
+    """
+    Counts one review file: reviews (lines rated Positive/Negative) and tokens without model correction,
+    from its review store's aggregates when the store matches the file, else from its line index
+    (which also gives the line count).
+    """
+    st = os.stat(path)
+    entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'fingerprint': get_estimator().fingerprint(), 'counted': int(time.time())} # noqa
+    if os.path.exists(store_path_for(path)):
+        try:
+            with ReviewStore(store_path_for(path)) as store:
+                if store.matches_file(path): entry.update(reviews=store.count(), tokens=store.token_estimate())
+        except sqlite3.Error as e:
+            if log_func: log_func(f"Warn: Review store unreadable for the manifest: {e}")
+    if 'tokens' not in entry:
+        with LineIndex.open(path, log_func) as index:
+            entry.update(lines=len(index), reviews=len(index.find(LINE_POSITIVE | LINE_NEGATIVE)), tokens=index.token_total())
+    if os.stat(path).st_mtime_ns != st.st_mtime_ns: entry['mtime_ns'] = None # Changed while counting: stale on next read
+    return entry
+
+
+def record_files(game_folder_path, roles=tuple(REVIEW_FILES), log_func=None):
+    """Recounts the review files of `roles` (after a stage wrote them) and drops entries of deleted files."""
+    entries = {}
+    for role in roles:
+        path = review_file_path(game_folder_path, role)
+        if not os.path.exists(path): entries[role] = None; continue
+        try: entries[role] = file_entry(path, log_func)
+        except (OSError, ValueError) as e:
+            if log_func: log_func(f"Warn: Could not count '{os.path.basename(path)}' for the manifest: {e}")
+    def change(manifest):
+        for role, entry in entries.items():
+            if entry is None: manifest['files'].pop(role, None)
+            else: manifest['files'][role] = entry
+    return _update(game_folder_path, change)
+
+
+def record_game(game_folder_path, game_name, app_id):
+    """Stores the unsanitized game name (the folder name is lossy) for the game browser."""
+    def change(manifest): manifest.update(name=game_name, app_id=str(app_id))
+    return _update(game_folder_path, change)
+
+
+def record_scrape(game_folder_path, game_name, app_id, settings, reviews, incremental=False, complete=True, log_func=None): # noqa
+    """After a scrape: the game, its settings, how many reviews it wrote, and the recounted review files."""
+    def change(manifest):
+        manifest.update(name=game_name, app_id=str(app_id))
+        manifest['last_scrape'] = {'time': int(time.time()), 'reviews': reviews, 'incremental': incremental, 'complete': complete, 'settings': settings} # noqa
+    _update(game_folder_path, change)
+    return record_files(game_folder_path, log_func=log_func)
+
+
+def record_ai_run(game_folder_path, model_id, query, input_file, csv_rows=None, cached=False, mode=""):
+    """After an AI request: which model and query ran over which file, and what came back."""
+    def change(manifest):
+        manifest['last_ai_run'] = {'time': int(time.time()), 'model_id': model_id, 'query': query, 'input_file': os.path.basename(input_file), # noqa
+                                   'csv_rows': csv_rows, 'cached': cached, 'mode': mode}
+    return _update(game_folder_path, change)
+
+
+def record_optimize(game_folder_path, threshold, model_id, sampling, dedupe, log_func=None):
+    """
+    After Optimize: the settings the optimized file was made with (an incremental merge only splices new
+    reviews into a plain file-order cut), and its recounted entry.
+    """
+    def change(manifest):
+        manifest['last_optimize'] = {'time': int(time.time()), 'threshold': threshold, 'model_id': model_id, 'sampling': sampling, 'dedupe': dedupe, 'stripped': False} # noqa
+    _update(game_folder_path, change)
+    return record_files(game_folder_path, ('optimized',), log_func)
+
+
+def record_strip(game_folder_path, log_func=None):
+    """After metadata stripping rewrote the optimized file."""
+    def change(manifest):
+        if manifest.get('last_optimize'): manifest['last_optimize']['stripped'] = True
+    _update(game_folder_path, change)
+    return record_files(game_folder_path, ('optimized',), log_func)
+
+
+def token_estimates(game_folder_path, model=None, recount=True, log_func=None):
+    """
+    (original tokens, optimized tokens, fresh) under `model`, None for a missing file. With `recount`
+    stale entries are recounted and saved (may read the files); without, fresh is False if any entry
+    is stale and its value is None.
+    """
+    manifest = load(game_folder_path)
+    estimator = get_estimator(); fingerprint = estimator.fingerprint()
+    stale = [role for role in REVIEW_FILES if os.path.exists(review_file_path(game_folder_path, role))
+             and not is_fresh(manifest['files'].get(role), review_file_path(game_folder_path, role), fingerprint)]
+    if stale and recount: manifest = record_files(game_folder_path, stale, log_func); stale = []
+    totals = []
+    for role in REVIEW_FILES:
+        entry = manifest['files'].get(role)
+        fresh = role not in stale and entry and os.path.exists(review_file_path(game_folder_path, role))
+        totals.append(round(entry['tokens'] * estimator.factor(model)) if fresh else None)
+    return totals[0], totals[1], not stale
+
+
+def list_games(base_dir=BASE_REVIEW_DIR):
+    """
+    Saved games for the browser, sorted by name: {'name', 'id', 'folder', 'reviews'} per game folder,
+    with the name and review count from its manifest where one exists (no review file is opened).
+    """
+    games = []
+    with os.scandir(base_dir) as entries:
+        for item in entries:
+            parsed = parse_folder_name(item.name) if item.is_dir() else None
+            if not parsed: continue
+            manifest = load(item.path)
+            reviews = (manifest['files'].get('reviews') or {}).get('reviews')
+            name = manifest.get('name') if manifest.get('app_id') == parsed[1] and manifest.get('name') else parsed[0]
+            games.append({'name': name, 'id': parsed[1], 'folder': item.path, 'reviews': reviews})
+    games.sort(key=lambda game: game['name'].lower())
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show (and refresh) per-game manifests.")
+    parser.add_argument('folders', nargs='*', help=f"Game folders (default: every game in {BASE_REVIEW_DIR})")
+    parser.add_argument('--refresh', action='store_true', help="Recount stale review file entries")
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose token correction factor to apply")
+    args = parser.parse_args()
+    try: folders = args.folders or [game['folder'] for game in list_games()]
+    except OSError as e: print(f"Error: {e}", file=sys.stderr); sys.exit(1)
+    for folder in folders:
+        started = time.perf_counter()
+        orig, opt, fresh = token_estimates(folder, args.model, recount=args.refresh, log_func=lambda message: print(message, file=sys.stderr)) # noqa
+        manifest = load(folder); counts = {role: (entry or {}).get('reviews') for role, entry in manifest['files'].items()}
+        print(f"{os.path.basename(folder)}: orig ~{orig if orig is not None else 'N/A'} / opt ~{opt if opt is not None else 'N/A'} tokens, reviews {counts}" + ("" if fresh else " (stale)") + f" ({(time.perf_counter() - started) * 1000:.1f} ms)") # noqa
+        for key in ('last_scrape', 'last_ai_run'):
+            if manifest.get(key): print(f"  {key}: {time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest[key]['time']))} " + json.dumps({k: v for k, v in manifest[key].items() if k not in ('time', 'settings')})) # noqa
+
+
+if __name__ == '__main__':
+    main()
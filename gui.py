@@ -13,7 +13,8 @@ def build_gui(root, fetch_callback, scrape_callback, optimize_callback,
               ai_optimized_callback, ai_original_callback,
               load_callback, refresh_callback,
               stop_scrape_callback,
-              strip_metadata_callback): # <-- Add new callback parameter
+              strip_metadata_callback, # <-- Add new callback parameter
+              rerender_callback=None):
     """Creates and packs the GUI elements into the root window."""
 
     root.title("Steam Reviews Analyzer (Gemini CTk)")
@@ -32,7 +33,7 @@ def build_gui(root, fetch_callback, scrape_callback, optimize_callback,
     input_frame = ctk.CTkFrame(main_frame); input_frame.grid(row=0, column=0, sticky="ew", pady=(0,5)); input_frame.columnconfigure(1, weight=1); ctk.CTkLabel(input_frame, text="Game Name:", width=100, anchor="e").grid(row=0, column=0, pady=2, sticky="e"); widgets['game_name_entry'] = ctk.CTkEntry(input_frame); widgets['game_name_entry'].grid(row=0, column=1, pady=2, padx=(0,5), sticky="ew"); ctk.CTkLabel(input_frame, text="Steam ID:", width=100, anchor="e").grid(row=1, column=0, pady=2, sticky="e"); widgets['steam_id_entry'] = ctk.CTkEntry(input_frame, width=100); widgets['steam_id_entry'].grid(row=1, column=1, pady=2, padx=(0,5), sticky="ew"); widgets['fetch_name_button'] = ctk.CTkButton(input_frame, text="Fetch Name", command=fetch_callback, width=100); widgets['fetch_name_button'].grid(row=0, column=2, pady=2, padx=5, rowspan=2, sticky="ns"); # noqa
 
     # General Settings Frame (Row 1 - Unchanged)
-    settings_frame = ctk.CTkFrame(main_frame); settings_frame.grid(row=1, column=0, sticky="ew", pady=5); settings_frame.columnconfigure((1, 3, 5, 7), weight=1); ctk.CTkLabel(settings_frame, text="Max Rev:", width=60).grid(row=0, column=0, padx=(5,0), pady=2, sticky="e"); widgets['max_reviews_entry'] = ctk.CTkEntry(settings_frame, width=70); widgets['max_reviews_entry'].insert(0, str(DEFAULT_SETTINGS['max_reviews'])); widgets['max_reviews_entry'].grid(row=0, column=1, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="Tok Thr:", width=60).grid(row=0, column=2, padx=(5,0), pady=2, sticky="e"); widgets['token_threshold_entry'] = ctk.CTkEntry(settings_frame, width=80); widgets['token_threshold_entry'].insert(0, str(DEFAULT_SETTINGS['token_threshold'])); widgets['token_threshold_entry'].grid(row=0, column=3, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="Sleep:", width=50).grid(row=0, column=4, padx=(5,0), pady=2, sticky="e"); widgets['sleep_duration_entry'] = ctk.CTkEntry(settings_frame, width=50); widgets['sleep_duration_entry'].insert(0, str(DEFAULT_SETTINGS['sleep_duration'])); widgets['sleep_duration_entry'].grid(row=0, column=5, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="#/Page:", width=50).grid(row=0, column=6, padx=(5,0), pady=2, sticky="e"); widgets['num_per_page_entry'] = ctk.CTkEntry(settings_frame, width=50); widgets['num_per_page_entry'].insert(0, str(DEFAULT_SETTINGS['num_per_page'])); widgets['num_per_page_entry'].grid(row=0, column=7, padx=(0,5), pady=2, sticky="ew"); # noqa
+    settings_frame = ctk.CTkFrame(main_frame); settings_frame.grid(row=1, column=0, sticky="ew", pady=5); settings_frame.columnconfigure((1, 3, 5, 7), weight=1); ctk.CTkLabel(settings_frame, text="Max Rev:", width=60).grid(row=0, column=0, padx=(5,0), pady=2, sticky="e"); widgets['max_reviews_entry'] = ctk.CTkEntry(settings_frame, width=70); widgets['max_reviews_entry'].insert(0, str(DEFAULT_SETTINGS['max_reviews'])); widgets['max_reviews_entry'].grid(row=0, column=1, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="Tok Thr:", width=60).grid(row=0, column=2, padx=(5,0), pady=2, sticky="e"); widgets['token_threshold_entry'] = ctk.CTkEntry(settings_frame, width=80); widgets['token_threshold_entry'].insert(0, str(DEFAULT_SETTINGS['token_threshold'])); widgets['token_threshold_entry'].grid(row=0, column=3, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="Sleep:", width=50).grid(row=0, column=4, padx=(5,0), pady=2, sticky="e"); widgets['sleep_duration_entry'] = ctk.CTkEntry(settings_frame, width=50); widgets['sleep_duration_entry'].insert(0, str(DEFAULT_SETTINGS['sleep_duration'])); widgets['sleep_duration_entry'].grid(row=0, column=5, padx=(0,5), pady=2, sticky="ew"); ctk.CTkLabel(settings_frame, text="#/Page:", width=50).grid(row=0, column=6, padx=(5,0), pady=2, sticky="e"); widgets['num_per_page_entry'] = ctk.CTkEntry(settings_frame, width=50); widgets['num_per_page_entry'].insert(0, str(DEFAULT_SETTINGS['num_per_page'])); widgets['num_per_page_entry'].grid(row=0, column=7, padx=(0,5), pady=2, sticky="ew"); widgets['stratified_sampling_checkbox'] = ctk.CTkCheckBox(settings_frame, text="Stratified Sampling (keep the Rec/playtime/month mix when over the token threshold)"); widgets['stratified_sampling_checkbox'].grid(row=1, column=0, columnspan=8, padx=5, pady=(0, 5), sticky="w"); widgets['dedupe_checkbox'] = ctk.CTkCheckBox(settings_frame, text="Collapse Near-Duplicates (one \"[xN]\" line per cluster; cleans the whole file)"); widgets['dedupe_checkbox'].grid(row=2, column=0, columnspan=8, padx=5, pady=(0, 5), sticky="w"); # noqa
 
     # Action Buttons Frame (Row 2 - Modified Text)
     button_frame = ctk.CTkFrame(main_frame)
@@ -48,10 +49,12 @@ def build_gui(root, fetch_callback, scrape_callback, optimize_callback,
     # --- Modified Button Text ---
     widgets['strip_button'] = ctk.CTkButton(button_frame, text="Strip (Overwrite Opt.)", command=strip_metadata_callback, width=140) # <-- Updated Text & Width
     widgets['strip_button'].pack(side="left", padx=5, pady=5)
+    widgets['rerender_button'] = ctk.CTkButton(button_frame, text="Re-render (No Scrape)", command=rerender_callback, width=140)
+    widgets['rerender_button'].pack(side="left", padx=5, pady=5)
     # --- End Modified Button ---
 
     # Steam Filter Frame (Row 3 - Unchanged)
-    filter_frame = ctk.CTkFrame(main_frame); filter_frame.grid(row=3, column=0, sticky="nsew", pady=5); filter_frame.grid_columnconfigure((1, 3, 5), weight=1); ctk.CTkLabel(filter_frame, text="Language:").grid(row=0, column=0, padx=(5, 2), pady=3, sticky="e"); lang_options = list(STEAM_LANGUAGES.keys()); widgets['filter_language_combo'] = ctk.CTkComboBox(filter_frame, values=lang_options, state="readonly"); widgets['filter_language_combo'].set("All Languages"); widgets['filter_language_combo'].grid(row=0, column=1, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Type:").grid(row=0, column=2, padx=(10, 2), pady=3, sticky="e"); type_options = list(STEAM_REVIEW_TYPES.keys()); widgets['filter_review_type_option'] = ctk.CTkOptionMenu(filter_frame, values=type_options); widgets['filter_review_type_option'].set("All"); widgets['filter_review_type_option'].grid(row=0, column=3, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Purchase:").grid(row=0, column=4, padx=(10, 2), pady=3, sticky="e"); purchase_options = list(STEAM_PURCHASE_TYPES.keys()); widgets['filter_purchase_type_option'] = ctk.CTkOptionMenu(filter_frame, values=purchase_options); widgets['filter_purchase_type_option'].set("All"); widgets['filter_purchase_type_option'].grid(row=0, column=5, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Date Range:").grid(row=1, column=0, padx=(5, 2), pady=3, sticky="e"); date_options = list(STEAM_DATE_RANGES.keys()); widgets['filter_date_range_option'] = ctk.CTkOptionMenu(filter_frame, values=date_options); widgets['filter_date_range_option'].set("All Time"); widgets['filter_date_range_option'].grid(row=1, column=1, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Min Playtime:").grid(row=1, column=2, padx=(10, 2), pady=3, sticky="e"); playtime_options = list(STEAM_PLAYTIME_FILTERS.keys()); widgets['filter_playtime_option'] = ctk.CTkOptionMenu(filter_frame, values=playtime_options); widgets['filter_playtime_option'].set("Any"); widgets['filter_playtime_option'].grid(row=1, column=3, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Filter By:").grid(row=1, column=4, padx=(10, 2), pady=3, sticky="e"); filterby_options = list(STEAM_FILTER_BY.keys()); widgets['filter_filter_by_option'] = ctk.CTkOptionMenu(filter_frame, values=filterby_options); widgets['filter_filter_by_option'].set("Most Helpful (Default)"); widgets['filter_filter_by_option'].grid(row=1, column=5, padx=(0, 5), pady=3, sticky="ew"); widgets['filter_beta_checkbox'] = ctk.CTkCheckBox(filter_frame, text="Include Beta/Early Access"); widgets['filter_beta_checkbox'].grid(row=2, column=0, columnspan=6, padx=5, pady=(5, 5), sticky="w"); # noqa
+    filter_frame = ctk.CTkFrame(main_frame); filter_frame.grid(row=3, column=0, sticky="nsew", pady=5); filter_frame.grid_columnconfigure((1, 3, 5), weight=1); ctk.CTkLabel(filter_frame, text="Language:").grid(row=0, column=0, padx=(5, 2), pady=3, sticky="e"); lang_options = list(STEAM_LANGUAGES.keys()); widgets['filter_language_combo'] = ctk.CTkComboBox(filter_frame, values=lang_options, state="readonly"); widgets['filter_language_combo'].set("All Languages"); widgets['filter_language_combo'].grid(row=0, column=1, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Type:").grid(row=0, column=2, padx=(10, 2), pady=3, sticky="e"); type_options = list(STEAM_REVIEW_TYPES.keys()); widgets['filter_review_type_option'] = ctk.CTkOptionMenu(filter_frame, values=type_options); widgets['filter_review_type_option'].set("All"); widgets['filter_review_type_option'].grid(row=0, column=3, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Purchase:").grid(row=0, column=4, padx=(10, 2), pady=3, sticky="e"); purchase_options = list(STEAM_PURCHASE_TYPES.keys()); widgets['filter_purchase_type_option'] = ctk.CTkOptionMenu(filter_frame, values=purchase_options); widgets['filter_purchase_type_option'].set("All"); widgets['filter_purchase_type_option'].grid(row=0, column=5, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Date Range:").grid(row=1, column=0, padx=(5, 2), pady=3, sticky="e"); date_options = list(STEAM_DATE_RANGES.keys()); widgets['filter_date_range_option'] = ctk.CTkOptionMenu(filter_frame, values=date_options); widgets['filter_date_range_option'].set("All Time"); widgets['filter_date_range_option'].grid(row=1, column=1, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Min Playtime:").grid(row=1, column=2, padx=(10, 2), pady=3, sticky="e"); playtime_options = list(STEAM_PLAYTIME_FILTERS.keys()); widgets['filter_playtime_option'] = ctk.CTkOptionMenu(filter_frame, values=playtime_options); widgets['filter_playtime_option'].set("Any"); widgets['filter_playtime_option'].grid(row=1, column=3, padx=(0, 5), pady=3, sticky="ew"); ctk.CTkLabel(filter_frame, text="Filter By:").grid(row=1, column=4, padx=(10, 2), pady=3, sticky="e"); filterby_options = list(STEAM_FILTER_BY.keys()); widgets['filter_filter_by_option'] = ctk.CTkOptionMenu(filter_frame, values=filterby_options); widgets['filter_filter_by_option'].set("Most Helpful (Default)"); widgets['filter_filter_by_option'].grid(row=1, column=5, padx=(0, 5), pady=3, sticky="ew"); widgets['filter_beta_checkbox'] = ctk.CTkCheckBox(filter_frame, text="Include Beta/Early Access"); widgets['filter_beta_checkbox'].grid(row=2, column=0, columnspan=3, padx=5, pady=(5, 5), sticky="w"); widgets['filter_partition_checkbox'] = ctk.CTkCheckBox(filter_frame, text="Parallel Partitions (Type x Purchase)"); widgets['filter_partition_checkbox'].grid(row=2, column=3, columnspan=3, padx=5, pady=(5, 5), sticky="w"); widgets['filter_incremental_checkbox'] = ctk.CTkCheckBox(filter_frame, text="Incremental Update (only reviews newer than the saved file)"); widgets['filter_incremental_checkbox'].grid(row=3, column=0, columnspan=6, padx=5, pady=(0, 5), sticky="w"); # noqa
 
     # Log Display Frame (Row 4 - Shifted)
     # (Unchanged)
@@ -67,13 +70,13 @@ def build_gui(root, fetch_callback, scrape_callback, optimize_callback,
 
     # AI Analysis Frame (Row 7 - Shifted)
     # (Unchanged)
-    ai_outer_frame = ctk.CTkFrame(main_frame); ai_outer_frame.grid(row=7, column=0, sticky="nsew", pady=5); ai_outer_frame.grid_columnconfigure(0, weight=1); ai_outer_frame.grid_rowconfigure(3, weight=1); ctk.CTkLabel(ai_outer_frame, text="AI Analysis", font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, columnspan=2, sticky="w", padx=5, pady=(2,0)); model_select_frame = ctk.CTkFrame(ai_outer_frame, fg_color="transparent"); model_select_frame.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(5, 5), padx=5); ctk.CTkLabel(model_select_frame, text="Select Model:", anchor="w").pack(side="left", padx=(0,5)); model_names = [m["name"] for m in SUPPORTED_MODELS] if SUPPORTED_MODELS else ["No Models"]; widgets['model_combobox'] = ctk.CTkComboBox(model_select_frame, values=model_names, state="readonly"); widgets['model_combobox'].pack(side="left", padx=5, fill="x", expand=True); # noqa
+    ai_outer_frame = ctk.CTkFrame(main_frame); ai_outer_frame.grid(row=7, column=0, sticky="nsew", pady=5); ai_outer_frame.grid_columnconfigure(0, weight=1); ai_outer_frame.grid_rowconfigure(3, weight=1); ctk.CTkLabel(ai_outer_frame, text="AI Analysis", font=ctk.CTkFont(weight="bold")).grid(row=0, column=0, columnspan=2, sticky="w", padx=5, pady=(2,0)); model_select_frame = ctk.CTkFrame(ai_outer_frame, fg_color="transparent"); model_select_frame.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(5, 5), padx=5); ctk.CTkLabel(model_select_frame, text="Select Model:", anchor="w").pack(side="left", padx=(0,5)); model_names = [m["name"] for m in SUPPORTED_MODELS] if SUPPORTED_MODELS else ["No Models"]; widgets['model_combobox'] = ctk.CTkComboBox(model_select_frame, values=model_names, state="readonly"); widgets['model_combobox'].pack(side="left", padx=5, fill="x", expand=True); widgets['ai_retrieval_checkbox'] = ctk.CTkCheckBox(model_select_frame, text="Relevant reviews only, budget:"); widgets['ai_retrieval_checkbox'].pack(side="left", padx=(10, 2)); widgets['ai_retrieval_budget_entry'] = ctk.CTkEntry(model_select_frame, width=80); widgets['ai_retrieval_budget_entry'].insert(0, str(DEFAULT_SETTINGS['retrieval_token_budget'])); widgets['ai_retrieval_budget_entry'].pack(side="left", padx=(0, 5)); # noqa
     if SUPPORTED_MODELS:
         widgets['model_combobox'].set(SUPPORTED_MODELS[0]['name'])
     else:
         widgets['model_combobox'].set(model_names[0])
     # widgets['model_combobox'].configure(state="disabled") # Enable model selection later?
-    ctk.CTkLabel(ai_outer_frame, text="Query for AI:").grid(row=2, column=0, columnspan=2, sticky="sw", padx=5, pady=(5,0)); widgets['ai_query_text'] = ctk.CTkTextbox(ai_outer_frame, wrap="word", height=100); widgets['ai_query_text'].grid(row=3, column=0, columnspan=2, sticky="nsew", padx=5, pady=(0, 5)); ai_buttons_frame = ctk.CTkFrame(ai_outer_frame, fg_color="transparent"); ai_buttons_frame.grid(row=4, column=0, columnspan=2, pady=(5,10)); widgets['ai_send_optimized_button'] = ctk.CTkButton(ai_buttons_frame, text="3a. Send OPTIMIZED", command=ai_optimized_callback, width=180); widgets['ai_send_optimized_button'].pack(side="left", padx=10); widgets['ai_send_original_button'] = ctk.CTkButton(ai_buttons_frame, text="3b. Send ORIGINAL", command=ai_original_callback, width=180); widgets['ai_send_original_button'].pack(side="left", padx=10); # noqa
+    ctk.CTkLabel(ai_outer_frame, text="Query for AI:").grid(row=2, column=0, columnspan=2, sticky="sw", padx=5, pady=(5,0)); widgets['ai_query_text'] = ctk.CTkTextbox(ai_outer_frame, wrap="word", height=100); widgets['ai_query_text'].grid(row=3, column=0, columnspan=2, sticky="nsew", padx=5, pady=(0, 5)); ai_buttons_frame = ctk.CTkFrame(ai_outer_frame, fg_color="transparent"); ai_buttons_frame.grid(row=4, column=0, columnspan=2, pady=(5,10)); widgets['ai_send_optimized_button'] = ctk.CTkButton(ai_buttons_frame, text="3a. Send OPTIMIZED", command=ai_optimized_callback, width=180); widgets['ai_send_optimized_button'].pack(side="left", padx=10); widgets['ai_send_original_button'] = ctk.CTkButton(ai_buttons_frame, text="3b. Send ORIGINAL", command=ai_original_callback, width=180); widgets['ai_send_original_button'].pack(side="left", padx=10); widgets['ai_map_reduce_checkbox'] = ctk.CTkCheckBox(ai_buttons_frame, text="Map-reduce (parallel chunks)"); widgets['ai_map_reduce_checkbox'].pack(side="left", padx=10); widgets['ai_cache_bypass_checkbox'] = ctk.CTkCheckBox(ai_buttons_frame, text="Bypass cache"); widgets['ai_cache_bypass_checkbox'].pack(side="left", padx=10); widgets['ai_stream_checkbox'] = ctk.CTkCheckBox(ai_buttons_frame, text="Stream response"); widgets['ai_stream_checkbox'].select(); widgets['ai_stream_checkbox'].pack(side="left", padx=10); widgets['ai_context_cache_checkbox'] = ctk.CTkCheckBox(ai_buttons_frame, text="Context cache"); widgets['ai_context_cache_checkbox'].pack(side="left", padx=10); # noqa
 
     # --- Right Panel (Tabs) ---
     # (Unchanged)
@@ -111,6 +114,7 @@ def build_gui(root, fetch_callback, scrape_callback, optimize_callback,
     tree_vsb = ctk.CTkScrollbar(tree_frame, orientation="vertical", command=widgets['spreadsheet'].yview)
     tree_hsb = ctk.CTkScrollbar(tree_frame, orientation="horizontal", command=widgets['spreadsheet'].xview)
     widgets['spreadsheet'].configure(yscrollcommand=tree_vsb.set, xscrollcommand=tree_hsb.set)
+    widgets['spreadsheet_vsb'] = tree_vsb # Rewired by virtual_table.VirtualTable to scroll over all rows
     widgets['spreadsheet'].grid(row=0, column=0, sticky='nsew')
     tree_vsb.grid(row=0, column=1, sticky='ns')
     tree_hsb.grid(row=1, column=0, sticky='ew')
@@ -2,11 +2,16 @@
 import customtkinter as ctk
 from tkinter import ttk, TclError, messagebox
 import os
+import threading
 import traceback
 
 # Assume config.py and utils.py are accessible
 import config
+import game_manifest
 import utils  # For calculate_and_format_token_estimates
+from virtual_table import TableData, VirtualTable
+
+STREAM_REFRESH_MS = 100 # Streamed AI answers repaint the text/spreadsheet at most this often
 
 class GuiManager:
     """Manages updates and interactions with the GUI elements."""
@@ -16,10 +21,18 @@ class GuiManager:
         self.widgets = widgets
         self.log_func = log_func
         self.full_csv_data = None  # Store data for filtering
+        self._table = None  # VirtualTable over the spreadsheet Treeview (see _get_table)
         # --- Define tag names ---
         self.tag_odd = "oddrow"
         self.tag_even = "evenrow"
         # REMOVED: self.tag_summary = "summaryrow"
+        # Streaming AI answers (stream_ai_response): latest state waiting for the Tk thread, rows shown so far
+        self._stream_lock = threading.Lock()
+        self._stream_pending = None
+        self._stream_rows_shown = 0
+        # Token recounts running on worker threads (update_token_display), keyed by (name, steam_id, model_id)
+        self._token_lock = threading.Lock()
+        self._token_jobs = set()
 
         self._configure_treeview_tags()  # Configure only odd/even
 
@@ -52,8 +65,16 @@ class GuiManager:
             except Exception:
                 self.log_func("Error: Failed fallback tag configure.")
 
+    def _get_table(self):
+        """The VirtualTable that materializes only the visible spreadsheet rows (created on first use)."""
+        treeview_widget = self.widgets.get('spreadsheet')
+        if self._table is None or self._table.tree is not treeview_widget:
+            treeview_widget.delete(*treeview_widget.get_children())  # gui.py's "Load data..." row
+            self._table = VirtualTable(treeview_widget, self.widgets.get('spreadsheet_vsb'), (self.tag_even, self.tag_odd))
+        return self._table
+
     def update_spreadsheet(self, data):
-        """Clears/populates the Treeview, applies tags, adjusts column width."""
+        """Loads `data` (header row + rows) into the virtual table, applies tags, adjusts column width."""
         treeview_widget = self.widgets.get('spreadsheet')
         widget_exists = treeview_widget and hasattr(treeview_widget, 'winfo_exists') and treeview_widget.winfo_exists()
         if not widget_exists:
@@ -61,6 +82,7 @@ class GuiManager:
             return
 
         self.full_csv_data = data
+        self._stream_rows_shown = 0
         is_placeholder = not data or not any(data)
         if is_placeholder:
             display_data = [['Status'], ['No data available or extracted.']]
@@ -70,12 +92,9 @@ class GuiManager:
             self.update_filter_options(data)
 
         try:
-            # --- Clear Treeview ---
-            for item_id in treeview_widget.get_children():
-                try:
-                    treeview_widget.delete(item_id)
-                except Exception:
-                    pass
+            # --- Clear Treeview (only the materialized window holds items) ---
+            table = self._get_table()
+            table.clear()
             treeview_widget["columns"] = ()
 
             # --- Setup Columns ---
@@ -113,25 +132,17 @@ class GuiManager:
                     except Exception:
                         pass
 
-            # --- Insert data rows with tags ---
-            for i, row_data in enumerate(display_data[1:]):
-                try:
-                    base_tag = self.tag_even if i % 2 == 0 else self.tag_odd
-                    # Ensure row data length matches header length
-                    values = (row_data + [''] * len(header))[:len(header)]
-                    treeview_widget.insert("", "end", values=values, tags=(base_tag,))
-                except Exception as e_row:
-                    self.log_func(f"Error inserting spreadsheet row {i}: {e_row}")
+            # --- Columnar copy of the rows; only the visible window (plus overscan) becomes Treeview items ---
+            table.set_data(TableData(header, display_data[1:]))
 
         except Exception as e:
             self.log_func(f"Critical Error updating spreadsheet: {e}\n{traceback.format_exc()}")
             try:  # Attempt error display
-                for item_id in treeview_widget.get_children():
-                    treeview_widget.delete(item_id)
+                self._get_table().clear()
                 treeview_widget["columns"] = ('Error',)
                 treeview_widget.heading('Error', text='Error', anchor='w')
                 treeview_widget.column('Error', anchor='w', width=300)
-                treeview_widget.insert("", "end", values=[f"Failed display: {e}"], tags=(self.tag_odd,))
+                self._get_table().set_data(TableData(['Error'], [[f"Failed display: {e}"]]))
             except Exception:
                 pass
 
@@ -158,6 +169,7 @@ class GuiManager:
             self.log_func(f"Err update filter menu: {e}")
 
     def on_filter_change(self, selected_category):
+        """Shows the rows whose first column is `selected_category` by swapping the virtual table's row index."""
         self.log_func(f"Filtering spreadsheet by: {selected_category}")
         spreadsheet = self.widgets.get('spreadsheet')
         if not spreadsheet or not spreadsheet.winfo_exists():
@@ -167,76 +179,17 @@ class GuiManager:
             self.log_func("No data to filter.")
             self.update_spreadsheet(None)
             return
-        filtered = []
+        table = self._get_table()
         try:
-            header = self.full_csv_data[0]
-            filtered.append(header)
             if selected_category == "Show All":
-                filtered.extend(self.full_csv_data[1:])
+                table.set_filter()
             else:
-                for row in self.full_csv_data[1:]:
-                    if row and len(row) > 0 and str(row[0]) == selected_category:
-                        filtered.append(row)
-            self._display_filtered_data(filtered)
+                table.set_filter(0, selected_category)
+                if not len(table): self.log_func("Filter returned no results.")
         except Exception as e:
             self.log_func(f"Error filtering: {e}")
-            self._display_filtered_data(self.full_csv_data)
-
-    def _display_filtered_data(self, filtered_data):
-        """Internal: Updates Treeview display for filtering, applies tags, adjusts col width"""
-        treeview_widget = self.widgets.get('spreadsheet')
-        if not treeview_widget or not treeview_widget.winfo_exists():
-            return
-
-        if not filtered_data or len(filtered_data) <= 1:
-            display_data = [['Status'], ['Filter returned no results.']]
-        else:
-            display_data = filtered_data
-
-        try:
-            for item_id in treeview_widget.get_children():
-                treeview_widget.delete(item_id)
-            treeview_widget["columns"] = ()
-            header = display_data[0]
-            treeview_widget["columns"] = tuple(header)
-            treeview_widget['show'] = 'headings'
-            self._configure_treeview_tags()  # Ensure base tags configured
-
-            # Configure headings/columns based solely on longest text size
-            for col_num, col_name in enumerate(header):
-                col_id = header[col_num]  # Use header name as ID
-                try:
-                    col_width_chars = len(str(col_name))
-                    # Check only a few rows for filter redraw width
-                    for i in range(1, min(6, len(display_data))):
-                        try:
-                            if len(display_data[i]) > col_num:
-                                col_width_chars = max(col_width_chars, len(str(display_data[i][col_num])))
-                        except Exception:
-                            pass
-                    col_pixel = col_width_chars * 9
-
-                    treeview_widget.heading(col_id, text=col_name, anchor='w')
-                    treeview_widget.column(col_id, anchor='w', width=int(col_pixel), stretch=False)
-                except Exception as e:
-                    try:
-                        fid = f"#{col_num+1}"
-                        treeview_widget.heading(fid, text=f"C{col_num+1}", anchor='w')
-                        treeview_widget.column(fid, anchor='w', width=100, stretch=False)
-                    except Exception:
-                        pass
-
-            # Insert filtered rows with base tags
-            for i, row_data in enumerate(display_data[1:]):
-                try:
-                    base_tag = self.tag_even if i % 2 == 0 else self.tag_odd
-                    values = (row_data + [''] * len(header))[:len(header)]
-                    treeview_widget.insert("", "end", values=values, tags=(base_tag,))
-                except Exception as e_row:
-                    self.log_func(f"Error inserting filtered row {i}: {e_row}")
-
-        except Exception as e:
-            self.log_func(f"Error displaying filtered data: {e}")
+            try: table.set_filter()
+            except Exception: pass
 
     def update_ai_response_text(self, text_content):
         textbox = self.widgets.get('ai_response_textbox')
@@ -259,7 +212,49 @@ class GuiManager:
             except Exception as inner_e:
                 self.log_func(f"Error handling exception in AI text update: {inner_e}")
 
+    def stream_ai_response(self, text_content, csv_rows):
+        """
+        Shows a partial AI answer while it streams in. Safe to call from the worker thread: the latest
+        (text, CSV rows) is handed to the Tk thread, which repaints at most every STREAM_REFRESH_MS.
+        """
+        with self._stream_lock:
+            scheduled = self._stream_pending is not None
+            self._stream_pending = (text_content, csv_rows)
+        if not scheduled:
+            try: self.root.after(STREAM_REFRESH_MS, self._flush_stream)
+            except Exception as e: self.log_func(f"Error scheduling streamed AI update: {e}")
+
+    def end_stream(self):
+        """Drops a streamed update that has not been painted yet (the final result replaces it)."""
+        with self._stream_lock: self._stream_pending = None
+
+    def _flush_stream(self):
+        with self._stream_lock: pending, self._stream_pending = self._stream_pending, None
+        if pending is None: return
+        text_content, csv_rows = pending
+        self.update_ai_response_text(text_content)
+        if csv_rows: self._append_stream_rows(csv_rows)
+
+    def _append_stream_rows(self, rows):
+        """Grows the spreadsheet to `rows`, adding only the rows not shown yet (full redraw on a new header)."""
+        treeview_widget = self.widgets.get('spreadsheet')
+        if not treeview_widget or not treeview_widget.winfo_exists(): return
+        shown = self._stream_rows_shown
+        if not shown or not self.full_csv_data or self.full_csv_data[0] != rows[0] or len(rows) < shown:
+            self.update_spreadsheet(rows); self._stream_rows_shown = len(rows)
+            return
+        try:
+            self._get_table().append_rows(rows[shown:]) # Repaints only if the new rows are in view
+        except Exception as e:
+            self.log_func(f"Error appending streamed spreadsheet rows: {e}")
+        self.full_csv_data = rows; self._stream_rows_shown = len(rows)
+
     def update_token_display(self):
+        """
+        Shows the token estimates from the game's manifest right away. If a review file changed since it
+        was counted, the label says so and the recount runs on a worker thread (a 40 MB file never blocks
+        the Tk loop); its result is shown only if the same game and model are still selected.
+        """
         token_label = self.widgets.get('token_estimate_label')
         entry_name = self.widgets.get('game_name_entry')
         entry_id = self.widgets.get('steam_id_entry')
@@ -274,8 +269,12 @@ class GuiManager:
         except Exception as e:
             self.log_func(f"Error get name/id token: {e}")
         if name and steam_id and steam_id.isdigit():
+            model_id = utils.get_selected_model_id(self.widgets)
             try:
-                display, _, _ = utils.calculate_and_format_token_estimates(name, steam_id, self.log_func)
+                display, _, _ = utils.calculate_and_format_token_estimates(name, steam_id, self.log_func, model_id, recount=False)
+                if display is None: # Stale manifest entry: recount off the Tk thread
+                    display = "Token Estimates: Counting..."
+                    self._start_token_count((name, steam_id, model_id))
             except Exception as calc_e:
                 self.log_func(f"Error calc token: {calc_e}")
                 display = "Token Estimates: Error"
@@ -283,6 +282,9 @@ class GuiManager:
             display = "Token Estimates: N/A"
         else:
             display = "Token Estimates: (Enter Valid Game/ID)"
+        self._set_token_label(token_label, display)
+
+    def _set_token_label(self, token_label, display):
         if token_label and token_label.winfo_exists():
             try:
                 token_label.configure(text=display)
@@ -291,6 +293,25 @@ class GuiManager:
         else:
             self.log_func("Token label not found.")
 
+    def _start_token_count(self, key):
+        """Recounts (name, steam_id, model_id) on a worker thread unless that count is already running."""
+        with self._token_lock:
+            if key in self._token_jobs: return
+            self._token_jobs.add(key)
+        def count():
+            try: display, _, _ = utils.calculate_and_format_token_estimates(key[0], key[1], self.log_func, key[2])
+            except Exception as calc_e: self.log_func(f"Error calc token: {calc_e}"); display = "Token Estimates: Error"
+            finally:
+                with self._token_lock: self._token_jobs.discard(key)
+            try: self.root.after(0, self._apply_token_count, key, display)
+            except Exception: pass # Window closed while counting
+        threading.Thread(target=count, name="token-count", daemon=True).start()
+
+    def _apply_token_count(self, key, display):
+        try: current = (self.widgets['game_name_entry'].get().strip(), self.widgets['steam_id_entry'].get().strip(), utils.get_selected_model_id(self.widgets)) # noqa
+        except Exception: return
+        if current == key: self._set_token_label(self.widgets.get('token_estimate_label'), display) # Else a newer selection owns the label # noqa
+
     def populate_game_browser(self):
         browser_frame = self.widgets.get('game_browser_frame')
         if not browser_frame or not browser_frame.winfo_exists():
@@ -306,22 +327,13 @@ class GuiManager:
         folders = []
         if os.path.isdir(base_dir):
             try:
-                for item in os.listdir(base_dir):
-                    p = os.path.join(base_dir, item)
-                    if os.path.isdir(p):
-                        try:
-                            parts = item.rsplit('_', 1)
-                            if len(parts) == 2 and parts[1].isdigit():
-                                folders.append({"name": parts[0].replace('_', ' '), "id": parts[1]})
-                        except Exception as e:
-                            self.log_func(f"Err parse folder '{item}': {e}")
+                folders = game_manifest.list_games(base_dir) # Names and review counts from the manifests, no review file is read # noqa
             except OSError as e:
                 self.log_func(f"Err read dir '{base_dir}': {e}")
                 messagebox.showerror("Error", f"Read dir fail:\n{e}")
                 return
         else:
             self.log_func(f"Base dir '{base_dir}' not found.")
-        folders.sort(key=lambda x: x['name'])
         if not folders:
             try:
                 ctk.CTkLabel(browser_frame, text="(No saved games)", text_color="gray").pack(pady=5)
@@ -332,7 +344,8 @@ class GuiManager:
             for info in folders:
                 try:
                     cmd = partial(self.select_game_from_browser, info['name'], info['id'])
-                    btn = ctk.CTkButton(browser_frame, text=info['name'], command=cmd, anchor="w", height=25)
+                    text = info['name'] + (f"  ({info['reviews']:,})" if info['reviews'] is not None else "")
+                    btn = ctk.CTkButton(browser_frame, text=text, command=cmd, anchor="w", height=25)
                     btn.pack(fill="x", padx=2, pady=(1, 2))
                 except Exception as e:
                     self.log_func(f"Err button {info['name']}: {e}")
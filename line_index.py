@@ -0,0 +1,265 @@
+# line_index.py
+"""
+Line-offset index of a review text file (_reviews.txt or _reviews_optimized.txt), kept next to it
+(<file> + LINE_INDEX_SUFFIX), so reading line N or a range of lines is a seek instead of a scan from
+the top, and per-line token estimates are available without re-reading the text.
+
+The sidecar is a HEADER followed by one fixed-size RECORD per complete line: the byte offset just past
+the line's newline (line n spans end[n-1]..end[n]), its token estimate (token_counter, without model
+correction) and LINE_* flag bits. Records are only ever appended: the scraper extends the index after
+every page it writes and the optimizer after every batch, and a file that was appended to by other
+code (incremental merge) is extended on its next open. The header records the indexed size, the file's
+mtime at that point and the CRC32 of the last TAIL_CHECK_BYTES indexed bytes, so a matching stat() is
+trusted as is, a grown file is extended if its tail still matches, and anything else (including a
+refitted token model) is rebuilt.
+
+    python line_index.py FILE [--lines 100:120] [--stats]
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from itertools import accumulate
+
+from optimize import REVIEW_STRATUM_PATTERN
+from token_counter import get_estimator
+
+LINE_INDEX_SUFFIX = '.lines.idx' # Written next to the indexed file
+INDEX_MAGIC = b'RVLI'
+INDEX_VERSION = 1
+HEADER = struct.Struct('<4sIQqII') # magic, version, indexed bytes, file mtime_ns, tail CRC32, token model fingerprint
+RECORD = struct.Struct('<QII') # end offset, tokens, flags
+TAIL_CHECK_BYTES = 4096
+SCAN_BLOCK_BYTES = 4 * 1024 * 1024 # Text read (and token-counted) together while indexing
+
+LINE_BLANK = 1
+LINE_HEADER = 2 # The scraper's '=====' block (Game:, AppID:, ...)
+LINE_POSITIVE = 4
+LINE_NEGATIVE = 8
+LINE_ANNOTATED = 16 # The optimizer's "[xN]" near-duplicate representative
+
+# The scraper's header block, as written (with colons) or cleaned (optimize.FILE_HEADER_PATTERN)
+HEADER_LINE_PATTERN = re.compile(r'^(?:=====|(?:Game|AppID|Release Date|Review Score|Scrape Target|Scrape Time):? )')
+
+
+def line_index_path_for(path):
+    return path + LINE_INDEX_SUFFIX
+
+
+def line_flags(line):
+    """LINE_* bits of one line (without its newline)."""
+    if not line.strip(): return LINE_BLANK
+    if HEADER_LINE_PATTERN.match(line): return LINE_HEADER
+    match = REVIEW_STRATUM_PATTERN.match(line)
+    if not match: return 0
+    return (LINE_POSITIVE if match.group(3) == 'Positive' else LINE_NEGATIVE) | (LINE_ANNOTATED if line.startswith('[x') else 0) # noqa
+
+
+def _tail_crc(text_file, end):
+    start = max(0, end - TAIL_CHECK_BYTES)
+    text_file.seek(start)
+    return zlib.crc32(text_file.read(end - start))
+
+
+class LineIndexWriter:
+    """
+    Append side of one file's index. Opening validates the existing sidecar (see the module docstring)
+    and `status` tells whether it was 'loaded', 'updated' (extended later) or 'built' from scratch.
+    extend(end) indexes the complete lines between the indexed size and `end` (default: EOF).
+    With `truncate_to` the caller vouches that the file was just cut back to that size (a resumed
+    scrape), so the records past it are dropped instead of rebuilding the index.
+    """
+
+    def __init__(self, path, truncate_to=None):
+        self.path = path; self.index_path = line_index_path_for(path)
+        self.fingerprint = get_estimator().fingerprint()
+        self.indexed_bytes = 0; self.count = 0; self.status = 'built'
+        self._index = open(self.index_path, 'r+b' if os.path.exists(self.index_path) else 'w+b')
+        try:
+            if not self._load(truncate_to): self._reset()
+        except Exception:
+            self._index.close(); raise
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def close(self):
+        self._index.close()
+
+    def _end(self, n):
+        self._index.seek(HEADER.size + n * RECORD.size)
+        return RECORD.unpack(self._index.read(RECORD.size))[0]
+
+    def _load(self, truncate_to):
+        """Adopts the sidecar if it still describes a prefix of the file; False to rebuild."""
+        data = self._index.read(HEADER.size)
+        if len(data) < HEADER.size: return False
+        magic, version, indexed_bytes, mtime_ns, tail_crc, fingerprint = HEADER.unpack(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or fingerprint != self.fingerprint: return False
+        count = (os.fstat(self._index.fileno()).st_size - HEADER.size) // RECORD.size
+        if (self._end(count - 1) if count else 0) != indexed_bytes: return False # Torn append
+        st = os.stat(self.path)
+        if truncate_to is not None and truncate_to < indexed_bytes:
+            low, high = 0, count # Keep the records that end within truncate_to
+            while low < high:
+                mid = (low + high) // 2
+                if self._end(mid) <= truncate_to: low = mid + 1
+                else: high = mid
+            self.count = low; self.indexed_bytes = self._end(low - 1) if low else 0
+            self._index.truncate(HEADER.size + self.count * RECORD.size); self._write_header(); self.status = 'updated'
+            return True
+        if st.st_size < indexed_bytes: return False
+        if st.st_size != indexed_bytes or st.st_mtime_ns != mtime_ns:
+            with open(self.path, 'rb') as text_file:
+                if _tail_crc(text_file, indexed_bytes) != tail_crc: return False
+        self.count = count; self.indexed_bytes = indexed_bytes; self.status = 'loaded'
+        return True
+
+    def _reset(self):
+        self._index.seek(0); self._index.truncate()
+        self.count = 0; self.indexed_bytes = 0; self.status = 'built'
+        self._write_header()
+
+    def _write_header(self):
+        with open(self.path, 'rb') as text_file: tail_crc = _tail_crc(text_file, self.indexed_bytes)
+        self._index.seek(0)
+        self._index.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.indexed_bytes, os.stat(self.path).st_mtime_ns, tail_crc, self.fingerprint)) # noqa
+        self._index.flush()
+
+    def extend(self, end=None):
+        """Indexes the complete lines up to byte `end` (flushed by the caller). Returns lines added."""
+        end = os.path.getsize(self.path) if end is None else end
+        if end <= self.indexed_bytes: return 0
+        estimator = get_estimator(); offset = self.indexed_bytes; added = 0; carry = b''
+        self._index.seek(HEADER.size + self.count * RECORD.size)
+        with open(self.path, 'rb') as text_file:
+            text_file.seek(offset)
+            remaining = end - offset
+            while remaining > 0:
+                block = text_file.read(min(SCAN_BLOCK_BYTES, remaining))
+                if not block: break
+                remaining -= len(block)
+                data = carry + block; cut = data.rfind(b'\n') + 1
+                carry = data[cut:]
+                if not cut: continue
+                raw_lines = data[:cut].split(b'\n')[:-1]
+                lines = data[:cut].decode('utf-8', errors='replace').split('\n')[:-1] # '\n' never occurs inside a UTF-8 sequence # noqa
+                lines = [line[:-1] if line.endswith('\r') else line for line in lines]
+                ends = list(accumulate((len(raw) + 1 for raw in raw_lines), initial=offset))[1:]
+                self._index.write(b''.join(map(RECORD.pack, ends, estimator.count_lines(lines), map(line_flags, lines))))
+                offset = ends[-1]; added += len(lines)
+        self.count += added; self.indexed_bytes = offset
+        if added and self.status == 'loaded': self.status = 'updated'
+        self._write_header()
+        return added
+
+
+def update_line_index(path, log_func=None):
+    """Brings the sidecar of `path` up to date (extend or rebuild as needed). Returns the line count."""
+    with LineIndexWriter(path) as writer:
+        start_count = writer.count
+        writer.extend()
+        if log_func is not None and writer.status != 'loaded':
+            log_func(f"Line index {writer.status}: {writer.count - start_count:,} lines indexed ({writer.count:,} total).") # noqa
+        return writer.count
+
+
+class LineIndex:
+    """
+    Read side: the file and its index, both memory-mapped. len() is the number of complete lines;
+    line(n) and lines(start, stop) decode only the bytes asked for. Open with LineIndex.open(), which
+    brings the sidecar up to date first; use as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = []; self._maps = []
+        self._text = self._map(path)
+        self._records = self._map(line_index_path_for(path))
+        self.count = (len(self._records) - HEADER.size) // RECORD.size if len(self._records) >= HEADER.size else 0
+
+    @classmethod
+    def open(cls, path, log_func=None):
+        update_line_index(path, log_func)
+        return cls(path)
+
+    def _map(self, path):
+        f = open(path, 'rb'); self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0: return b''
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ); self._maps.append(mapped)
+        return mapped
+
+    def close(self):
+        for mapped in self._maps: mapped.close()
+        for f in self._files: f.close()
+        self._maps = []; self._files = []
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def __len__(self): return self.count
+
+    def record(self, n):
+        """(end offset, tokens, flags) of line n."""
+        if not 0 <= n < self.count: raise IndexError(n)
+        return RECORD.unpack_from(self._records, HEADER.size + n * RECORD.size)
+
+    def span(self, n):
+        """Byte range [start, end) of line n, newline included."""
+        return (self.record(n - 1)[0] if n else 0), self.record(n)[0]
+
+    def line(self, n):
+        start, end = self.span(n)
+        return self._decode(self._text[start:end])[0]
+
+    def lines(self, start=0, stop=None):
+        """Lines start..stop-1 (clamped, like a slice) from one contiguous read."""
+        start, stop, _ = slice(start, stop).indices(self.count)
+        if start >= stop: return []
+        return self._decode(self._text[self.span(start)[0]:self.record(stop - 1)[0]])
+
+    @staticmethod
+    def _decode(data):
+        lines = data.decode('utf-8', errors='replace').split('\n')[:-1]
+        return [line[:-1] if line.endswith('\r') else line for line in lines]
+
+    def records(self, start=0, stop=None):
+        """(end offset, tokens, flags) of lines start..stop-1."""
+        start, stop, _ = slice(start, stop).indices(self.count)
+        if start >= stop: return []
+        return RECORD.iter_unpack(self._records[HEADER.size + start * RECORD.size:HEADER.size + stop * RECORD.size])
+
+    def token_total(self, start=0, stop=None, model=None):
+        """Estimated tokens of lines start..stop-1, with `model`'s correction factor."""
+        return round(sum(tokens for _, tokens, _ in self.records(start, stop)) * get_estimator().factor(model))
+
+    def find(self, flags, start=0, stop=None):
+        """Line numbers (start..stop-1) with any of the LINE_* `flags` set."""
+        start, _, _ = slice(start, stop).indices(self.count)
+        return [n for n, (_, _, record_flags) in enumerate(self.records(start, stop), start) if record_flags & flags]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line-offset index of a review file (builds/updates it).")
+    parser.add_argument('file', help="Review file, e.g. <game>_reviews.txt or <game>_reviews_optimized.txt")
+    parser.add_argument('--lines', type=str, default="", metavar='START:STOP', help="Print lines START..STOP-1 (0-based, slice syntax)") # noqa
+    parser.add_argument('--stats', action='store_true', help="Print line, token and flag counts")
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose token correction factor to apply")
+    args = parser.parse_args()
+    if not os.path.exists(args.file): print(f"Error: File not found: {args.file}", file=sys.stderr); sys.exit(1)
+    with LineIndex.open(args.file, log_func=lambda message: print(message, file=sys.stderr)) as index:
+        if args.stats or not args.lines:
+            print(f"{len(index):,} lines, ~{index.token_total(model=args.model):,} tokens")
+            for name, flag in (('blank', LINE_BLANK), ('header', LINE_HEADER), ('positive', LINE_POSITIVE), ('negative', LINE_NEGATIVE), ('annotated', LINE_ANNOTATED)): # noqa
+                print(f"  {name + ':':<11}{len(index.find(flag)):,}")
+        if args.lines:
+            try: start, stop = (int(part) if part else None for part in args.lines.split(':', 1))
+            except ValueError: print("Error: --lines takes START:STOP", file=sys.stderr); sys.exit(1)
+            for line in index.lines(start, stop): print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -56,7 +56,8 @@ def main():
             ai_optimized_callback=None, ai_original_callback=None,
             load_callback=None, refresh_callback=None,
             stop_scrape_callback=None,
-            strip_metadata_callback=None # <-- Add placeholder for new callback
+            strip_metadata_callback=None, # <-- Add placeholder for new callback
+            rerender_callback=None
         )
     except Exception as gui_build_e:
         early_log(f"FATAL: GUI Build Error: {gui_build_e}\n{traceback.format_exc()}")
@@ -127,11 +128,12 @@ def main():
         # Pass stop_event from task_manager to scrape_action partial
         scrape_action = partial(process_handler.run_scraping, root, widgets, get_current_settings, log_func, task_mgr.stop_requested)
         optimize_action = partial(process_handler.run_optimization, widgets, get_current_settings, log_func)
-        ai_optimized_action = partial(api_handler.send_to_ai, widgets, lambda: API_KEY, config.SUPPORTED_MODELS, log_func, use_optimized_file=True)
-        ai_original_action = partial(api_handler.send_to_ai, widgets, lambda: API_KEY, config.SUPPORTED_MODELS, log_func, use_optimized_file=False)
+        ai_optimized_action = partial(api_handler.send_to_ai, widgets, lambda: API_KEY, config.SUPPORTED_MODELS, log_func, use_optimized_file=True, on_stream=gui_mgr.stream_ai_response) # noqa
+        ai_original_action = partial(api_handler.send_to_ai, widgets, lambda: API_KEY, config.SUPPORTED_MODELS, log_func, use_optimized_file=False, on_stream=gui_mgr.stream_ai_response) # noqa
         load_action = partial(file_handler.load_existing_data, widgets, log_func)
         # --- New Partial ---
         strip_action = partial(file_handler.strip_review_metadata, widgets, log_func) # <-- Create partial for stripping
+        rerender_action = partial(process_handler.run_rerender, widgets, log_func)
 
     except Exception as partial_e:
          log_func(f"FATAL: Error creating action partials: {partial_e}")
@@ -153,6 +155,7 @@ def main():
         widgets['load_button'].configure(command=partial(task_mgr.start_action, load_action, action_type="load"))
         # --- Configure New Button ---
         widgets['strip_button'].configure(command=partial(task_mgr.start_action, strip_action, action_type="strip")) # <-- Wire up strip button
+        widgets['rerender_button'].configure(command=partial(task_mgr.start_action, rerender_action, action_type="rerender"))
 
         # Wire up STOP button to TaskManager method
         widgets['stop_button'].configure(command=task_mgr.request_stop)
@@ -0,0 +1,437 @@
+# mock_gemini.py
+"""
+Local stand-in for the Gemini endpoints api_handler.py and context_cache.py call, for offline runs and
+benchmarks of the AI path.
+
+    POST /v1beta/models/<model>:generateContent                  canned answer (text + CSV block)
+    POST /v1beta/models/<model>:streamGenerateContent?alt=sse    the same answer as SSE events
+    POST /v1beta/cachedContents, GET/DELETE /v1beta/<name>       context caches (kept in memory)
+    GET  /__stats                                                request/byte counters as JSON
+
+Latency (before the first byte, and between stream events), a request size limit, safety blocks,
+MAX_TOKENS truncation, 429/5xx injection and the size of the canned CSV block are configurable.
+The benchmark drives api_handler.send_to_ai end to end against a private instance and reports wall
+time, time to first streamed output, peak RSS (optionally traced Python memory) and bytes on the wire.
+
+    python mock_gemini.py --port 8766 --rate_429 0.1      # then GEMINI_API_URL=http://127.0.0.1:8766/v1beta
+    python mock_gemini.py --bench --size_mb 4 --stream    # one benchmark run
+    python mock_gemini.py --suite --size_mb 4             # every BENCH_SCENARIOS entry, each in its own process
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try: import resource # Peak RSS; not available on Windows
+except ImportError: resource = None
+
+import rate_limiter
+from config import SUPPORTED_MODELS
+from mock_steam import synthetic_reviews
+
+API_PREFIX = '/v1beta'
+DEFAULT_MAX_REQUEST_BYTES = 20 * 1024 * 1024 # Gemini's inline request limit
+CHARS_PER_TOKEN = 4 # Token counts the mock reports (bytes / 4 is close enough for a stand-in)
+GENERATE_PATTERN = re.compile(r'^/models/([^/:]+):(generateContent|streamGenerateContent)$')
+QUERY_PATTERN = re.compile(r'QUERY: (.*)')
+TTL_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)s$')
+# (name, extra --bench arguments) run by --suite
+BENCH_SCENARIOS = (
+    ('plain', []),
+    ('stream', ['--stream']),
+    ('map_reduce', ['--map_reduce']),
+    # 3 MiB: once calibrated, 4 MiB is over AI_MAP_REDUCE['auto_above_tokens'] and later queries go map-reduce
+    ('context_cache', ['--context_cache', '--queries', '3', '--size_mb', '3']),
+    ('slow_stream', ['--stream', '--latency', '1.0', '--chunk_delay', '0.02']),
+    ('blocked', ['--block_rate', '1']),
+    ('max_tokens', ['--truncate_rate', '1']),
+    ('throttled_map_reduce', ['--map_reduce', '--rate_429', '0.3', '--retry_after', '0']),
+    ('too_large', ['--max_request_bytes', '1000000']),
+)
+
+
+def canned_answer(query, csv_rows, prompt_chars):
+    """The mock's answer: a sentence, a CSV block of `csv_rows` rows (quoted fields included) and a closing line."""
+    rows = ["Topic,Mentions,Example"]
+    for i in range(csv_rows):
+        rows.append(f'Topic {i + 1},{(i * 37) % 97 + 1},"Players said ""topic {i + 1}"", often, at length"')
+    return (f"Mock analysis of {prompt_chars:,} prompt characters for the query: {query}\n\n"
+            f"<CSV_START>\n" + "\n".join(rows) + "\n<CSV_END>\n\nThese rows are canned test data.")
+
+
+def format_expire_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def google_error(status, message):
+    names = {400: 'INVALID_ARGUMENT', 403: 'PERMISSION_DENIED', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 502: 'UNAVAILABLE', 503: 'UNAVAILABLE'} # noqa
+    return {'error': {'code': status, 'message': message, 'status': names.get(status, 'UNKNOWN')}}
+
+
+class MockGeminiServer:
+    """
+    Threaded HTTP server answering generateContent (plain and SSE) with canned_answer(). Fault rates are
+    per request probabilities drawn from a seeded RNG; prompts containing `block_term` are always
+    blocked. Counters (requests, bytes each way, injected faults, statuses) live in `stats` and at
+    /__stats. `start()` serves from a daemon thread; `serve_forever()` blocks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, chunk_delay=0.0, chunk_chars=200, rate_429=0.0, rate_5xx=0.0, retry_after=1, max_request_bytes=DEFAULT_MAX_REQUEST_BYTES, block_rate=0.0, block_term="", truncate_rate=0.0, csv_rows=20, seed=1, verbose=False): # noqa
+        self.latency = latency; self.jitter = jitter; self.chunk_delay = chunk_delay; self.chunk_chars = max(1, chunk_chars); self.rate_429 = rate_429; self.rate_5xx = rate_5xx; # noqa
+        self.retry_after = retry_after; self.max_request_bytes = max_request_bytes; self.block_rate = block_rate; self.block_term = block_term; self.truncate_rate = truncate_rate; # noqa
+        self.csv_rows = csv_rows; self.verbose = verbose
+        self._rng = random.Random(seed); self._lock = threading.Lock(); self._caches = {}; self._cache_serial = 0
+        self.stats = Counter(); self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class()); self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """What GEMINI_API_URL should be set to."""
+        return self.base_url + API_PREFIX
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True); self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+        if self._thread is not None: self._thread.join()
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc): self.stop()
+
+    def snapshot(self):
+        with self._lock: return dict(self.stats)
+
+    # --- Request handling ---
+    def _handler_class(self):
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive; streamed answers close the connection instead
+            def _respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, payload, headers = server.handle(method, self.path, body)
+                if isinstance(payload, list): return self._write_events(payload)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8'); self.send_header('Content-Length', str(len(data))) # noqa
+                for name, value in headers.items(): self.send_header(name, value)
+                self.end_headers(); self.wfile.write(data)
+                server.count('bytes_sent', len(data))
+            def _write_events(self, events):
+                """Server-sent events, `chunk_delay` apart, on a connection closed at the end."""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream; charset=utf-8'); self.send_header('Connection', 'close') # noqa
+                self.end_headers()
+                for i, event in enumerate(events):
+                    if i and server.chunk_delay > 0: time.sleep(server.chunk_delay)
+                    data = b'data: ' + json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\r\n\r\n'
+                    try: self.wfile.write(data); self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError): return # Client went away mid-stream
+                    server.count('bytes_sent', len(data)); server.count('stream_events')
+            def do_GET(self): self._respond('GET')
+            def do_POST(self): self._respond('POST')
+            def do_DELETE(self): self._respond('DELETE')
+            def log_message(self, format, *args):
+                if server.verbose: super().log_message(format, *args)
+        return Handler
+
+    def count(self, name, amount=1):
+        with self._lock: self.stats[name] += amount
+
+    def _draw(self, probability):
+        return probability > 0 and self._rng.random() < probability
+
+    def handle(self, method, raw_path, body):
+        """
+        Routes one request. Returns (http_status, json_body, extra_headers); a list body is a stream
+        of SSE events.
+        """
+        parsed = urlparse(raw_path); query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path == '/__stats': return 200, self.snapshot(), {}
+        path = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX + '/') else None
+        generate = GENERATE_PATTERN.match(path or '')
+        route = generate.group(2) if generate else 'cachedContents' if path and path.startswith('/cachedContents') else 'unknown' # noqa
+        with self._lock:
+            self.stats['requests'] += 1; self.stats[f'requests_{route}'] += 1; self.stats['bytes_received'] += len(body) # noqa
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self._draw(self.rate_429): fault = '429'
+            elif self._draw(self.rate_5xx): fault = '5xx'
+            else: fault = None
+            if fault: self.stats[f'injected_{fault}'] += 1
+            error_status = self._rng.choice((500, 502, 503)) if fault == '5xx' else 429
+        if delay > 0: time.sleep(delay)
+        if fault:
+            headers = {'Retry-After': str(self.retry_after)} if error_status in rate_limiter.THROTTLE_STATUS_CODES and self.retry_after else {} # noqa
+            status, payload = error_status, google_error(error_status, "Resource has been exhausted (e.g. check quota)." if error_status == 429 else "The service is currently unavailable.") # noqa
+        elif len(body) > self.max_request_bytes:
+            self.count('rejected_too_large'); headers = {}
+            status, payload = 400, google_error(400, f"Request payload size exceeds the limit: {self.max_request_bytes} bytes.") # noqa
+        elif generate and method == 'POST':
+            headers = {}; status, payload = self._generate(generate.group(1), body, stream=generate.group(2) == 'streamGenerateContent' and query.get('alt') == 'sse') # noqa
+        elif route == 'cachedContents':
+            headers = {}; status, payload = self._cached_contents(method, path.lstrip('/'), body)
+        else: status, payload, headers = 404, google_error(404, f"Unknown route {method} {parsed.path}"), {}
+        self.count(f'status_{status}')
+        return status, payload, headers
+
+    def _generate(self, model_id, body, stream):
+        try:
+            request = json.loads(body)
+            prompt = ''.join(part.get('text', '') for content in request['contents'] for part in content.get('parts', [])) # noqa
+        except (ValueError, KeyError, TypeError, AttributeError): return 400, google_error(400, "Invalid JSON payload received.") # noqa
+        cached_tokens = 0
+        if request.get('cachedContent'):
+            with self._lock: cache = self._caches.get(request['cachedContent'])
+            if cache is None or cache['expire_time'] <= time.time():
+                return 404 if cache is None else 403, google_error(404 if cache is None else 403, f"CachedContent not found (or expired): {request['cachedContent']}") # noqa
+            if cache['model'] != f"models/{model_id}": return 400, google_error(400, "Model used by the cached content does not match the request model.") # noqa
+            cached_tokens = cache['tokens']; self.count('cached_tokens_served', cached_tokens)
+        usage = {'promptTokenCount': len(prompt) // CHARS_PER_TOKEN + cached_tokens}
+        if cached_tokens: usage['cachedContentTokenCount'] = cached_tokens
+        with self._lock:
+            blocked = bool(self.block_term and self.block_term in prompt) or self._draw(self.block_rate)
+            truncated = not blocked and self._draw(self.truncate_rate)
+            if blocked: self.stats['injected_block'] += 1
+            if truncated: self.stats['injected_max_tokens'] += 1
+        if blocked:
+            feedback = {'blockReason': 'SAFETY', 'safetyRatings': [{'category': 'HARM_CATEGORY_HARASSMENT', 'probability': 'HIGH'}]} # noqa
+            response = {'promptFeedback': feedback, 'usageMetadata': usage}
+            return 200, ([response] if stream else response)
+        query = QUERY_PATTERN.search(prompt)
+        answer = canned_answer(query.group(1).strip() if query else "(none)", self.csv_rows, len(prompt))
+        if truncated: answer = answer[:len(answer) // 2] # Cut mid-CSV, like a real MAX_TOKENS stop
+        usage['candidatesTokenCount'] = len(answer) // CHARS_PER_TOKEN
+        usage['totalTokenCount'] = usage['promptTokenCount'] + usage['candidatesTokenCount']
+        finish = {'finishReason': 'MAX_TOKENS' if truncated else 'STOP', 'safetyRatings': []}
+        if not stream:
+            return 200, {'candidates': [dict(finish, content={'role': 'model', 'parts': [{'text': answer}]}, index=0)], 'usageMetadata': usage} # noqa
+        pieces = [answer[i:i + self.chunk_chars] for i in range(0, len(answer), self.chunk_chars)]
+        events = [{'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}, 'index': 0}]} for piece in pieces] # noqa
+        events[-1]['candidates'][0].update(finish); events[-1]['usageMetadata'] = usage
+        return 200, events
+
+    def _cached_contents(self, method, path, body):
+        """POST cachedContents creates; GET/DELETE cachedContents/<id> reads/removes. Text is not kept, only its size.""" # noqa
+        now = time.time()
+        if method == 'POST' and path == 'cachedContents':
+            try:
+                request = json.loads(body)
+                text = ''.join(part.get('text', '') for content in request['contents'] for part in content.get('parts', [])) # noqa
+                ttl = TTL_PATTERN.match(request.get('ttl', '3600s'))
+                model = request['model']
+            except (ValueError, KeyError, TypeError, AttributeError): return 400, google_error(400, "Invalid JSON payload received.") # noqa
+            if not ttl: return 400, google_error(400, f"Invalid ttl: {request.get('ttl')}")
+            with self._lock:
+                self._cache_serial += 1; name = f"cachedContents/mock{self._cache_serial:06d}"
+                cache = {'name': name, 'model': model, 'displayName': request.get('displayName', ''), 'tokens': len(text) // CHARS_PER_TOKEN, 'create_time': now, 'expire_time': now + float(ttl.group(1))} # noqa
+                self._caches[name] = cache; self.stats['caches_created'] += 1
+            return 200, self._cache_resource(cache)
+        with self._lock:
+            cache = self._caches.get(path)
+            if cache is not None and cache['expire_time'] <= now: del self._caches[path]; cache = None
+            if cache is not None and method == 'DELETE': del self._caches[path]; self.stats['caches_deleted'] += 1
+        if cache is None: return 404, google_error(404, f"CachedContent not found: {path}")
+        if method == 'DELETE': return 200, {}
+        if method == 'GET': return 200, self._cache_resource(cache)
+        return 404, google_error(404, f"Unknown route {method} {path}")
+
+    @staticmethod
+    def _cache_resource(cache):
+        return {'name': cache['name'], 'model': cache['model'], 'displayName': cache['displayName'], 'usageMetadata': {'totalTokenCount': cache['tokens']}, # noqa
+                'createTime': format_expire_time(cache['create_time']), 'updateTime': format_expire_time(cache['create_time']), 'expireTime': format_expire_time(cache['expire_time'])} # noqa
+
+
+# --- Benchmark ---
+class BenchInput:
+    """Stands in for the GUI widgets send_to_ai reads (entries, text boxes, comboboxes, checkboxes)."""
+    def __init__(self, value): self.value = value
+    def get(self, *args): return self.value
+
+
+class DialogRecorder:
+    """Replaces api_handler's messagebox during a benchmark: records dialogs, answers yes."""
+    def __init__(self): self.dialogs = []
+    def _record(self, kind, title, message="", **kwargs): self.dialogs.append(f"{kind}: {title}"); return True
+    def showerror(self, *args, **kwargs): return self._record('error', *args, **kwargs)
+    def showwarning(self, *args, **kwargs): return self._record('warning', *args, **kwargs)
+    def showinfo(self, *args, **kwargs): return self._record('info', *args, **kwargs)
+    def askyesno(self, *args, **kwargs): return self._record('ask', *args, **kwargs)
+
+
+def write_review_file(path, size_bytes, seed=1):
+    """A _reviews_optimized.txt of about `size_bytes`: the optimizer's header block, then one synthetic review per line.""" # noqa
+    header = "Game Mock Game\nAppID 480\nRelease Date 1 Jan, 2020\nReview Score Very Positive\nScrape Target 0\nScrape Time 2025-01-01 00:00:00\n" # noqa
+    written = len(header.encode('utf-8')); batch = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header)
+        while written < size_bytes:
+            for review in synthetic_reviews(2000, seed + batch):
+                line = ' '.join(review['review'].split()) + '\n'
+                f.write(line); written += len(line.encode('utf-8'))
+                if written >= size_bytes: break
+            batch += 1
+    return written
+
+
+def peak_rss_bytes():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Bytes on macOS, KiB elsewhere
+
+
+def run_benchmark(server, size_mb=4.0, queries=1, stream=False, map_reduce=False, context_cache=False, original=False, model_id=None, trace_memory=False, quiet=True): # noqa
+    """
+    Runs api_handler.send_to_ai `queries` times over a synthetic review file of `size_mb` MiB in a
+    temporary working directory (review folder, caches and calibration file all land there), pointed at
+    `server`. The response cache is bypassed. Returns a dict of timings, memory and wire figures;
+    `trace_memory` adds tracemalloc's peak, at the cost of several times the wall time.
+    """
+    import api_handler
+    import context_cache as context_cache_module
+    import file_handler # noqa: F401 (send_to_ai imports it lazily, which fails from a sys.path '' after the chdir)
+    model = next((m for m in SUPPORTED_MODELS if m['id'] == model_id), None) if model_id else next((m for m in SUPPORTED_MODELS if m['id'] == 'gemini-2.0-flash'), SUPPORTED_MODELS[0]) # noqa
+    if model is None: raise ValueError(f"Unknown model ID '{model_id}'")
+    previous = (os.getcwd(), api_handler.GEMINI_API_URL, context_cache_module.GEMINI_API_URL, api_handler.messagebox)
+    recorder = DialogRecorder(); log_lines = []; runs = []
+    def log_func(message):
+        log_lines.append(message)
+        if not quiet: print(message)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.chdir(work_dir)
+            api_handler.GEMINI_API_URL = context_cache_module.GEMINI_API_URL = server.api_url; api_handler.messagebox = recorder # noqa
+            folder = api_handler.get_game_folder_path("Mock Game", "480", log_func)
+            suffix = "_reviews.txt" if original else "_reviews_optimized.txt"
+            input_bytes = write_review_file(os.path.join(folder, os.path.basename(folder) + suffix), int(size_mb * 1024 * 1024)) # noqa
+            widgets = {'game_name_entry': BenchInput("Mock Game"), 'steam_id_entry': BenchInput("480"), 'model_combobox': BenchInput(model['name']), # noqa
+                       'ai_map_reduce_checkbox': BenchInput(int(map_reduce)), 'ai_stream_checkbox': BenchInput(int(stream)), 'ai_context_cache_checkbox': BenchInput(int(context_cache)), # noqa
+                       'ai_cache_bypass_checkbox': BenchInput(1), 'ai_retrieval_checkbox': BenchInput(0)}
+            if trace_memory: tracemalloc.start()
+            before = server.snapshot(); peak_traced = None
+            for number in range(queries):
+                widgets['ai_query_text'] = BenchInput(f"Benchmark query {number + 1}: what do players complain about?")
+                first_output = []; started = time.perf_counter()
+                on_stream = lambda text, rows: first_output or first_output.append(time.perf_counter() - started) # noqa
+                success, csv_rows, _ = api_handler.send_to_ai(widgets, lambda: "mock-key", SUPPORTED_MODELS, log_func, not original, on_stream=on_stream) # noqa
+                runs.append({'success': success, 'elapsed': time.perf_counter() - started, 'first_output': first_output[0] if first_output else None, 'csv_rows': len(csv_rows) - 1 if csv_rows else 0}) # noqa
+            if trace_memory: _, peak_traced = tracemalloc.get_traced_memory()
+    finally:
+        if tracemalloc.is_tracing(): tracemalloc.stop()
+        os.chdir(previous[0]); api_handler.GEMINI_API_URL, context_cache_module.GEMINI_API_URL, api_handler.messagebox = previous[1:] # noqa
+    after = server.snapshot(); counters = {name: after.get(name, 0) - before.get(name, 0) for name in after if after.get(name, 0) != before.get(name, 0)} # noqa
+    return {'model': model['id'], 'input_bytes': input_bytes, 'queries': queries, 'successes': sum(run['success'] for run in runs), # noqa
+            'elapsed': sum(run['elapsed'] for run in runs), 'runs': runs, 'first_output': runs[0]['first_output'] if runs else None, # noqa
+            'peak_rss_bytes': peak_rss_bytes(), 'peak_traced_bytes': peak_traced, 'bytes_sent': counters.get('bytes_received', 0), # noqa
+            'bytes_received': counters.get('bytes_sent', 0), 'requests': counters.get('requests', 0), 'server': counters, 'dialogs': recorder.dialogs} # noqa
+
+
+def print_benchmark(result):
+    mib = 1024 * 1024
+    print("=" * 50)
+    print(f"Input file:          {result['input_bytes'] / mib:.2f} MiB ({result['model']})")
+    print(f"Queries:             {result['successes']}/{result['queries']} succeeded")
+    print(f"Wall time:           {result['elapsed']:.2f}s" + "".join(f"  [{run['elapsed']:.2f}s]" for run in result['runs'] if result['queries'] > 1)) # noqa
+    if result['first_output'] is not None: print(f"First output after:  {result['first_output']:.3f}s")
+    print(f"Peak RSS:            {result['peak_rss_bytes'] / mib:.1f} MiB" if result['peak_rss_bytes'] else "Peak RSS:            n/a") # noqa
+    if result['peak_traced_bytes'] is not None: print(f"Peak traced (Python): {result['peak_traced_bytes'] / mib:.1f} MiB")
+    print(f"Bytes sent/received: {result['bytes_sent'] / mib:.2f} MiB / {result['bytes_received'] / 1024:.1f} KiB")
+    print(f"Requests:            {result['requests']}")
+    for name in sorted(result['server']):
+        if name not in ('requests', 'bytes_received', 'bytes_sent'): print(f"  {name + ':':<34}{result['server'][name]}") # noqa
+    for dialog in result['dialogs']: print(f"Dialog:              {dialog}")
+    print("=" * 50)
+
+
+def run_suite(args):
+    """Runs every BENCH_SCENARIOS entry in a fresh interpreter (so peak RSS is per scenario) and prints a table.""" # noqa
+    common = ['--size_mb', str(args.size_mb), '--csv_rows', str(args.csv_rows)] + (['--model', args.model] if args.model else []) + (['--trace_memory'] if args.trace_memory else []) # noqa
+    results = []
+    for name, extra in BENCH_SCENARIOS:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--bench', '--json'] + common + extra, capture_output=True, text=True) # noqa
+        try: results.append((name, json.loads(completed.stdout)))
+        except ValueError: print(f"{name}: benchmark failed\n{completed.stderr[-2000:]}", file=sys.stderr); results.append((name, None)) # noqa
+    if args.json: print(json.dumps(dict(results), indent=2)); return
+    mib = 1024 * 1024
+    print(f"{'scenario':<22}{'ok':>6}{'wall s':>9}{'first s':>9}{'RSS MiB':>9}{'traced MiB':>11}{'sent MiB':>10}{'requests':>10}  dialogs") # noqa
+    for name, result in results:
+        if result is None: print(f"{name:<22}{'failed':>6}"); continue
+        first = f"{result['first_output']:.3f}" if result['first_output'] is not None else "-"
+        rss = f"{result['peak_rss_bytes'] / mib:.1f}" if result['peak_rss_bytes'] else "n/a"
+        traced = f"{result['peak_traced_bytes'] / mib:.1f}" if result['peak_traced_bytes'] is not None else "-"
+        print(f"{name:<22}{result['successes']:>3}/{result['queries']:<2}{result['elapsed']:>9.2f}{first:>9}{rss:>9}{traced:>11}{result['bytes_sent'] / mib:>10.2f}{result['requests']:>10}  {'; '.join(result['dialogs'])}") # noqa
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Mock Gemini generateContent/cachedContents server with fault injection and an AI-path benchmark.") # noqa
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Bind address (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8766, help="Port; 0 picks a free one (default: 8766, --bench always uses 0)") # noqa
+    parser.add_argument('--seed', type=int, default=1, help="Seed for fault draws (default: 1)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds before every response (default: 0.05)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra uniform random latency, seconds (default: 0)")
+    parser.add_argument('--chunk_delay', type=float, default=0.0, help="Seconds between streamed events (default: 0)")
+    parser.add_argument('--chunk_chars', type=int, default=200, help="Answer characters per streamed event (default: 200)") # noqa
+    parser.add_argument('--rate_429', type=float, default=0.0, help="Probability of a 429 per request (default: 0)")
+    parser.add_argument('--rate_5xx', type=float, default=0.0, help="Probability of a 500/502/503 per request (default: 0)")
+    parser.add_argument('--retry_after', type=int, default=1, help="Retry-After seconds on 429/503, 0 = omit (default: 1)") # noqa
+    parser.add_argument('--max_request_bytes', type=int, default=DEFAULT_MAX_REQUEST_BYTES, help=f"Larger request bodies get a 400 (default: {DEFAULT_MAX_REQUEST_BYTES})") # noqa
+    parser.add_argument('--block_rate', type=float, default=0.0, help="Probability of a SAFETY-blocked prompt (default: 0)")
+    parser.add_argument('--block_term', type=str, default="", help="Always block prompts containing this text (default: none)") # noqa
+    parser.add_argument('--truncate_rate', type=float, default=0.0, help="Probability of a half answer with finishReason MAX_TOKENS (default: 0)") # noqa
+    parser.add_argument('--csv_rows', type=int, default=20, help="Rows in the canned CSV block (default: 20)")
+    parser.add_argument('--verbose', action='store_true', help="Log every request (and, with --bench, the AI step's log)")
+    bench = parser.add_argument_group('benchmark')
+    bench.add_argument('--bench', action='store_true', help="Run send_to_ai against a private instance and report time, memory and bytes") # noqa
+    bench.add_argument('--suite', action='store_true', help="Run every built-in scenario, one process each, and print a table") # noqa
+    bench.add_argument('--size_mb', type=float, default=4.0, help="Size of the synthetic review file in MiB (default: 4)") # noqa
+    bench.add_argument('--queries', type=int, default=1, help="Queries sent one after another (default: 1)")
+    bench.add_argument('--model', type=str, default="", help="Model ID (default: gemini-2.0-flash)")
+    bench.add_argument('--stream', action='store_true', help="Tick 'Stream response'")
+    bench.add_argument('--map_reduce', action='store_true', help="Tick 'Map-reduce'")
+    bench.add_argument('--context_cache', action='store_true', help="Tick 'Context cache'")
+    bench.add_argument('--original', action='store_true', help="Send the original instead of the optimized file")
+    bench.add_argument('--trace_memory', action='store_true', help="Also report tracemalloc's peak (slows the run down several times)") # noqa
+    bench.add_argument('--json', action='store_true', help="Print the benchmark result as JSON")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    if args.suite: run_suite(args); return
+    server = MockGeminiServer(host=args.host, port=0 if args.bench else args.port, latency=args.latency, jitter=args.jitter, chunk_delay=args.chunk_delay, chunk_chars=args.chunk_chars, rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after, max_request_bytes=args.max_request_bytes, block_rate=args.block_rate, block_term=args.block_term, truncate_rate=args.truncate_rate, csv_rows=args.csv_rows, seed=args.seed, verbose=args.verbose) # noqa
+    if not args.bench:
+        print(f"Serving the Gemini API at {server.api_url} (Ctrl+C to stop)")
+        print(f"Point the app at it with: GEMINI_API_URL={server.api_url}")
+        try: server.serve_forever()
+        except KeyboardInterrupt: print("\nStopped.")
+        finally: server.httpd.server_close()
+        return
+    with server, contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        result = run_benchmark(server, args.size_mb, args.queries, args.stream, args.map_reduce, args.context_cache, args.original, args.model or None, args.trace_memory, quiet=not args.verbose) # noqa
+    if args.json: print(json.dumps(result, indent=2))
+    else: print_benchmark(result)
+
+
+if __name__ == '__main__':
+    main()
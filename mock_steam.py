@@ -0,0 +1,316 @@
+# mock_steam.py
+"""
+Local stand-in for the two Steam store endpoints the scraper uses, for offline runs and benchmarks.
+
+    GET /appreviews/<app_id>?json=1&cursor=...   cursor-paginated reviews (+ query_summary)
+    GET /api/appdetails?appids=<app_id>          name / release date
+    GET /__stats                                 request counters as JSON
+
+Reviews are synthetic (seeded, deterministic) or replayed from a raw archive written by reviews.py
+(`--recorded reviews.txt.raw.jsonl.gz`). Latency, 429/5xx injection, a server-side request budget,
+empty pages, looping cursors and the different end-of-chain shapes Steam produces are configurable.
+
+    python mock_steam.py --port 8765 --rate_429 0.05          # then STEAM_STORE_URL=http://127.0.0.1:8765
+    python mock_steam.py --bench --reviews 20000 --max 20000  # scrape it in-process and report throughput
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import rate_limiter
+import reviews
+from config import STEAM_RATE_LIMIT
+
+MAX_PAGE_SIZE = 100 # Steam ignores num_per_page above this
+END_MODES = ('same', 'empty', 'missing') # Last page: same cursor again / cursor '' / no cursor key
+SYNTHETIC_EPOCH = 1_700_000_000 # Newest synthetic review; older ones step back from here
+SYNTHETIC_LANGUAGES = ('english', 'english', 'english', 'schinese', 'russian', 'german')
+SYNTHETIC_WORDS = ("game fun great boring bugs story combat graphics music price worth refund hours friends multiplayer "
+                   "grind update devs servers crash performance controls level boss quest loot recommend").split()
+SYNTHETIC_EXTRAS = ("10/10", "!!!", "...", "👍", "👎", "✅", "❌", "https://example.com/guide", "www.example.org", "ГГ", "好玩", "-_-") # noqa
+
+
+def synthetic_reviews(count, seed=1):
+    """`count` Steam-shaped review dicts, newest first, identical for the same seed."""
+    rng = random.Random(seed); generated = []
+    for i in range(count):
+        created = SYNTHETIC_EPOCH - i * 1800 - rng.randrange(1800); playtime = int(rng.expovariate(1 / 1500)) # noqa
+        words = [rng.choice(SYNTHETIC_WORDS) for _ in range(int(rng.expovariate(1 / 40)) + 1)]
+        for _ in range(rng.randrange(4)): words.insert(rng.randrange(len(words) + 1), rng.choice(SYNTHETIC_EXTRAS))
+        text = ' '.join(words)
+        if rng.random() < 0.1: text = text.replace(' ', '\n', 2) # Multi-line reviews exist too
+        steam_purchase = rng.random() < 0.8
+        generated.append({
+            'recommendationid': str(100_000_000 + count - i),
+            'author': {'steamid': str(76561198000000000 + rng.randrange(10**9)), 'num_games_owned': rng.randrange(1, 900), 'num_reviews': rng.randrange(1, 60), 'playtime_forever': playtime, 'playtime_last_two_weeks': rng.randrange(300), 'playtime_at_review': playtime, 'last_played': created + rng.randrange(86400 * 30)}, # noqa
+            'language': rng.choice(SYNTHETIC_LANGUAGES), 'review': text, 'timestamp_created': created, 'timestamp_updated': created + (rng.randrange(86400 * 60) if rng.random() < 0.2 else 0), # noqa
+            'voted_up': rng.random() < 0.75, 'votes_up': int(rng.expovariate(1 / 5)), 'votes_funny': int(rng.expovariate(1 / 1)), 'weighted_vote_score': f"{rng.random():.6f}", 'comment_count': rng.randrange(3), # noqa
+            'steam_purchase': steam_purchase, 'received_for_free': not steam_purchase and rng.random() < 0.5, 'written_during_early_access': rng.random() < 0.1, 'primarily_steam_deck': rng.random() < 0.05, # noqa
+        })
+    return generated
+
+
+def encode_cursor(offset, nonce=0):
+    return base64.b64encode(f"{offset}:{nonce}".encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Offset encoded in a mock cursor ('*' is the start); None if it is not one of ours."""
+    if cursor in (None, '', '*'): return 0 if cursor == '*' or cursor is None else None
+    try: return int(base64.b64decode(cursor, validate=True).decode('ascii').split(':')[0])
+    except (ValueError, UnicodeDecodeError): return None
+
+
+class MockSteamServer:
+    """
+    Threaded HTTP server serving `review_list` (newest first) behind the appreviews/appdetails
+    routes. Fault rates are per request probabilities drawn from a seeded RNG; `server_rps` is a
+    token bucket that answers 429 (with Retry-After) once clients outrun it. Counters live in
+    `stats` and at /__stats. `start()` serves from a daemon thread; `serve_forever()` blocks.
+    """
+
+    def __init__(self, review_list, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, rate_429=0.0, rate_5xx=0.0, retry_after=1, server_rps=0.0, empty_page_rate=0.0, loop_after=0, end_mode='same', seed=1, game_name="Mock Game", verbose=False): # noqa
+        if end_mode not in END_MODES: raise ValueError(f"end_mode must be one of {END_MODES}")
+        self.reviews = review_list; self.latency = latency; self.jitter = jitter; self.rate_429 = rate_429; self.rate_5xx = rate_5xx; self.retry_after = retry_after; # noqa
+        self.server_rps = server_rps; self.empty_page_rate = empty_page_rate; self.loop_after = loop_after; self.end_mode = end_mode; self.game_name = game_name; self.verbose = verbose; # noqa
+        self._rng = random.Random(seed); self._lock = threading.Lock(); self._views = {}; self._nonce = 0; # noqa
+        self._bucket = server_rps; self._bucket_at = time.monotonic()
+        self.stats = Counter(); self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class()); self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True); self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+        if self._thread is not None: self._thread.join()
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc): self.stop()
+
+    def snapshot(self):
+        with self._lock: return dict(self.stats)
+
+    # --- Request handling ---
+    def _handler_class(self):
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, like the real store
+            def do_GET(self):
+                status, body, headers = server.handle(self.path)
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8'); self.send_header('Content-Length', str(len(payload))) # noqa
+                for name, value in headers.items(): self.send_header(name, value)
+                self.end_headers(); self.wfile.write(payload)
+            def log_message(self, format, *args):
+                if server.verbose: super().log_message(format, *args)
+        return Handler
+
+    def _draw(self, probability):
+        return probability > 0 and self._rng.random() < probability
+
+    def _take_token(self):
+        """Server-side budget; False when the client is over `server_rps`."""
+        now = time.monotonic()
+        self._bucket = min(self.server_rps, self._bucket + (now - self._bucket_at) * self.server_rps); self._bucket_at = now # noqa
+        if self._bucket < 1: return False
+        self._bucket -= 1; return True
+
+    def handle(self, raw_path):
+        """Routes one GET. Returns (http_status, json_body, extra_headers)."""
+        parsed = urlparse(raw_path); query = {k: v[-1] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()} # noqa
+        route = 'appreviews' if parsed.path.startswith('/appreviews/') else 'appdetails' if parsed.path == '/api/appdetails' else parsed.path # noqa
+        if route == '/__stats': return 200, self.snapshot(), {}
+        with self._lock:
+            self.stats['requests'] += 1; self.stats[f'requests_{route.strip("/")}'] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.server_rps > 0 and not self._take_token(): fault = 'server_limit'
+            elif self._draw(self.rate_429): fault = '429'
+            elif self._draw(self.rate_5xx): fault = '5xx'
+            else: fault = None
+            if fault: self.stats[f'injected_{fault}'] += 1
+            error_status = self._rng.choice((500, 502, 503)) if fault == '5xx' else 429
+        if delay > 0: time.sleep(delay)
+        if fault: status, body, headers = error_status, {'success': 0}, ({'Retry-After': str(self.retry_after)} if error_status in rate_limiter.THROTTLE_STATUS_CODES and self.retry_after else {}) # noqa
+        elif route == 'appreviews': status, headers = 200, {}; body = self._review_page(parsed.path.rsplit('/', 1)[-1], query) # noqa
+        elif route == 'appdetails': status, headers = 200, {}; body = self._app_details(query.get('appids', ''))
+        else: status, body, headers = 404, {'success': 0}, {}
+        with self._lock: self.stats[f'status_{status}'] += 1
+        return status, body, headers
+
+    def _app_details(self, app_id):
+        return {app_id: {'success': True, 'data': {'type': 'game', 'name': f"{self.game_name} {app_id}", 'steam_appid': int(app_id) if app_id.isdigit() else 0, 'release_date': {'coming_soon': False, 'date': "1 Jan, 2020"}}}} # noqa
+
+    def _view(self, query):
+        """Reviews matching the query filters in the requested order (cached per filter combination)."""
+        key = tuple(query.get(name, '') for name in ('language', 'review_type', 'purchase_type', 'filter', 'day_range', 'playtime_filter_min')) # noqa
+        with self._lock:
+            if key in self._views: return self._views[key]
+        language, review_type, purchase_type, order, day_range, playtime = key
+        languages = set(language.split(',')) if language and language != 'all' else None
+        min_minutes = int(playtime) * 60 if playtime.isdigit() else 0
+        oldest = SYNTHETIC_EPOCH - int(day_range) * 86400 if order == 'all' and day_range.isdigit() and int(day_range) > 0 else None # noqa
+        view = [r for r in self.reviews
+                if (languages is None or r.get('language') in languages)
+                and (review_type in ('', 'all') or r.get('voted_up') == (review_type == 'positive'))
+                and (purchase_type in ('', 'all') or r.get('steam_purchase', True) == (purchase_type == 'steam'))
+                and r.get('author', {}).get('playtime_forever', 0) >= min_minutes
+                and (oldest is None or r.get('timestamp_created', 0) >= oldest)]
+        if order == 'recent': view.sort(key=lambda r: r.get('timestamp_created', 0), reverse=True)
+        elif order == 'updated': view.sort(key=lambda r: r.get('timestamp_updated') or r.get('timestamp_created', 0), reverse=True) # noqa
+        else: view.sort(key=lambda r: (r.get('votes_up', 0), r.get('timestamp_created', 0)), reverse=True) # 'all' = most helpful # noqa
+        with self._lock: self._views[key] = view
+        return view
+
+    def _review_page(self, app_id, query):
+        view = self._view(query)
+        num = max(0, min(MAX_PAGE_SIZE, int(query['num_per_page']) if query.get('num_per_page', '').isdigit() else 20)) # noqa
+        summary = {'num_reviews': 0}
+        if query.get('cursor', '*') == '*':
+            positive = sum(1 for r in view if r.get('voted_up'))
+            summary.update({'review_score': 8, 'review_score_desc': "Very Positive", 'total_positive': positive, 'total_negative': len(view) - positive, 'total_reviews': len(view)}) # noqa
+        if num == 0: return {'success': 1, 'query_summary': summary}
+        offset = decode_cursor(query.get('cursor'))
+        if offset is None:
+            with self._lock: self.stats['bad_cursor'] += 1
+            return {'success': 2} # What Steam answers to a cursor it did not issue
+        with self._lock:
+            empty_page = offset < len(view) and self._draw(self.empty_page_rate)
+            if empty_page: self.stats['injected_empty_page'] += 1; self._nonce += 1; nonce = self._nonce
+        if empty_page: return {'success': 1, 'query_summary': summary, 'reviews': [], 'cursor': encode_cursor(offset, nonce)} # Steam sometimes skips ahead with nothing to show # noqa
+        page = view[offset:offset + num]
+        if not page: # End of the chain
+            body = {'success': 1, 'query_summary': summary, 'reviews': []}
+            if self.end_mode == 'same': body['cursor'] = query.get('cursor')
+            elif self.end_mode == 'empty': body['cursor'] = ''
+            return body
+        next_cursor = encode_cursor(offset + len(page))
+        if self.loop_after and offset // num + 1 >= self.loop_after and offset >= num:
+            next_cursor = encode_cursor(num) # Hand out the page-2 cursor again, like Steam's looping chains
+            with self._lock: self.stats['injected_loop'] += 1
+        with self._lock: self.stats['pages_served'] += 1; self.stats['reviews_served'] += len(page)
+        summary['num_reviews'] = len(page)
+        return {'success': 1, 'query_summary': summary, 'reviews': page, 'cursor': next_cursor}
+
+
+def load_recorded_reviews(archive_path):
+    """Replays a reviews.py raw archive as the mock's review set."""
+    return reviews.load_archive(archive_path)
+
+
+def run_benchmark(server, app_id, options, max_rate=None, quiet=True):
+    """
+    Scrapes `server` in-process with ReviewScraper into a temporary directory and returns a dict of
+    throughput figures (reviews/s, requests per review, server counters, pipeline bottleneck).
+    With `quiet` the scraper's own progress output is discarded.
+    """
+    previous_url = reviews.STEAM_STORE_URL; reviews.STEAM_STORE_URL = server.base_url
+    stats_event = {}; done_event = {}; written = 0
+    try:
+        with tempfile.TemporaryDirectory() as work_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout), contextlib.redirect_stderr(devnull if quiet else sys.stderr): # noqa
+            scraper = reviews.ReviewScraper(app_id, options, os.path.join(work_dir, 'reviews.txt'))
+            limiter = rate_limiter.get_limiter()
+            if max_rate: limiter.max_rate = max_rate
+            start_rate = limiter.rate; before = server.snapshot(); started = time.perf_counter()
+            for event in scraper.events():
+                if event['type'] == 'progress': written = event['total']
+                elif event['type'] == 'stats': stats_event = event
+                elif event['type'] == 'done': done_event = event
+                elif event['type'] == 'error': raise reviews.ScrapeAbort(event['message'])
+            elapsed = time.perf_counter() - started
+            with open(scraper.output_filename + reviews.IDS_SUFFIX, encoding='utf-8') as ids_file: unique = len({line.split('\t', 1)[0] for line in ids_file if line.strip()}) # noqa
+    finally:
+        reviews.STEAM_STORE_URL = previous_url
+    after = server.snapshot(); counters = {name: after.get(name, 0) - before.get(name, 0) for name in after if after.get(name, 0) != before.get(name, 0)} # noqa
+    return {'reviews': done_event.get('total', written), 'unique_reviews': unique, 'elapsed': elapsed, 'reviews_per_sec': done_event.get('total', written) / elapsed if elapsed else 0.0, # noqa
+            'requests': counters.get('requests', 0), 'requests_per_100_reviews': 100 * counters.get('requests', 0) / max(1, done_event.get('total', written)), 'server': counters, # noqa
+            'limiter_start': start_rate, 'limiter_end': limiter.rate, 'bottleneck': stats_event.get('bottleneck'), 'stages': stats_event.get('stages', {})} # noqa
+
+
+def print_benchmark(result):
+    print("=" * 50)
+    print(f"Reviews written:     {result['reviews']} ({result['unique_reviews']} unique IDs)")
+    print(f"Wall time:           {result['elapsed']:.2f}s")
+    print(f"Throughput:          {result['reviews_per_sec']:.1f} reviews/s")
+    print(f"Requests:            {result['requests']} ({result['requests_per_100_reviews']:.1f} per 100 reviews)")
+    for name in sorted(result['server']):
+        if name != 'requests': print(f"  {name + ':':<26}{result['server'][name]}")
+    print(f"Limiter rate:        {result['limiter_start']:.2f} -> {result['limiter_end']:.2f} req/s")
+    if result['bottleneck']: print(f"Pipeline bottleneck: {result['bottleneck']}")
+    print("=" * 50)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Mock Steam appreviews/appdetails server with fault injection and a scraper benchmark.") # noqa
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Bind address (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port; 0 picks a free one (default: 8765, --bench always uses 0)") # noqa
+    parser.add_argument('--reviews', type=int, default=5000, help="Synthetic reviews to serve (default: 5000)")
+    parser.add_argument('--recorded', type=str, default="", help=f"Serve the reviews of a reviews.py archive (*{reviews.ARCHIVE_SUFFIX}) instead") # noqa
+    parser.add_argument('--seed', type=int, default=1, help="Seed for synthetic data and fault draws (default: 1)")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every response (default: 0.05)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra uniform random latency, seconds (default: 0)")
+    parser.add_argument('--rate_429', type=float, default=0.0, help="Probability of a 429 per request (default: 0)")
+    parser.add_argument('--rate_5xx', type=float, default=0.0, help="Probability of a 500/502/503 per request (default: 0)")
+    parser.add_argument('--retry_after', type=int, default=1, help="Retry-After seconds on 429/503, 0 = omit (default: 1)") # noqa
+    parser.add_argument('--server_rps', type=float, default=0.0, help="Requests/s the server accepts before answering 429 (default: unlimited)") # noqa
+    parser.add_argument('--empty_page_rate', type=float, default=0.0, help="Probability of an empty page with a fresh cursor (default: 0)") # noqa
+    parser.add_argument('--loop_after', type=int, default=0, help="After this many pages, hand back an already-issued cursor (default: never)") # noqa
+    parser.add_argument('--end', type=str, default='same', choices=END_MODES, help="Cursor on the final empty page (default: same)") # noqa
+    parser.add_argument('--verbose', action='store_true', help="Log every request (and, with --bench, the scraper output)")
+    bench = parser.add_argument_group('benchmark')
+    bench.add_argument('--bench', action='store_true', help="Run ReviewScraper against a private instance and report throughput") # noqa
+    bench.add_argument('--app_id', type=str, default='480', help="App ID to scrape (default: 480)")
+    bench.add_argument('--max', type=int, default=2000, help="Reviews to scrape (default: 2000)")
+    bench.add_argument('--num', type=int, default=100, help="Reviews per page (default: 100)")
+    bench.add_argument('--partition', type=str, default="", help="Scraper --partition value (default: none)")
+    bench.add_argument('--filter_by', type=str, default='recent', choices=['all', 'recent', 'updated'], help="Scraper --filter_by (default: recent)") # noqa
+    bench.add_argument('--sleep', type=float, default=0.1, help="Scraper initial seconds between requests (default: 0.1)") # noqa
+    bench.add_argument('--max_rate', type=float, default=0.0, help=f"Override the limiter ceiling in req/s (default: config, {STEAM_RATE_LIMIT['max_rate']})") # noqa
+    bench.add_argument('--json', action='store_true', help="Print the benchmark result as JSON")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    if args.recorded:
+        review_list = load_recorded_reviews(args.recorded)
+        if not review_list: print(f"Error: No reviews in '{args.recorded}'.", file=sys.stderr); sys.exit(1)
+    else: review_list = synthetic_reviews(args.reviews, args.seed)
+    server = MockSteamServer(review_list, host=args.host, port=0 if args.bench else args.port, latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after, server_rps=args.server_rps, empty_page_rate=args.empty_page_rate, loop_after=args.loop_after, end_mode=args.end, seed=args.seed, verbose=args.verbose) # noqa
+    if not args.bench:
+        print(f"Serving {len(review_list)} reviews at {server.base_url} (Ctrl+C to stop)")
+        print(f"Point the scraper at it with: STEAM_STORE_URL={server.base_url}")
+        try: server.serve_forever()
+        except KeyboardInterrupt: print("\nStopped.")
+        finally: server.httpd.server_close()
+        return
+    options = reviews.scrape_options(max=args.max, num=args.num, partition=args.partition, filter_by=args.filter_by, sleep=args.sleep) # noqa
+    with server:
+        try: result = run_benchmark(server, args.app_id, options, args.max_rate or None, quiet=not args.verbose)
+        except reviews.ScrapeAbort as e: print(f"Benchmark aborted: {e}", file=sys.stderr); sys.exit(1)
+    if args.json: print(json.dumps(result, indent=2))
+    else: print_benchmark(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,29 @@
 # process_handler.py
 import subprocess
 import os
+import time
 import shutil
 import re
 import sys
-import io
 import traceback
 import threading
+import json
+import sqlite3
 from tkinter import messagebox
 
 # Assume utils.py and config.py are accessible
 from utils import sanitize_filename
-from utils import log_message
+from utils import log_message, get_selected_model_id
 from config import BASE_REVIEW_DIR
+from reviews import CHECKPOINT_SUFFIX, IDS_SUFFIX, ARCHIVE_SUFFIX, ReviewScraper, ScrapeAbort, scrape_options, rerender_reviews, read_file_header, archive_path_for # noqa
+from optimize import DEFAULT_DEDUPE_THRESHOLD, clean_line
+from cleaned_corpus import TokenPrefixIndex, prefix_path_for
+from response_cache import file_sha256
+from review_store import ReviewStore, store_path_for
+from line_index import LINE_HEADER, line_flags, line_index_path_for, update_line_index
+from token_counter import count_line_tokens
+import game_manifest
+from datetime import datetime
 
 # --- Helper: Get Game Folder Path ---
 # (Keep unchanged - Generally simpler structure)
@@ -40,9 +51,91 @@ def get_game_folder_path(game_name, steam_id, log_func):
         log_func(f"Unexpected error getting game folder path: {e}")
         return None
 
-# --- Subprocess Execution: Scraping ---
+# --- Helpers: Incremental Scraping ---
+def read_scrape_time(reviews_path):
+    """Unix time from the 'Scrape Time:' header line of a saved _reviews.txt (0 if absent)."""
+    try:
+        with open(reviews_path, 'r', encoding='utf-8') as f:
+            for _ in range(12):
+                match = re.match(r'Scrape Time:\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', f.readline())
+                if match: return int(datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp())
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def prepend_to_file(path, data, skip_lines=0):
+    """Rewrites `path` with `data` (bytes) inserted after its first `skip_lines` lines, via a temp file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as dst:
+        if not os.path.exists(path): dst.write(data)
+        else:
+            with open(path, 'rb') as src:
+                for _ in range(skip_lines): dst.write(src.readline())
+                dst.write(data); shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, path)
+
+
+def merge_optimized_reviews(optimized_file, new_lines, token_threshold, log_func, model_id=None, last_optimize=None):
+    """
+    Splices the cleaned new reviews in front of the optimized file's reviews (after its header) and cuts
+    the result at the token threshold, as a fresh "first in file order" run without near-duplicate
+    collapsing would. Any other optimized file (sampled, deduplicated, stripped, or of unknown settings)
+    is left alone with a note to re-run Optimize. Returns the number of new reviews kept.
+    """
+    if not last_optimize or last_optimize.get('sampling') != 'first' or last_optimize.get('dedupe') or last_optimize.get('stripped'): # noqa
+        log_func(f"Incremental: '{os.path.basename(optimized_file)}' was not a plain first-in-order cut; re-run Optimize to include the {len(new_lines)} new reviews.") # noqa
+        return 0
+    with open(optimized_file, 'r', encoding='utf-8') as f: old_lines = f.read().splitlines()
+    header_end = next((n for n, line in enumerate(old_lines) if line_flags(line) != LINE_HEADER), len(old_lines))
+    cleaned_lines = [cleaned for cleaned in map(clean_line, new_lines) if cleaned]
+    lines = old_lines[:header_end] + cleaned_lines + old_lines[header_end:]
+    kept = 0; tokens_used = 0
+    for kept, tokens in enumerate(count_line_tokens(lines, model_id)): # Same threshold rule as optimize.py
+        if tokens_used + tokens > token_threshold: break
+        tokens_used += tokens
+    else: kept = len(lines)
+    tmp_path = optimized_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f: f.writelines(line + "\n" for line in lines[:kept])
+    os.replace(tmp_path, optimized_file)
+    update_line_index(optimized_file)
+    new_kept = max(0, min(kept - header_end, len(cleaned_lines))); dropped = len(old_lines) - header_end - max(0, kept - header_end - len(cleaned_lines)) # noqa
+    log_func(f"Incremental: Added {new_kept}/{len(cleaned_lines)} new reviews to the top of '{os.path.basename(optimized_file)}' (~{tokens_used} tokens)" + # noqa
+             (f", dropping its last {dropped} to stay under the threshold." if dropped else "."))
+    return new_kept
+
+
+def merge_incremental_reviews(new_reviews_file, new_ids_file, target_output_file, target_ids_file, optimized_file, token_threshold, log_func, model_id=None, last_optimize=None): # noqa
+    """
+    Puts the reviews of an incremental scrape (newer than the saved ones) in front of the saved ones:
+    raw lines after the _reviews.txt header, their IDs, raw archive records and review store rows
+    before the saved ones, so the text, sidecars and a re-render all keep newest-first order. Nothing
+    reaches the saved files before this runs, so a failed or cancelled scrape leaves them untouched.
+    The optimized file is updated by merge_optimized_reviews. Returns the number of new reviews.
+    """
+    with open(new_reviews_file, 'rb') as f: new_data = f.read()
+    new_lines = new_data.decode('utf-8').splitlines()
+    if not new_lines: log_func("Incremental: No new reviews."); return 0
+    prepend_to_file(target_output_file, new_data, read_file_header(target_output_file).count('\n'))
+    for new_path, target_path in ((new_ids_file, target_ids_file), (archive_path_for(new_reviews_file), archive_path_for(target_output_file))): # noqa
+        if os.path.exists(new_path):
+            with open(new_path, 'rb') as f: prepend_to_file(target_path, f.read()) # Gzip members concatenate in any order
+    log_func(f"Incremental: Added {len(new_lines)} new reviews to the top of '{os.path.basename(target_output_file)}'.")
+    try: update_line_index(target_output_file, log_func)
+    except OSError as e: log_func(f"Warn: Could not update the line index: {e}")
+    if os.path.exists(store_path_for(target_output_file)) and os.path.exists(store_path_for(new_reviews_file)):
+        try:
+            with ReviewStore(store_path_for(target_output_file)) as store: store.merge_from(store_path_for(new_reviews_file), prepend=True) # noqa
+        except sqlite3.Error as e: log_func(f"Warn: Could not merge into the review store ({e}). Re-render to rebuild it.")
+    if os.path.exists(optimized_file):
+        try: merge_optimized_reviews(optimized_file, new_lines, token_threshold, log_func, model_id, last_optimize)
+        except OSError as e: log_func(f"Warn: Could not update '{os.path.basename(optimized_file)}' ({e}); re-run Optimize.")
+    return len(new_lines)
+
+
+# --- In-Process Execution: Scraping ---
 def run_scraping(root, widgets, settings_func, log_func, stop_event: threading.Event):
-    """Gets inputs, runs reviews.py, handles stop, saves data."""
+    """Gets inputs, runs the ReviewScraper in-process (stop_event cancels it), saves data."""
 
     # --- 1. Input Validation and Path Setup ---
     settings = settings_func()
@@ -61,16 +154,21 @@ def run_scraping(root, widgets, settings_func, log_func, stop_event: threading.E
     if not game_folder_path:
         return False # Error logged by helper
 
-    script_path = 'reviews.py'
-    temp_output_file = 'reviews.txt' # Created by reviews.py
     folder_basename = os.path.basename(game_folder_path)
-    target_output_file = os.path.join(game_folder_path, f"{folder_basename}_reviews.txt") # Final destination
+    target_output_file = os.path.join(game_folder_path, f"{folder_basename}_reviews.txt") # Written in place by the scraper
+    target_checkpoint_file = target_output_file + CHECKPOINT_SUFFIX # Written after every batch, kept with a partial result for resume # noqa
+    target_ids_file = target_output_file + IDS_SUFFIX # Lets incremental runs stop at the newest saved review
+    target_archive_file = target_output_file + ARCHIVE_SUFFIX # Raw reviews from every scrape of this game, for re-rendering # noqa
+    target_optimized_file = os.path.join(game_folder_path, f"{folder_basename}_reviews_optimized.txt")
+    new_reviews_file = os.path.join(game_folder_path, f"{folder_basename}_reviews_new.txt") # Incremental output, merged on success # noqa
+    resume_scrape = False
+    incremental_scrape = False
 
     log_func(f"Starting scraping for App ID: {steam_app_id} ('{game_name}')...")
     # (Simplified logging calls slightly)
     log_func(f"Target: {os.path.basename(game_folder_path)}")
     log_func(f"Settings: Max={settings.get('max_reviews','N/A')}, #/Pg={settings.get('num_per_page','N/A')}, Sleep={settings.get('sleep_duration','N/A')}s")
-    log_func(f"Filters: Lang={settings.get('steam_language','N/A')}, Type={settings.get('steam_review_type','N/A')}, Purch={settings.get('steam_purchase_type','N/A')}, Date={settings.get('steam_date_range','N/A')}, Play={settings.get('steam_playtime','N/A')}, By={settings.get('steam_filter_by','N/A')}, Beta={settings.get('steam_beta','N/A')}")
+    log_func(f"Filters: Lang={settings.get('steam_language','N/A')}, Type={settings.get('steam_review_type','N/A')}, Purch={settings.get('steam_purchase_type','N/A')}, Date={settings.get('steam_date_range','N/A')}, Play={settings.get('steam_playtime','N/A')}, By={settings.get('steam_filter_by','N/A')}, Beta={settings.get('steam_beta','N/A')}, Partitions={settings.get('scrape_partitions') or 'None'}")
 
     # --- 2. GUI Progress Setup ---
     progress_bar = widgets.get('progress_bar')
@@ -86,17 +184,34 @@ def run_scraping(root, widgets, settings_func, log_func, stop_event: threading.E
     except Exception as gui_e: log_func(f"Warn: Error setting progress display: {gui_e}")
 
     # --- 3. State Variables ---
-    process = None
-    success_flag = False # True only on successful completion AND move
-    stderr_output = ""
-    return_code = -99 # Default/initial code
+    success_flag = False # True only on successful completion (and merge, for incremental runs)
+    error_message = ""
+    cancelled = False
 
     # --- 4. Main Execution Block (Outer Try/Finally for Cleanup) ---
     try:
         # --- 4a. Pre-run Checks & Setup ---
-        if not os.path.exists(script_path):
-            log_func(f"Error: Script missing: {script_path}"); messagebox.showerror("File Error", f"Script missing: {script_path}"); return False # noqa
-        if os.path.exists(target_output_file):
+        incremental_since = 0
+        if settings.get('scrape_incremental'):
+            if not os.path.exists(target_output_file): log_func("Incremental: No saved reviews yet, running a full scrape.")
+            elif os.path.exists(target_checkpoint_file): log_func("Incremental: Saved reviews are a partial scrape, resume or redo it first.")
+            else:
+                incremental_scrape = True
+                if not os.path.exists(target_ids_file): incremental_since = read_scrape_time(target_output_file) # Saved before ID sidecars existed # noqa
+                if not os.path.exists(target_ids_file) and not incremental_since:
+                    log_func("Incremental: No review IDs or Scrape Time for the saved file."); messagebox.showwarning("Incremental", "Cannot tell which reviews are already saved.\nUntick Incremental Update for a full scrape."); return False # noqa
+                log_func(f"Incremental: Fetching reviews newer than '{os.path.basename(target_output_file)}'.")
+        if not incremental_scrape and os.path.exists(target_output_file) and os.path.exists(target_checkpoint_file):
+            try:
+                with open(target_checkpoint_file, 'r', encoding='utf-8') as f: resume_total = json.load(f).get('total_fetched', '?') # noqa
+            except (OSError, ValueError) as ck_e: log_func(f"Warn: Unreadable checkpoint: {ck_e}"); resume_total = '?' # noqa
+            choice = messagebox.askyesnocancel("Resume?", f"'{os.path.basename(target_output_file)}' is a partial scrape ({resume_total} reviews).\nResume it from the last checkpoint?\n\n(No = start over)") # noqa
+            if choice is None: log_func("Scraping cancelled (resume prompt)."); return False
+            if choice: resume_scrape = True; log_func(f"Resuming partial scrape ({resume_total} reviews).")
+            else:
+                try: os.remove(target_checkpoint_file); log_func("Discarded old checkpoint.")
+                except OSError as r: log_func(f"Warn: Remove checkpoint fail: {r}")
+        if os.path.exists(target_output_file) and not resume_scrape and not incremental_scrape:
             overwrite = messagebox.askyesno("Exists", f"'{os.path.basename(target_output_file)}' exists.\nOverwrite?", icon='warning') # noqa
             if not overwrite: log_func("Scraping cancelled (overwrite)."); return False
             else:
@@ -105,193 +220,84 @@ def run_scraping(root, widgets, settings_func, log_func, stop_event: threading.E
                     os.remove(target_output_file)
                 except OSError as r:
                     log_func(f"Warn: Remove fail: {r}") # noqa
-        if os.path.exists(temp_output_file):
-             try: os.remove(temp_output_file); log_func(f"Removed old temp: '{temp_output_file}'.");
-             except OSError as r: log_func(f"Warn: Could not remove temp: {r}")
 
-        # --- 4b. Build Command ---
-        command = [ sys.executable, script_path, '--max', str(settings.get('max_reviews', 1000)), '--sleep', str(settings.get('sleep_duration', 1.5)), '--num', str(settings.get('num_per_page', 100)), '--language', settings.get('steam_language', 'all'), '--review_type', settings.get('steam_review_type', 'all'), '--purchase_type', settings.get('steam_purchase_type', 'all'), '--day_range', settings.get('steam_date_range', '0'), '--playtime', settings.get('steam_playtime', '0'), '--filter_by', settings.get('steam_filter_by', 'all'), '--beta', settings.get('steam_beta', '0') ] # noqa
-        log_func(f"Running: {' '.join(command)}")
+        # --- 4b. Build Scraper ---
+        output_file = new_reviews_file if incremental_scrape else target_output_file
+        options = scrape_options(max=int(settings.get('max_reviews', 1000)), sleep=float(settings.get('sleep_duration', 1.5)), num=int(settings.get('num_per_page', 100)), language=settings.get('steam_language', 'all'), review_type=settings.get('steam_review_type', 'all'), purchase_type=settings.get('steam_purchase_type', 'all'), day_range=settings.get('steam_date_range', '0'), playtime=settings.get('steam_playtime', '0'), filter_by=settings.get('steam_filter_by', 'all'), beta=settings.get('steam_beta', '0'), partition=settings.get('scrape_partitions', ''), resume=resume_scrape, incremental=incremental_scrape, known_ids=target_ids_file if incremental_scrape and os.path.exists(target_ids_file) else "", since=incremental_since, archive="" if incremental_scrape else target_archive_file) # Incremental: next to the _new file until merged # noqa
+        try: scraper = ReviewScraper(steam_app_id, options, output_file, cancel_event=stop_event)
+        except ScrapeAbort as e_start: log_func(f"Error starting scraper: {e_start}"); messagebox.showerror("Scraping Error", f"Cannot start:\n{e_start}"); return False # noqa
+        log_func(f"Scraping in-process to '{os.path.basename(output_file)}' ({len(scraper.partitions)} chain{'s' if len(scraper.partitions) != 1 else ''}).") # noqa
 
-        # --- 4c. Start Subprocess ---
-        try:
-            script_dir = os.path.dirname(sys.argv[0]) or '.'
-            creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            process = subprocess.Popen( command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding=None, cwd=script_dir, creationflags=creationflags) # noqa
-        except FileNotFoundError as fnf: log_func(f"Error starting: {fnf}"); messagebox.showerror("Exec Error", f"Not Found:\n{fnf}"); return False # noqa
-        except Exception as popen_e: log_func(f"Error starting: {popen_e}"); messagebox.showerror("Exec Error", f"Failed start:\n{popen_e}"); return False # noqa
+        # --- 4c. Consume Events ---
+        for event in scraper.events():
+            if event['type'] == 'progress':
+                current_reviews_scraped = event['total']
+                progress_val = min(1.0, current_reviews_scraped / max_reviews_target) if max_reviews_target > 0 else 0 # noqa
+                log_func(f"Batch {event['batch']}" + (f" [{event['partition']}]" if event['partition'] != '*' else "") + f": +{event['written']} (Total: {event['total']}/{event['max']}, {event['rate']:.2f} req/s)") # noqa
+                def _update_gui(val, prog, rate): # Inner func for clarity
+                    try:
+                        if progress_label and progress_label.winfo_exists(): progress_label.configure(text=f"Scraping: {val} / {max_reviews_target} @ {rate:.2f} req/s"); # noqa
+                        if progress_bar and progress_bar.winfo_exists(): progress_bar.set(prog); # noqa
+                    except Exception: pass # Ignore GUI errors in callback
+                if root and root.winfo_exists(): root.after(0, _update_gui, current_reviews_scraped, progress_val, event['rate']) # noqa
+            elif event['type'] == 'stats':
+                log_func("Pipeline: " + ", ".join(f"{stage} {c['reviews']} reviews busy {c['busy']:.1f}s" + (f" (paced {c['paced']:.1f}s)" if c['paced'] else "") for stage, c in event['stages'].items()) + f"; bottleneck: {event['bottleneck']}") # noqa
+            elif event['type'] == 'done':
+                cancelled = event['cancelled']
+                if event['hit_iteration_cap'] and event['total'] < max_reviews_target: log_func("Warn: Max iterations reached on a cursor chain.") # noqa
+                log_func(f"Scraper finished: {event['total']} reviews written" + (" (stopped)." if cancelled else "."))
+            elif event['type'] == 'error':
+                error_message = event['message']; log_func(f"Scraping failed: {error_message}")
 
-        # --- 4d. Send Input ---
-        try:
-            if process.stdin: app_id_bytes = (steam_app_id + "\n").encode('utf-8'); process.stdin.write(app_id_bytes); process.stdin.close(); # noqa
-            else: raise OSError("Process stdin unavailable.")
-        except (OSError, ValueError, TypeError) as stdin_e:
-             log_func(f"Error writing stdin: {stdin_e}")
-             if process and process.poll() is None:
-                 try:
-                     process.kill()
-                     process.wait(timeout=5)
-                 except Exception:
-                     pass  # noqa
-             messagebox.showerror("Exec Error", "Failed send ID.")
-             return False
-
-        # --- 4e. Monitor Output & Stop Event ---
-        if process.stdout:
-            try:
-                stdout_reader = io.TextIOWrapper(process.stdout, encoding='utf-8', errors='replace')
-                while True:
-                    if stop_event.is_set():
-                        log_func("Stop request. Terminating script...")
-                        success_flag = False # Mark as stopped
-                        if process and process.poll() is None:
-                            try:
-                                process.terminate()
-                                _, stderr_data = process.communicate(timeout=10) # Try get final stderr
-                                if stderr_data: stderr_output += stderr_data.decode('utf-8', errors='replace')
-                            except subprocess.TimeoutExpired:
-                                log_func("Terminate timed out, killing.");
-                                if process and process.poll() is None:
-                                    try:
-                                        process.kill()
-                                        _, stderr_data = process.communicate(timeout=5)
-                                    except Exception:
-                                        pass # noqa
-                            except Exception as e_term:
-                                log_func(f"Error stopping: {e_term}")
-                                if process and process.poll() is None:
-                                    try:
-                                        process.kill()
-                                    except Exception:
-                                        pass # noqa
-                        log_func("Scraping stopped by user.")
-                        messagebox.showinfo("Stopped", "Scraping stopped.")
-                        break # Exit read loop
-
-                    line = stdout_reader.readline()
-                    if not line and process.poll() is not None: break # Process ended
-
-                    if line:
-                        line_strip = line.strip(); log_func(f"SCRIPT: {line_strip}"); # noqa
-                        # --- UPDATED PROGRESS REGEX ---
-                        match = re.search(r'Total written:\s*(\d+)', line_strip, re.IGNORECASE) # Match the actual output from reviews.py
-                        if match:
-                            try:
-                                current_reviews_scraped = int(match.group(1))
-                                progress_val = min(1.0, current_reviews_scraped / max_reviews_target) if max_reviews_target > 0 else 0 # noqa
-                                def _update_gui(val, prog): # Inner func for clarity
-                                    try:
-                                        if progress_label and progress_label.winfo_exists(): progress_label.configure(text=f"Scraping: {val} / {max_reviews_target}"); # noqa
-                                        if progress_bar and progress_bar.winfo_exists(): progress_bar.set(prog); # noqa
-                                    except Exception: pass # Ignore GUI errors in callback
-                                if root and root.winfo_exists(): root.after(0, _update_gui, current_reviews_scraped, progress_val) # noqa
-                            except Exception as e_prog: log_func(f"Warn: Progress error: {e_prog}")
-            except Exception as read_e: log_func(f"Error reading output: {read_e}")
-        else: log_func("Error: stdout unavailable.")
-
-        # --- 4f. Final Wait & Status Check (if not stopped) ---
-        return_code = process.poll() if process else -100
-        if not stop_event.is_set() and return_code is None:
-            log_func("Waiting for script completion...")
-            try:
-                 _, stderr_data = process.communicate(timeout=300) # 5 min final wait
-                 return_code = process.returncode
-                 if stderr_data: stderr_output += stderr_data.decode('utf-8', errors='replace')
-            except subprocess.TimeoutExpired:
-                 log_func("Warn: Timeout on final wait."); return_code = -1;
-                 if process and process.poll() is None:
-                     try:
-                         process.kill()
-                         process.wait(timeout=5)
-                     except Exception:
-                         pass  # noqa
-                 messagebox.showerror("Timeout", "Script timed out.")
-            except Exception as wait_e:
-                 log_func(f"Error on final wait: {wait_e}")
-                 return_code = -2
-                 if process and process.poll() is None:
-                     try:
-                         process.kill()
-                         process.wait(timeout=5)
-                     except Exception:
-                         pass  # noqa
-        elif stop_event.is_set():
-             if process: return_code = process.poll(); # Get final code if possible
-             log_func(f"Stopped, final code: {return_code}")
-             success_flag = False # Ensure false
-
-        # --- 4g. Process Final Result ---
-        if stderr_output: log_func("Script Errors/Warnings (Final):\n---\n" + stderr_output.strip() + "\n---") # noqa
-
-        if not stop_event.is_set(): # Only process success/fail if not stopped
-            if return_code == 0:
-                log_func("Script OK (Code 0).")
-                if os.path.exists(temp_output_file):
-                    try: # Move successful result
-                        os.makedirs(os.path.dirname(target_output_file), exist_ok=True)
-                        shutil.move(temp_output_file, target_output_file)
-                        log_func(f"Saved result: '{os.path.basename(target_output_file)}'.")
-                        success_flag = True
-                        def _final_gui(count): # Inner func for callback
-                            try:
-                                if progress_label and progress_label.winfo_exists(): progress_label.configure(text=f"Scraped: {count}"); # noqa
-                                if progress_bar and progress_bar.winfo_exists(): progress_bar.set(1.0); # noqa
-                            except Exception: pass
-                        if root and root.winfo_exists(): root.after(0, _final_gui, current_reviews_scraped)
-                    except Exception as e_move: log_func(f"Error moving result: {e_move}"); messagebox.showerror("File Error", f"Save fail:\n{e_move}"); success_flag = False; # noqa
-                else: # Script OK but no temp file
-                    log_func(f"Warn: Script OK but temp missing: {temp_output_file}"); success_flag = False; # noqa
-                    if not stderr_output.strip(): messagebox.showwarning("Warn", "Script OK, output missing.");
-            else: # Script failed (non-zero code)
-                 log_func(f"Script failed (Code: {return_code})."); success_flag = False;
-                 snip = stderr_output.strip()[:200] + ('...' if len(stderr_output.strip()) > 200 else ''); messagebox.showerror("Error", f"Script failed (Code: {return_code}).\n{snip}"); # noqa
-
-        # --- 4h. Save Partial File (if needed) ---
-        if not success_flag and os.path.exists(temp_output_file):
-            log_func(f"Not successful (Stopped/Error: {return_code}). Saving partial data...")
-            try:
-                os.makedirs(os.path.dirname(target_output_file), exist_ok=True)
-                shutil.copyfile(temp_output_file, target_output_file) # Use copy
-                log_func(f"Saved partial: '{os.path.basename(target_output_file)}'.")
-                if stop_event.is_set(): messagebox.showinfo("Partial Saved", f"Stopped.\nPartial data saved:\n{os.path.basename(target_output_file)}") # noqa
-                else: messagebox.showwarning("Partial Saved", f"Failed.\nPartial data saved:\n{os.path.basename(target_output_file)}") # noqa
-            except Exception as e_copy: log_func(f"Error saving partial: {e_copy}"); messagebox.showerror("File Error", f"Save partial fail:\n{e_copy}"); # noqa
+        # --- 4d. Process Final Result ---
+        if cancelled:
+            log_func("Scraping stopped by user.")
+        elif error_message:
+            messagebox.showerror("Scraping Error", f"Scraping failed:\n{error_message}")
+        elif not os.path.exists(output_file):
+            log_func(f"Warn: Scraper finished but output missing: {output_file}"); messagebox.showwarning("Warn", "Scraper finished, output missing.") # noqa
+        else:
+            if incremental_scrape:
+                current_reviews_scraped = merge_incremental_reviews(new_reviews_file, new_reviews_file + IDS_SUFFIX, target_output_file, target_ids_file, target_optimized_file, settings.get('token_threshold', 950000), log_func, get_selected_model_id(widgets), game_manifest.load(game_folder_path).get('last_optimize')) # noqa
+            else:
+                log_func(f"Saved result: '{os.path.basename(target_output_file)}'.")
+            success_flag = True
+            def _final_gui(count): # Inner func for callback
+                try:
+                    if progress_label and progress_label.winfo_exists(): progress_label.configure(text=f"Scraped: {count}"); # noqa
+                    if progress_bar and progress_bar.winfo_exists(): progress_bar.set(1.0); # noqa
+                except Exception: pass
+            if root and root.winfo_exists(): root.after(0, _final_gui, current_reviews_scraped)
+
+        # --- 4e. Partial Result (if needed) ---
+        if not success_flag and incremental_scrape:
+            # Newest-first partial results would leave a gap the next refresh can't see, so keep the saved files as they were # noqa
+            log_func("Not successful. Incremental results discarded, saved reviews unchanged.")
+        elif not success_flag and os.path.exists(target_output_file):
+            has_checkpoint = os.path.exists(target_checkpoint_file)
+            log_func(f"Kept partial: '{os.path.basename(target_output_file)}'" + (" (scrape can be resumed)." if has_checkpoint else ".")) # noqa
+            if cancelled: messagebox.showinfo("Partial Saved", f"Stopped.\nPartial data saved:\n{os.path.basename(target_output_file)}") # noqa
+            else: messagebox.showwarning("Partial Saved", f"Failed.\nPartial data saved:\n{os.path.basename(target_output_file)}") # noqa
+
+        # --- 4f. Game Manifest (browser, token display) ---
+        if success_flag or (not incremental_scrape and os.path.exists(target_output_file)):
+            scrape_settings = {name: value for name, value in vars(options).items() if name not in ('resume', 'incremental', 'known_ids', 'since', 'archive')} # noqa
+            game_manifest.record_scrape(game_folder_path, game_name, steam_app_id, scrape_settings, current_reviews_scraped, incremental_scrape, success_flag, log_func) # noqa
         # --- End Result Processing ---
 
     # --- Outer Exception Handling ---
     except Exception as e_outer:
         log_func(f"Outer error: {e_outer}\n{traceback.format_exc()}"); success_flag = False;
         messagebox.showerror("Error", f"Unexpected error:\n{e_outer}");
-        if process and process.poll() is None:
-            try:
-                process.kill()
-                process.wait(timeout=5)
-            except Exception:
-                pass  # noqa
 
     # --- 5. Final Cleanup Block ---
     finally:
-        # Close streams if process exists (defensive)
-        if process:
-            try:
-                if process.stdin and not process.stdin.closed: process.stdin.close()
-                if process.stdout and not process.stdout.closed: process.stdout.close()
-                if process.stderr and not process.stderr.closed: process.stderr.close()
-            except Exception: pass # Ignore cleanup errors
-
-        # Clean temp file logic (remove if full success OR if partial was saved)
-        should_remove_temp = False
-        if os.path.exists(temp_output_file):
-             if success_flag or os.path.exists(target_output_file): # If full success OR partial save worked
-                  should_remove_temp = True
-                  reason = "(after success/partial save)"
-             else:
-                  should_remove_temp = True # Also remove if neither full nor partial saved
-                  reason = "(no target created)"
-
-             if should_remove_temp:
-                 try: os.remove(temp_output_file); log_func(f"Cleaned temp: '{temp_output_file}' {reason}.");
-                 except OSError as e: log_func(f"Warn: Remove temp fail: {e}")
+        # Incremental output only lives until it is merged (or discarded)
+        if incremental_scrape:
+            for new_file in (new_reviews_file, new_reviews_file + IDS_SUFFIX, new_reviews_file + CHECKPOINT_SUFFIX, store_path_for(new_reviews_file), line_index_path_for(new_reviews_file), archive_path_for(new_reviews_file)): # noqa
+                if os.path.exists(new_file):
+                    try: os.remove(new_file)
+                    except OSError as e: log_func(f"Warn: Remove '{os.path.basename(new_file)}' fail: {e}")
 
         # Reset progress display (scheduled)
         def reset_prog_gui():
@@ -310,8 +316,48 @@ def run_scraping(root, widgets, settings_func, log_func, stop_event: threading.E
 
     return success_flag
 
+# --- Re-render from Raw Archive ---
+def run_rerender(widgets, log_func):
+    """Rebuilds the game's _reviews.txt (and its review store) from its raw archive with the current formatting (no network)."""
+    game_name = ""; steam_app_id = ""
+    try:
+        entry_name = widgets.get('game_name_entry'); entry_id = widgets.get('steam_id_entry')
+        if entry_name: game_name = entry_name.get().strip()
+        if entry_id: steam_app_id = entry_id.get().strip()
+    except Exception as e:
+        log_func(f"Error getting re-render ID: {e}"); messagebox.showwarning("Input Error", "Failed to read input."); return False # noqa
+    if not game_name or not steam_app_id or not steam_app_id.isdigit(): messagebox.showwarning("Input Error", "Game/ID req."); return False # noqa
+    game_folder_path = get_game_folder_path(game_name, steam_app_id, log_func)
+    if not game_folder_path: return False
+    folder_base = os.path.basename(game_folder_path); target = os.path.join(game_folder_path, f"{folder_base}_reviews.txt") # noqa
+    if not os.path.exists(target + ARCHIVE_SUFFIX):
+        log_func(f"Re-render: No raw archive for '{folder_base}' (scrape once to create it)."); messagebox.showwarning("Missing", f"Raw archive missing:\n{os.path.basename(target + ARCHIVE_SUFFIX)}"); return False # noqa
+    if os.path.exists(target + CHECKPOINT_SUFFIX):
+        log_func("Re-render: Saved reviews are a partial scrape, resume or redo it first."); messagebox.showwarning("Partial Scrape", "Finish or redo the partial scrape before re-rendering."); return False # noqa
+    if os.path.exists(target) and not messagebox.askyesno("Re-render", f"Regenerate '{os.path.basename(target)}' from the raw archive?\n(Existing text is replaced; the header is kept.)", icon='warning'): # noqa
+        log_func("Re-render cancelled."); return False
+    try: written = rerender_reviews(target)
+    except (ScrapeAbort, OSError) as e: log_func(f"Re-render failed: {e}"); messagebox.showerror("Re-render Error", f"Re-render failed:\n{e}"); return False # noqa
+    log_func(f"Re-rendered {written} reviews into '{os.path.basename(target)}' and its review store. Run Optimize to refresh the optimized file.") # noqa
+    game_manifest.record_files(game_folder_path, ('reviews',), log_func)
+    return True
+
 # --- Subprocess Execution: Optimization ---
-# (Keep unchanged - Structure is simpler)
+def cut_from_corpus(src, corpus, target, threshold, model_id, log_func, dedupe_threshold=None):
+    """
+    Writes the optimized file by cutting the game's cleaned corpus at `threshold` (cleaned_corpus.py)
+    if the corpus was made from the current `src` with the same near-duplicate setting (None: kept).
+    False if a full run is needed.
+    """
+    prefix_index = TokenPrefixIndex.load(corpus)
+    if prefix_index is None or not prefix_index.matches(file_sha256(src), dedupe_threshold): return False
+    started = time.perf_counter()
+    try: lines, tokens = prefix_index.write_cut(target, threshold, model_id)
+    except OSError as e: log_func(f"Warn: Cut from cleaned corpus failed ({e}), running the optimizer."); return False
+    log_func(f"Cut '{os.path.basename(target)}' from the cleaned corpus: {lines:,} of {len(prefix_index):,} lines, ~{tokens:,} tokens ({(time.perf_counter() - started) * 1000:.0f} ms, no re-cleaning).") # noqa
+    return True
+
+
 def run_optimization(widgets, settings_func, log_func):
     settings = settings_func(); game_name = ""; steam_app_id = "";
     try:
@@ -328,7 +374,7 @@ def run_optimization(widgets, settings_func, log_func):
     if not game_name or not steam_app_id or not steam_app_id.isdigit(): messagebox.showwarning("Input Error", "Game/ID req."); return False; # noqa
     game_folder_path = get_game_folder_path(game_name, steam_app_id, log_func); # noqa
     if not game_folder_path: return False
-    folder_base = os.path.basename(game_folder_path); src = os.path.join(game_folder_path, f"{folder_base}_reviews.txt"); target = os.path.join(game_folder_path, f"{folder_base}_reviews_optimized.txt"); s_dir = os.path.dirname(sys.argv[0]) or '.'; tmp_in = os.path.join(s_dir, "reviews.txt"); tmp_out = os.path.join(s_dir, "reviews2.txt"); s_path = os.path.join(s_dir, 'optimize.py'); ok = False; stdout = ""; stderr = ""; # noqa
+    folder_base = os.path.basename(game_folder_path); src = os.path.join(game_folder_path, f"{folder_base}_reviews.txt"); target = os.path.join(game_folder_path, f"{folder_base}_reviews_optimized.txt"); s_dir = os.path.dirname(sys.argv[0]) or '.'; tmp_in = os.path.join(s_dir, "reviews.txt"); tmp_out = os.path.join(s_dir, "reviews2.txt"); corpus = os.path.join(game_folder_path, f"{folder_base}_reviews_cleaned.txt"); tmp_corpus = os.path.join(s_dir, "reviews_cleaned.txt"); s_path = os.path.join(s_dir, 'optimize.py'); ok = False; stdout = ""; stderr = ""; # noqa
     if not os.path.exists(src): log_func(f"Opt Err: Src missing: {os.path.basename(src)}"); messagebox.showwarning("Missing", f"Scraped file missing:\n{os.path.basename(src)}"); return False; # noqa
     if os.path.exists(target):
         ow = messagebox.askyesno("Exists", f"'{os.path.basename(target)}' exists.\nOverwrite?", icon='warning')  # noqa
@@ -341,6 +387,9 @@ def run_optimization(widgets, settings_func, log_func):
                 os.remove(target)
             except OSError as r:
                 log_func(f"Warn: Rem fail: {r}")  # noqa
+    thr = settings.get('token_threshold', 950000); model_id = get_selected_model_id(widgets); sampling = settings.get('optimize_sampling', 'first'); dedupe_threshold = DEFAULT_DEDUPE_THRESHOLD if settings.get('optimize_dedupe') else None # noqa
+    if sampling == 'first' and cut_from_corpus(src, corpus, target, thr, model_id, log_func, dedupe_threshold): # Same threshold rule as optimize.py # noqa
+        game_manifest.record_optimize(game_folder_path, thr, model_id, sampling, bool(dedupe_threshold), log_func); return True
     log_func("Optimizing...")
     try:  # Prep temp
         if os.path.exists(tmp_in): os.remove(tmp_in);
@@ -350,7 +399,7 @@ def run_optimization(widgets, settings_func, log_func):
     proc = None
     try: # Run subprocess
         if not os.path.exists(s_path): log_func(f"Error: Opt script missing: {s_path}"); messagebox.showerror("Error", f"'{os.path.basename(s_path)}' missing."); return False; # noqa
-        thr = settings.get('token_threshold', 950000); log_func(f"Token Thr: {thr}"); cmd = [sys.executable, s_path, '--threshold', str(thr)]; log_func(f"Run: {' '.join(cmd)}"); # noqa
+        log_func(f"Token Thr: {thr}"); cmd = [sys.executable, s_path, '--threshold', str(thr)]; cmd += ['--model', model_id] if model_id else []; cmd += ['--sampling', sampling]; cmd += [] if dedupe_threshold else ['--no_dedupe']; cmd += ['--corpus', os.path.basename(tmp_corpus)] if sampling == 'first' else []; log_func(f"Run: {' '.join(cmd)}"); # noqa
         try: # Popen
             cf = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0; proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace', cwd=s_dir, creationflags=cf); # noqa
         except FileNotFoundError as f: log_func(f"Error start opt: {f}"); messagebox.showerror("Error", f"Not Found:\n{f}"); return False; # noqa
@@ -388,6 +437,13 @@ def run_optimization(widgets, settings_func, log_func):
                 try: os.makedirs(os.path.dirname(target), exist_ok=True); shutil.move(tmp_out, target); log_func(f"Saved opt: '{os.path.basename(target)}'."); ok = True; # noqa
                 except OSError as m: log_func(f"Error move opt: {m}"); messagebox.showerror("File Error", f"Save fail:\n{m}"); # noqa
                 except Exception as e: log_func(f"Error move opt: {e}"); messagebox.showerror("Error", f"Final fail:\n{e}"); # noqa
+                if ok and os.path.exists(line_index_path_for(tmp_out)): # Written by optimize.py alongside its output
+                    try: shutil.move(line_index_path_for(tmp_out), line_index_path_for(target))
+                    except OSError as m: log_func(f"Warn: Move line index fail: {m}")
+                if ok and os.path.exists(prefix_path_for(tmp_corpus)): # Complete corpus: later thresholds are cut from it
+                    try: shutil.move(tmp_corpus, corpus); shutil.move(prefix_path_for(tmp_corpus), prefix_path_for(corpus)); log_func(f"Saved cleaned corpus: '{os.path.basename(corpus)}'.") # noqa
+                    except OSError as m: log_func(f"Warn: Move cleaned corpus fail: {m}")
+                if ok: game_manifest.record_optimize(game_folder_path, thr, model_id, sampling, bool(dedupe_threshold), log_func)
             else:
                 log_func(f"Warn: Opt OK but tmp out miss: {os.path.basename(tmp_out)}")
                 if not stderr.strip():
@@ -415,6 +471,10 @@ def run_optimization(widgets, settings_func, log_func):
                     log_func("Cleaned tmp out (operation failed).")
                 except OSError as e:
                     log_func(f"Warn: Rem tmp out fail: {e}") # noqa
+        for leftover in (line_index_path_for(tmp_out), tmp_corpus, prefix_path_for(tmp_corpus)): # Left behind when the output was not saved # noqa
+            if os.path.exists(leftover):
+                try: os.remove(leftover)
+                except OSError as e: log_func(f"Warn: Rem '{os.path.basename(leftover)}' fail: {e}")
 
 
     return ok
\ No newline at end of file
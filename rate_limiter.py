@@ -0,0 +1,103 @@
+# rate_limiter.py
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from config import STEAM_RATE_LIMIT
+
+THROTTLE_STATUS_CODES = (429, 503) # Statuses Steam uses to ask clients to slow down
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date); None if absent/invalid."""
+    if not value: return None
+    value = value.strip()
+    if value.isdigit(): return float(value)
+    try: return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError): return None
+
+
+class RateLimiter:
+    """
+    Token bucket whose refill rate is steered by AIMD: every successful response adds
+    `increase` req/s (up to `max_rate`), every throttling signal or server error multiplies the
+    rate by `decrease` (down to `min_rate`). A Retry-After hint additionally blocks all callers
+    until it has passed. Thread-safe; `acquire` blocks a thread, `acquire_async` suspends a task.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, increase, decrease, burst):
+        self.min_rate = min_rate; self.max_rate = max_rate; self.increase = increase; self.decrease = decrease; self.burst = burst; # noqa
+        self.initial_rate = rate
+        self.rate = min(max_rate, max(min_rate, rate))
+        self._tokens = 1.0; self._updated = time.monotonic(); self._blocked_until = 0.0; self._lock = threading.Lock(); # noqa
+
+    def _reserve(self):
+        """Takes one token (possibly on credit) and returns how long the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate); self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate, self._blocked_until - now)
+
+    def reset(self, rate=None):
+        """Starts over at `rate` (default: the initial rate), dropping what earlier throttling taught it; a pending Retry-After still holds.""" # noqa
+        with self._lock:
+            if rate: self.initial_rate = rate
+            self.rate = min(self.max_rate, max(self.min_rate, self.initial_rate))
+            self._tokens = 1.0; self._updated = time.monotonic()
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0: time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0: await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock: self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """Multiplicative decrease; honours the server's Retry-After hint when given. Returns the pause in seconds.""" # noqa
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0) # No burst straight after a throttle
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            return pause
+
+    def on_error(self):
+        with self._lock: self.rate = max(self.min_rate, self.rate * self.decrease)
+
+    def observe(self, response):
+        """Feeds one HTTP response into the controller. Returns True if it was a throttling response."""
+        if response.status_code in THROTTLE_STATUS_CODES:
+            self.on_throttle(parse_retry_after(response.headers.get('Retry-After'))); return True
+        if response.status_code < 400: self.on_success() # Errors are reported through on_error by the caller
+        return False
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate
+
+    def describe(self):
+        return f"{self.rate:.2f} req/s"
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name='steam', rate=None):
+    """
+    Process-wide limiter for one host, created from STEAM_RATE_LIMIT on first use so every
+    Steam caller in the process shares the same budget. `rate` (req/s) only seeds a new limiter;
+    use reset(rate) to restart an existing one (ReviewScraper.run does, from --sleep).
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            settings = dict(STEAM_RATE_LIMIT)
+            if rate: settings['rate'] = rate
+            _limiters[name] = RateLimiter(**settings)
+        return _limiters[name]
@@ -0,0 +1,141 @@
+# response_cache.py
+"""
+Content-addressed cache of AI answers: sending the same query with the same model over the same review
+file returns the stored answer instantly instead of paying for (and waiting on) the request again.
+
+An entry's key is a SHA-256 over the model ID, the fully rendered prompt(s), the input file's content
+hash and the generationConfig. Entries live in AI_CACHE_DIR as <key>.json and hold the raw response
+JSON(s) plus the parsed text and CSV rows; index.json maps keys to (game folder, model, query) so that
+file_handler.load_existing_data can find the answer for the current query without reading every entry.
+The directory is capped at AI_CACHE_MAX_BYTES, evicting the least recently used entries first (an
+entry's mtime is its last use).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import AI_CACHE_DIR, AI_CACHE_MAX_BYTES
+
+INDEX_FILENAME = 'index.json'
+ENTRY_SUFFIX = '.json'
+
+_lock = threading.Lock()
+_file_hashes = {} # (abspath, size, mtime_ns) -> sha256 hex
+
+
+def file_sha256(path):
+    """Content hash of a file, cached per (path, size, mtime) so repeated sends do not re-read it."""
+    st = os.stat(path); signature = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        if signature in _file_hashes: return _file_hashes[signature]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    with _lock:
+        for stale in [k for k in _file_hashes if k[0] == signature[0]]: del _file_hashes[stale]
+        _file_hashes[signature] = digest.hexdigest()
+    return _file_hashes[signature]
+
+
+def cache_key(model_id, prompts, input_sha256, generation_config):
+    """Key of one answer; `prompts` is the rendered prompt, or every prompt of a multi-request answer."""
+    digest = hashlib.sha256()
+    header = {'model_id': model_id, 'input_sha256': input_sha256, 'generationConfig': generation_config}
+    digest.update(json.dumps(header, sort_keys=True).encode('utf-8'))
+    for prompt in ([prompts] if isinstance(prompts, str) else prompts):
+        digest.update(b'\0'); digest.update(prompt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, key + ENTRY_SUFFIX)
+
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILENAME), 'r', encoding='utf-8') as f: index = json.load(f)
+        if isinstance(index, dict): return index
+    except (OSError, ValueError): pass
+    return _rebuild_index(cache_dir)
+
+
+def _rebuild_index(cache_dir):
+    """Index from the entries themselves (first use, or index.json lost)."""
+    index = {}
+    try: names = os.listdir(cache_dir)
+    except OSError: return index
+    for name in names:
+        if not name.endswith(ENTRY_SUFFIX) or name == INDEX_FILENAME: continue
+        try:
+            with open(os.path.join(cache_dir, name), 'r', encoding='utf-8') as f: entry = json.load(f)
+            index[name[:-len(ENTRY_SUFFIX)]] = {k: entry.get(k) for k in ('game_folder', 'model_id', 'query', 'input_sha256', 'created')} # noqa
+        except (OSError, ValueError): continue
+    return index
+
+
+def _save_index(index, cache_dir):
+    tmp_path = os.path.join(cache_dir, INDEX_FILENAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(index, f)
+    os.replace(tmp_path, os.path.join(cache_dir, INDEX_FILENAME))
+
+
+def get(key, cache_dir=AI_CACHE_DIR):
+    """The stored entry for `key` (marked as just used), or None."""
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f: entry = json.load(f)
+        os.utime(path) # LRU: mtime is the last use
+        return entry
+    except (OSError, ValueError): return None
+
+
+def put(key, entry, cache_dir=AI_CACHE_DIR, max_bytes=AI_CACHE_MAX_BYTES):
+    """
+    Stores an entry (a dict with at least 'text'; 'game_folder', 'model_id', 'query', 'input_sha256'
+    are indexed) and evicts least recently used entries beyond `max_bytes`. Returns False on I/O errors.
+    """
+    entry = dict(entry, key=key, created=entry.get('created') or time.time())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = _entry_path(key, cache_dir) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, _entry_path(key, cache_dir))
+        with _lock:
+            index = _load_index(cache_dir)
+            index[key] = {k: entry.get(k) for k in ('game_folder', 'model_id', 'query', 'input_sha256', 'created')}
+            _evict(index, cache_dir, max_bytes, keep=key)
+            _save_index(index, cache_dir)
+        return True
+    except OSError: return False
+
+
+def _evict(index, cache_dir, max_bytes, keep=None):
+    """Deletes least recently used entries until the entries fit in `max_bytes` (never `keep`)."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(ENTRY_SUFFIX) or name == INDEX_FILENAME: continue
+        try: st = os.stat(os.path.join(cache_dir, name))
+        except OSError: continue
+        entries.append((st.st_mtime, st.st_size, name[:-len(ENTRY_SUFFIX)]))
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_bytes: break
+        if key == keep: continue
+        try: os.remove(_entry_path(key, cache_dir))
+        except OSError: continue
+        index.pop(key, None); total -= size
+    for key in [k for k in index if not os.path.exists(_entry_path(k, cache_dir))]: del index[key]
+
+
+def find_latest(game_folder, model_id, query, input_hashes, cache_dir=AI_CACHE_DIR):
+    """Newest entry for this game, model and query over one of the given input file hashes, or None."""
+    with _lock: index = _load_index(cache_dir)
+    matches = [(meta.get('created') or 0, key) for key, meta in index.items()
+               if meta.get('game_folder') == game_folder and meta.get('model_id') == model_id
+               and meta.get('query') == query and meta.get('input_sha256') in input_hashes]
+    for _, key in sorted(matches, reverse=True):
+        entry = get(key, cache_dir)
+        if entry is not None: return entry
+    return None
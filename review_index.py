@@ -0,0 +1,192 @@
+# review_index.py
+"""
+Query-aware retrieval for the AI step: a BM25 inverted index over a game's _reviews_optimized.txt,
+persisted next to it (INDEX_SUFFIX), so a focused query ships only the best-matching reviews within
+a token budget instead of the whole file.
+
+Documents are the file's review lines, addressed by byte offset, so the index never stores review
+text. The scraper's "Date/Playtime/Rec" header and the optimizer's "[xN]" annotation are not indexed.
+When the file only grew (incremental merge appends to it), the index is extended with the new lines;
+any other change (re-optimize, strip, rerender) rebuilds it.
+
+    python review_index.py FILE "QUERY" [--budget N] [--model ID]   # print what would be sent
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import zlib
+
+from optimize import FILE_HEADER_PATTERN, REVIEW_METADATA_PATTERN
+from token_counter import count_line_tokens
+
+INDEX_SUFFIX = '.bm25.json' # Written next to the indexed file
+INDEX_VERSION = 1
+BM25_K1 = 1.2 # Term-frequency saturation
+BM25_B = 0.75 # Document-length normalisation
+SELECT_BATCH = 256 # Candidate lines read and token-counted together while filling the budget
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+ANNOTATION_PATTERN = re.compile(r'^\[x\d+\] ')
+# Function words plus the words every query to this tool contains anyway.
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does doing
+for from had has have having he her here him his how i if in into is it it's its just me more most
+my no not of on once only or other our out over own same she should so some such than that the their
+them then there these they this those to too under until up very was we were what when where which
+while who whom why will with would you your
+player players say says said review reviews game games think thinks tell feel feels
+""".split())
+
+
+def stem(term):
+    """Folds plain English plurals and possessives ("crashes" -> "crashe", "bugs" -> "bug") so they meet."""
+    if term.endswith("'s"): term = term[:-2]
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'): term = term[:-1]
+    return term
+
+
+def review_terms(cleaned):
+    """Indexed terms of one cleaned review line (header and duplicate annotation removed)."""
+    body = REVIEW_METADATA_PATTERN.sub('', ANNOTATION_PATTERN.sub('', cleaned, count=1), count=1)
+    return [stem(term) for term in TERM_PATTERN.findall(body.lower()) if term not in STOPWORDS]
+
+
+class ReviewIndex:
+    """
+    BM25 index of one review file. `offsets[d]` is the byte offset of document d's line, `lengths[d]`
+    its term count and `postings[term]` a flat [doc, tf, doc, tf, ...] list in doc order. `indexed_bytes`
+    and `prefix_crc` describe the part of the file already indexed, for the append-only update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []; self.lengths = []; self.postings = {}
+        self.indexed_bytes = 0; self.prefix_crc = 0; self.seen_review = False
+
+    @property
+    def index_path(self):
+        return self.path + INDEX_SUFFIX
+
+    def _add_lines(self, start):
+        """Indexes every line from byte `start` to EOF and advances indexed_bytes/prefix_crc."""
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for raw in f:
+                self.prefix_crc = zlib.crc32(raw, self.prefix_crc)
+                line = raw.decode('utf-8', errors='replace').strip()
+                line_offset = offset; offset += len(raw)
+                if not line: continue
+                if not self.seen_review and FILE_HEADER_PATTERN.match(line): continue # Game/AppID/... block
+                self.seen_review = True
+                terms = review_terms(line)
+                if not terms: continue
+                doc = len(self.offsets)
+                self.offsets.append(line_offset); self.lengths.append(len(terms))
+                counts = {}
+                for term in terms: counts[term] = counts.get(term, 0) + 1
+                for term, tf in counts.items(): self.postings.setdefault(term, []).extend((doc, tf))
+            self.indexed_bytes = offset
+
+    def _prefix_unchanged(self):
+        """True if the file still starts with exactly the bytes that were indexed."""
+        if os.path.getsize(self.path) < self.indexed_bytes: return False
+        crc = 0; remaining = self.indexed_bytes
+        with open(self.path, 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 20))
+                if not block: return False
+                crc = zlib.crc32(block, crc); remaining -= len(block)
+        return crc == self.prefix_crc
+
+    def to_dict(self):
+        return {'version': INDEX_VERSION, 'indexed_bytes': self.indexed_bytes, 'prefix_crc': self.prefix_crc,
+                'seen_review': self.seen_review, 'offsets': self.offsets, 'lengths': self.lengths, 'postings': self.postings} # noqa
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    @classmethod
+    def open(cls, path, log_func=print):
+        """
+        Loads the saved index of `path`, extending it if the file only grew and rebuilding it if it
+        changed in any other way (or none exists); saves it when anything changed.
+        """
+        index = cls(path); status = "built"
+        try:
+            with open(index.index_path, 'r', encoding='utf-8') as f: data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                index.indexed_bytes = data['indexed_bytes']; index.prefix_crc = data['prefix_crc']; index.seen_review = data['seen_review'] # noqa
+                index.offsets = data['offsets']; index.lengths = data['lengths']; index.postings = data['postings']
+                if index._prefix_unchanged(): status = "loaded"
+                else: index = cls(path)
+        except (OSError, ValueError, KeyError, TypeError): index = cls(path) # Missing or unreadable: rebuild
+        if status == "loaded" and os.path.getsize(path) > index.indexed_bytes: status = "updated"
+        if status != "loaded":
+            start_docs = len(index.offsets)
+            index._add_lines(index.indexed_bytes)
+            try: index.save()
+            except OSError as e: log_func(f"Warning: Could not save review index '{os.path.basename(index.index_path)}': {e}") # noqa
+            log_func(f"Review index {status}: {len(index.offsets) - start_docs:,} reviews indexed ({len(index.offsets):,} total).") # noqa
+        return index
+
+    def scores(self, query):
+        """BM25 score per matching document ({doc: score})."""
+        n = len(self.offsets)
+        if not n: return {}
+        average_length = sum(self.lengths) / n
+        scores = {}
+        for term in set(review_terms(query)):
+            postings = self.postings.get(term)
+            if not postings: continue
+            df = len(postings) // 2
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for k in range(0, len(postings), 2):
+                doc, tf = postings[k], postings[k + 1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def select(self, query, budget, model=None):
+        """
+        The best-scoring reviews for `query` whose tokens (token_counter, `model`) fit `budget`, returned
+        in file order as (lines, tokens, matching review count). Reviews that would overflow the budget
+        are skipped in favour of smaller, lower-ranked ones.
+        """
+        scores = self.scores(query)
+        ranked = sorted(scores, key=lambda doc: (-scores[doc], doc))
+        chosen = []; used = 0
+        with open(self.path, 'rb') as f:
+            for start in range(0, len(ranked), SELECT_BATCH):
+                if used >= budget: break
+                batch = ranked[start:start + SELECT_BATCH]
+                lines = []
+                for doc in batch:
+                    f.seek(self.offsets[doc]); lines.append(f.readline().decode('utf-8', errors='replace').strip())
+                for doc, line, tokens in zip(batch, lines, count_line_tokens(lines, model)):
+                    if used + tokens <= budget: chosen.append((doc, line)); used += tokens
+        chosen.sort()
+        return [line for _, line in chosen], used, len(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 retrieval over a review file (builds/updates its index).")
+    parser.add_argument('file', help="Review file, usually <game>_reviews_optimized.txt")
+    parser.add_argument('query', help="Query text")
+    parser.add_argument('--budget', type=int, default=200000, help="Token budget for the selected reviews (default: 200000)") # noqa
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose token correction factor to apply")
+    args = parser.parse_args()
+    if not os.path.exists(args.file): print(f"Error: File not found: {args.file}", file=sys.stderr); sys.exit(1)
+    index = ReviewIndex.open(args.file, log_func=lambda message: print(message, file=sys.stderr))
+    lines, tokens, matched = index.select(args.query, args.budget, args.model)
+    print(f"{len(lines):,} of {matched:,} matching reviews selected (~{tokens:,} tokens)", file=sys.stderr)
+    for line in lines: print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+# review_store.py
+"""
+Per-game SQLite review store, kept next to the scraped text file (<game>_reviews.txt + STORE_SUFFIX).
+One row per review holds the recommendation ID, creation/update time, playtime, recommendation,
+language, the line exactly as written to _reviews.txt and the cleaned review body; an FTS5 index
+covers the body. The scraper inserts every page in one transaction, so the store always matches the
+text file, and the exporters regenerate _reviews.txt (plus its ID sidecar) or an optimized-style
+file of the cleaned lines from it, optionally filtered by date, recommendation and playtime.
+
+Token estimates are indexed aggregates: every row stores token_counter's features of its line and
+of its cleaned line, and since the token model is linear the features of any selection add up
+(tokens are estimated on the sums, so they differ from per-line rounded counts by rounding only).
+
+    python review_store.py STORE [--since 2024-01-01] [--rec negative] [--min_playtime 10] ...
+        [--search "QUERY"] [--export_text OUT] [--export_cleaned OUT --budget N]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from optimize import REVIEW_METADATA_PATTERN, clean_line
+from token_counter import FEATURES, get_estimator, line_feature_columns
+
+STORE_SUFFIX = '.sqlite' # Written next to the reviews file, like reviews.py's IDS_SUFFIX/ARCHIVE_SUFFIX
+SCHEMA_VERSION = 1
+SUMMED_FEATURES = tuple(name for name in FEATURES if name != 'newlines') # 'newlines' is the row count
+SEARCH_TERM_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+EXPORT_BATCH = 2000 # Rows read (and token-counted) together by the exporters
+
+REVIEW_COLUMNS = ('recommendationid', 'timestamp_created', 'timestamp_updated', 'playtime_minutes', 'voted_up', 'language', 'steam_purchase', 'line', 'body', 'line_bytes') + tuple(f'l_{name}' for name in SUMMED_FEATURES) + tuple(f'c_{name}' for name in SUMMED_FEATURES) # noqa
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS reviews (
+    seq INTEGER PRIMARY KEY, -- File order
+    recommendationid TEXT UNIQUE,
+    timestamp_created INTEGER, timestamp_updated INTEGER, playtime_minutes INTEGER,
+    voted_up INTEGER, language TEXT, steam_purchase INTEGER,
+    line TEXT NOT NULL, -- As written to _reviews.txt, without the newline
+    body TEXT NOT NULL, -- clean_line(line) minus the Date/Playtime/Rec prefix (what FTS indexes)
+    line_bytes INTEGER NOT NULL, -- UTF-8 size of line + newline, to tell whether the text file still matches
+    {', '.join(f'l_{name} INTEGER NOT NULL' for name in SUMMED_FEATURES)},
+    {', '.join(f'c_{name} INTEGER NOT NULL' for name in SUMMED_FEATURES)} -- c_chars = 0: the line cleans to nothing
+);
+CREATE INDEX IF NOT EXISTS reviews_created ON reviews (timestamp_created);
+CREATE INDEX IF NOT EXISTS reviews_playtime ON reviews (playtime_minutes);
+CREATE INDEX IF NOT EXISTS reviews_voted_up ON reviews (voted_up, timestamp_created);
+"""
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(body, content='reviews', content_rowid='seq', tokenize='porter unicode61'); -- noqa
+CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON reviews BEGIN
+    INSERT INTO reviews_fts (rowid, body) VALUES (new.seq, new.body); END;
+CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON reviews BEGIN
+    INSERT INTO reviews_fts (reviews_fts, rowid, body) VALUES ('delete', old.seq, old.body); END;
+CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF body ON reviews BEGIN
+    INSERT INTO reviews_fts (reviews_fts, rowid, body) VALUES ('delete', old.seq, old.body);
+    INSERT INTO reviews_fts (rowid, body) VALUES (new.seq, new.body); END;
+"""
+UPSERT_SQL = (f"INSERT INTO reviews ({', '.join(REVIEW_COLUMNS)}) VALUES ({', '.join('?' * len(REVIEW_COLUMNS))}) "
+              f"ON CONFLICT (recommendationid) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in REVIEW_COLUMNS[1:])}") # Re-scraped reviews keep their place # noqa
+
+
+def store_path_for(reviews_filename):
+    return reviews_filename + STORE_SUFFIX
+
+
+def review_rows(review_dicts, lines):
+    """
+    Store rows for reviews and their formatted lines (reviews.format_review_for_file), in REVIEW_COLUMNS
+    order. CPU-only, so the scraper builds them in its format stage.
+    """
+    lines = [line[:-1] if line.endswith('\n') else line for line in lines]
+    cleaned = [clean_line(line) for line in lines]
+    line_columns = line_feature_columns(lines); cleaned_columns = line_feature_columns(cleaned)
+    rows = []
+    for i, (review_dict, line) in enumerate(zip(review_dicts, lines)):
+        author = review_dict.get('author') or {}
+        rows.append((str(review_dict['recommendationid']) if review_dict.get('recommendationid') else None,
+                     review_dict.get('timestamp_created', 0), review_dict.get('timestamp_updated', 0), author.get('playtime_forever', 0), # noqa
+                     int(bool(review_dict.get('voted_up', False))), review_dict.get('language'), int(bool(review_dict.get('steam_purchase', True))), # noqa
+                     line, REVIEW_METADATA_PATTERN.sub('', cleaned[i], count=1), len(line.encode('utf-8')) + 1)
+                    + tuple(line_columns[name][i] for name in SUMMED_FEATURES) + tuple(cleaned_columns[name][i] for name in SUMMED_FEATURES)) # noqa
+    return rows
+
+
+def parse_day(value, end=False):
+    """Epoch seconds of a local 'YYYY-MM-DD' (its end with `end`), matching the dates in the review lines."""
+    day = datetime.strptime(value, '%Y-%m-%d').timestamp()
+    return int(day) + (86400 if end else 0)
+
+
+class ReviewStore:
+    """
+    One game's review store. Safe to hand between threads (the scraper writes from its worker threads),
+    but meant for one writer at a time. `fts` is False when the SQLite build lacks FTS5 (search() is
+    unavailable then; everything else works).
+    """
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        if reset:
+            for stale in (path, path + '-journal'):
+                if os.path.exists(stale): os.remove(stale)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        with self.conn: self.conn.executescript(SCHEMA)
+        try:
+            with self.conn: self.conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError: self.fts = False # No FTS5 in this SQLite build
+        with self.conn: self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)) # noqa
+
+    def close(self):
+        with self._lock: self.conn.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    # --- Writing ---
+    def set_header(self, header_text):
+        """The '=====' header block of the text file (with its trailing blank line), for the exporters."""
+        with self._lock, self.conn: self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('header', ?)", (header_text,)) # noqa
+
+    def add_rows(self, rows):
+        """Inserts review_rows() output in one transaction (a review already stored is updated in place)."""
+        if not rows: return 0
+        with self._lock, self.conn: self.conn.executemany(UPSERT_SQL, rows)
+        return len(rows)
+
+    def merge_from(self, other_path, prepend=False):
+        """
+        Adds every review of another store (an incremental scrape's) in its order, in one transaction:
+        after the stored ones, or with `prepend` before them (seq values below the current first).
+        """
+        columns = ', '.join(REVIEW_COLUMNS)
+        with self._lock:
+            self.conn.execute("ATTACH DATABASE ? AS incoming", (other_path,))
+            try:
+                with self.conn:
+                    seq = "seq + (SELECT COALESCE(MIN(seq), 1) FROM main.reviews) - (SELECT COALESCE(MAX(seq), 0) FROM incoming.reviews) - 1" if prepend else "NULL" # noqa
+                    cursor = self.conn.execute(f"INSERT INTO reviews (seq, {columns}) SELECT {seq}, {columns} FROM incoming.reviews WHERE true ORDER BY seq " # noqa
+                                               f"ON CONFLICT (recommendationid) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in REVIEW_COLUMNS[1:])}") # noqa
+                    return cursor.rowcount
+            finally: self.conn.execute("DETACH DATABASE incoming")
+
+    # --- Reading ---
+    def header(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()
+        return row[0] if row else ''
+
+    @staticmethod
+    def _where(since=None, until=None, rec=None, min_playtime=None, max_playtime=None, cleaned_only=False):
+        """SQL condition and parameters for the filters (dates 'YYYY-MM-DD' inclusive, playtime in hours)."""
+        clauses = []; params = []
+        if since: clauses.append("timestamp_created >= ?"); params.append(parse_day(since))
+        if until: clauses.append("timestamp_created < ?"); params.append(parse_day(until, end=True))
+        if rec: clauses.append("voted_up = ?"); params.append(1 if rec == 'positive' else 0)
+        if min_playtime is not None: clauses.append("playtime_minutes >= ?"); params.append(int(min_playtime * 60))
+        if max_playtime is not None: clauses.append("playtime_minutes < ?"); params.append(int(max_playtime * 60))
+        if cleaned_only: clauses.append("c_chars > 0") # Lines optimize.py would drop as empty
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM reviews{where}", params).fetchone()[0]
+
+    def text_bytes(self):
+        """Size the text file has when it matches the store (header + every line)."""
+        return len(self.header().encode('utf-8')) + (self.conn.execute("SELECT COALESCE(SUM(line_bytes), 0) FROM reviews").fetchone()[0]) # noqa
+
+    def matches_file(self, reviews_filename):
+        """True if `reviews_filename` has the size the store would export (cheap in-sync check)."""
+        try: return os.path.getsize(reviews_filename) == self.text_bytes()
+        except OSError: return False
+
+    def token_estimate(self, cleaned=False, model=None, **filters):
+        """
+        Estimated tokens of the selected reviews' lines as in _reviews.txt (plus the header, unfiltered),
+        or with `cleaned` of their cleaned lines, from one aggregate query (see the module docstring).
+        """
+        prefix = 'c_' if cleaned else 'l_'
+        where, params = self._where(cleaned_only=cleaned, **filters)
+        sums = self.conn.execute(f"SELECT COUNT(*), {', '.join(f'COALESCE(SUM({prefix}{name}), 0)' for name in SUMMED_FEATURES)} FROM reviews{where}", params).fetchone() # noqa
+        features = dict(zip(SUMMED_FEATURES, sums[1:]), newlines=sums[0])
+        estimator = get_estimator()
+        tokens = estimator.raw_estimate(features) * estimator.factor(model)
+        if not cleaned and not filters: tokens += sum(estimator.count_lines(self.header().split('\n'), model))
+        return round(tokens)
+
+    def iter_rows(self, columns=('line',), **filters):
+        """Selected rows in file order, EXPORT_BATCH at a time."""
+        where, params = self._where(**filters)
+        cursor = self.conn.execute(f"SELECT {', '.join(columns)} FROM reviews{where} ORDER BY seq", params)
+        while True:
+            batch = cursor.fetchmany(EXPORT_BATCH)
+            if not batch: return
+            yield from batch
+
+    def search(self, query, limit=20, **filters):
+        """Best FTS5 (BM25) matches for any term of `query` as (recommendationid, line), best first."""
+        if not self.fts: raise RuntimeError("This SQLite build has no FTS5; full-text search is unavailable.")
+        terms = SEARCH_TERM_PATTERN.findall(query.lower())
+        if not terms: return []
+        where, params = self._where(**filters)
+        where = where.replace(" WHERE ", " AND ", 1)
+        match = " OR ".join(f'"{term}"' for term in terms)
+        return self.conn.execute(f"SELECT r.recommendationid, r.line FROM reviews_fts JOIN reviews r ON r.seq = reviews_fts.rowid " # noqa
+                                 f"WHERE reviews_fts MATCH ?{where} ORDER BY bm25(reviews_fts) LIMIT ?", [match] + params + [limit]).fetchall() # noqa
+
+    # --- Exporters ---
+    def export_text(self, path, ids_path=None, **filters):
+        """Writes the header and the selected lines (all of them: the scraped text file) and, with `ids_path`, the ID sidecar. Returns lines written.""" # noqa
+        written = 0
+        with open(path + '.tmp', 'w', encoding='utf-8') as out_f, (open(ids_path + '.tmp', 'w', encoding='utf-8') if ids_path else open(os.devnull, 'w')) as ids_f: # noqa
+            out_f.write(self.header())
+            for rec_id, created, line in self.iter_rows(('recommendationid', 'timestamp_created', 'line'), **filters):
+                out_f.write(line + '\n'); ids_f.write(f"{rec_id or ''}\t{created or 0}\n"); written += 1
+        os.replace(path + '.tmp', path)
+        if ids_path: os.replace(ids_path + '.tmp', ids_path)
+        return written
+
+    def export_cleaned(self, path, token_budget=None, model=None, **filters):
+        """
+        Writes an optimized-style file: the cleaned header, then the selected cleaned lines in file order
+        until `token_budget` (token_counter, `model`) would be exceeded. No deduplication or sampling
+        (that is optimize.py's job). Returns (lines written, tokens).
+        """
+        header = [cleaned for cleaned in map(clean_line, self.header().split('\n')) if cleaned]
+        used = sum(get_estimator().count_lines(header, model)); written = 0
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in header)
+            batch = []
+            for (line,) in self.iter_rows(('line',), cleaned_only=True, **filters):
+                batch.append(clean_line(line))
+                if len(batch) < EXPORT_BATCH: continue
+                kept, used = self._write_within_budget(f, batch, used, token_budget, model); written += kept; batch = []
+                if kept < EXPORT_BATCH: break
+            else:
+                kept, used = self._write_within_budget(f, batch, used, token_budget, model); written += kept
+        os.replace(path + '.tmp', path)
+        return written, used
+
+    @staticmethod
+    def _write_within_budget(f, lines, used, token_budget, model):
+        kept = 0
+        for line, tokens in zip(lines, get_estimator().count_lines(lines, model)):
+            if token_budget is not None and used + tokens > token_budget: break
+            f.write(line + '\n'); used += tokens; kept += 1
+        return kept, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and export a game's SQLite review store.")
+    parser.add_argument('store', help=f"Store file (<game>_reviews.txt{STORE_SUFFIX}) or the reviews file next to it")
+    parser.add_argument('--since', type=str, default=None, help="Reviews created on or after YYYY-MM-DD")
+    parser.add_argument('--until', type=str, default=None, help="Reviews created on or before YYYY-MM-DD")
+    parser.add_argument('--rec', type=str, default=None, choices=['positive', 'negative'], help="Recommendation")
+    parser.add_argument('--min_playtime', type=float, default=None, help="Minimum playtime in hours")
+    parser.add_argument('--max_playtime', type=float, default=None, help="Maximum playtime in hours (exclusive)")
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose token correction factor to apply")
+    parser.add_argument('--search', type=str, default="", help="Print the best full-text matches for this query")
+    parser.add_argument('--limit', type=int, default=20, help="Matches printed by --search (default: 20)")
+    parser.add_argument('--export_text', type=str, default="", metavar='OUT', help="Write the selected reviews as a _reviews.txt (with its .ids sidecar)") # noqa
+    parser.add_argument('--export_cleaned', type=str, default="", metavar='OUT', help="Write the selected reviews' cleaned lines, optimized-file style") # noqa
+    parser.add_argument('--budget', type=int, default=None, help="Token budget for --export_cleaned (default: none)")
+    args = parser.parse_args()
+    path = args.store if args.store.endswith(STORE_SUFFIX) else store_path_for(args.store)
+    if not os.path.exists(path): print(f"Error: Store not found: {path}", file=sys.stderr); sys.exit(1)
+    filters = {name: getattr(args, name) for name in ('since', 'until', 'rec', 'min_playtime', 'max_playtime')}
+    filters = {name: value for name, value in filters.items() if value is not None}
+    try:
+        with ReviewStore(path) as store:
+            print(f"{store.count(**filters):,} reviews, ~{store.token_estimate(model=args.model, **filters):,} tokens as text, ~{store.token_estimate(cleaned=True, model=args.model, **filters):,} cleaned", file=sys.stderr) # noqa
+            if args.search:
+                for rec_id, line in store.search(args.search, args.limit, **filters): print(f"{rec_id}\t{line}")
+            if args.export_text:
+                from reviews import IDS_SUFFIX # reviews.py imports this module
+                written = store.export_text(args.export_text, args.export_text + IDS_SUFFIX, **filters)
+                print(f"Wrote {written:,} reviews to {args.export_text}", file=sys.stderr)
+            if args.export_cleaned:
+                written, tokens = store.export_cleaned(args.export_cleaned, args.budget, args.model, **filters)
+                print(f"Wrote {written:,} cleaned reviews (~{tokens:,} tokens) to {args.export_cleaned}", file=sys.stderr)
+    except (sqlite3.Error, ValueError, RuntimeError, OSError) as e: print(f"Error: {e}", file=sys.stderr); sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,20 @@ import time
 import json
 import sys
 import argparse
+import asyncio
+import gzip
+import zlib
+import queue
+import threading
 from datetime import datetime
 import os # Import os for flush
 import traceback
 
+from config import STEAM_REVIEW_TYPES, STEAM_PURCHASE_TYPES, STEAM_LANGUAGES, STEAM_RATE_LIMIT, STEAM_STORE_URL
+from rate_limiter import get_limiter
+from review_store import ReviewStore, review_rows, store_path_for
+from line_index import LineIndexWriter, line_index_path_for
+
 # --- Default Configuration ---
 # (Defaults remain the same)
 DEFAULT_MAX_REVIEWS = 30000
@@ -23,6 +33,20 @@ DEFAULT_DATE_RANGE = "0"
 DEFAULT_PLAYTIME = "0"
 DEFAULT_FILTER_BY = "all"
 DEFAULT_BETA = "0"
+MAX_API_ERRORS = 3
+MAX_THROTTLE_RETRIES = 10 # 429/503 responses in a row before giving up
+PIPELINE_QUEUE_PAGES = 8 # Pages buffered between fetch -> format -> write; a full queue pauses the stage before it
+PIPELINE_STATS_EVERY = 25 # Print per-stage throughput every N written pages (and at the end)
+PARTITION_DIMENSIONS = ('review_type', 'purchase_type', 'language') # Filters with independent cursor chains
+CHECKPOINT_SUFFIX = '.checkpoint.json' # Written next to the output file after every flushed batch
+CHECKPOINT_FILTER_ARGS = ('language', 'review_type', 'purchase_type', 'day_range', 'playtime', 'filter_by', 'beta', 'num', 'partition', 'incremental', 'known_ids', 'since') # noqa
+IDS_SUFFIX = '.ids' # "recommendationid<TAB>timestamp_created" per written review, used by --incremental
+ARCHIVE_SUFFIX = '.raw.jsonl.gz' # Append-only raw review dicts (one gzip member per page), used by --rerender
+
+
+class ScrapeAbort(Exception):
+    """Raised inside the scrape engine when the run has to end with a non-zero exit code."""
+
 
 # --- Helper Functions ---
 # (get_validated_app_id remains the same)
@@ -34,17 +58,23 @@ def get_validated_app_id():
 def get_initial_game_data(session, app_id):
     details = {"name": f"Game (ID: {app_id})", "release_date": "N/A", "review_desc": "N/A", "total_reviews": "N/A"} # noqa
     try: # AppDetails
-        details_url = f"https://store.steampowered.com/api/appdetails?appids={app_id}&l=english" # noqa
-        response = session.get(details_url, timeout=15); response.raise_for_status(); data = response.json(); # noqa
+        details_url = f"{STEAM_STORE_URL}/api/appdetails?appids={app_id}&l=english" # noqa
+        limiter = get_limiter(); limiter.acquire()
+        try: response = session.get(details_url, timeout=15)
+        except requests.exceptions.RequestException: limiter.on_error(); raise
+        limiter.observe(response); response.raise_for_status(); data = response.json(); # noqa
         if data and str(app_id) in data and data[str(app_id)].get('success'):
             app_data = data[str(app_id)]['data']
             details["name"] = app_data.get('name', details["name"])
             if 'release_date' in app_data and app_data['release_date'].get('date'): details["release_date"] = app_data['release_date']['date'] # noqa
     except Exception as e: print(f"reviews.py: Warn: Failed app details: {e}", file=sys.stderr) # noqa
     try: # Review Summary
-        summary_url = f'https://store.steampowered.com/appreviews/{app_id}' # noqa
+        summary_url = f'{STEAM_STORE_URL}/appreviews/{app_id}' # noqa
         params = {'json': '1', 'num_per_page': '0', 'language': 'all'}
-        response = session.get(summary_url, params=params, timeout=15); response.raise_for_status(); data = response.json(); # noqa
+        limiter = get_limiter(); limiter.acquire()
+        try: response = session.get(summary_url, params=params, timeout=15)
+        except requests.exceptions.RequestException: limiter.on_error(); raise
+        limiter.observe(response); response.raise_for_status(); data = response.json(); # noqa
         if data and data.get('success') == 1 and 'query_summary' in data:
             summary = data['query_summary']
             details["review_desc"] = summary.get('review_score_desc', 'N/A')
@@ -71,13 +101,531 @@ def format_review_for_file(review_dict):
         return f"[Formatting Error] {review_dict.get('review', '')}\n"
 
 
-# --- Main Script ---
-if __name__ == "__main__":
-    # --- Argument Parsing (Unchanged) ---
+def build_review_params(args, cursor, num_per_page):
+    """Query parameters for one appreviews page request."""
+    return { 'json': '1', 'language': args.language, 'review_type': args.review_type, 'purchase_type': args.purchase_type, 'filter': args.filter_by, 'day_range': args.day_range, 'playtime_filter_min': args.playtime, 'review_beta_enabled': args.beta, 'num_per_page': str(num_per_page), 'cursor': cursor } # noqa
+
+
+def write_file_header(file_handle, app_id, game_details, max_reviews):
+    """Writes the '=====' header block and returns its text (the review store keeps a copy)."""
+    header = "="*50 + "\n" + f"Game: {game_details['name']}\n" + f"AppID: {app_id}\n" + f"Release Date: {game_details['release_date']}\n" + f"Review Score: {game_details['review_desc']} ({game_details['total_reviews']} total)\n" + f"Scrape Target: {max_reviews}\n" + f"Scrape Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n" + "="*50 + "\n\n" # noqa
+    file_handle.write(header)
+    file_handle.flush() # Flush header immediately
+    return header
+
+
+def decide_next_cursor(new_reviews, next_cursor, cursor, seen_cursors, total_after_batch, max_reviews):
+    """
+    Applies the loop termination rules to one fetched page.
+    Returns (next_cursor, None) to keep walking the chain, or (None, reason) to stop;
+    the reason is the text printed after 'BREAKING:' on stderr.
+    """
+    if not new_reviews and (next_cursor is None or next_cursor == ''): print("\nNo reviews/cursor. End.", file=sys.stderr); return None, "No reviews/cursor." # noqa
+    if not new_reviews and next_cursor is not None and next_cursor != '':
+        if next_cursor != cursor:
+            if next_cursor in seen_cursors: print("\nRepeat cursor empty batch. Stop.", file=sys.stderr); return None, "Repeat cursor empty batch." # noqa
+            print("\nEmpty batch, new cursor.", file=sys.stderr); return next_cursor, None # noqa
+        print("\nEmpty batch, cursor same. End.", file=sys.stderr); return None, "Empty batch, cursor same." # noqa
+    if total_after_batch >= max_reviews: print(f"\nTarget reached ({max_reviews})."); return None, "Max reviews." # noqa
+    if next_cursor and next_cursor != cursor:
+        if next_cursor in seen_cursors: print("\nRepeat cursor. Stop.", file=sys.stderr); return None, "Repeat cursor." # noqa
+        return next_cursor, None
+    print("\nNo new/changed cursor. End.", file=sys.stderr); return None, "No new/changed cursor." # noqa
+
+
+def format_review_batch(reviews_to_process, with_archive=True, with_store=False):
+    """
+    CPU half of writing a page: (review text, ID sidecar text, gzip member of the raw dicts or b'',
+    review store rows or None). Runs off the event loop thread.
+    """
+    lines = [format_review_for_file(review_dict) for review_dict in reviews_to_process]
+    text = ''.join(lines)
+    ids_text = ''.join(f"{review_dict.get('recommendationid', '')}\t{review_dict.get('timestamp_created', 0)}\n" for review_dict in reviews_to_process) # noqa
+    archive_blob = gzip.compress(''.join(json.dumps(review_dict, ensure_ascii=False) + '\n' for review_dict in reviews_to_process).encode('utf-8')) if with_archive and reviews_to_process else b'' # noqa
+    store_rows = review_rows(reviews_to_process, lines) if with_store else None
+    return text, ids_text, archive_blob, store_rows
+
+
+def write_formatted_batch(file_handle, formatted, review_count, ids_handle=None, archive_handle=None, store=None, line_index=None): # noqa
+    """
+    I/O half of writing a page: writes a format_review_batch result and flushes, then inserts the page
+    into the review store in one transaction and appends its lines to the line index. Returns reviews written.
+    """
+    text, ids_text, archive_blob, store_rows = formatted
+    if archive_handle is not None and archive_blob:
+        try: archive_handle.write(archive_blob); archive_handle.flush()
+        except Exception as archive_e: print(f"\nreviews.py: Warn: Could not archive raw reviews: {archive_e}", file=sys.stderr) # Archive is a bonus; keep scraping # noqa
+    try:
+        file_handle.write(text)
+        if ids_handle is not None: ids_handle.write(ids_text)
+    except Exception as write_e: print(f"\nWrite Error ({review_count} reviews): {write_e}", file=sys.stderr); print("Stopping: Write error.", file=sys.stderr); raise ScrapeAbort("Write error.") # noqa
+    try:
+        file_handle.flush()
+        if ids_handle is not None: ids_handle.flush()
+    except Exception as flush_e:
+        # Log error but don't necessarily stop the whole process
+        print(f"\nreviews.py: Warn: Error flushing file buffer: {flush_e}", file=sys.stderr)
+    if store is not None and store_rows:
+        try: store.add_rows(store_rows)
+        except Exception as store_e: print(f"\nreviews.py: Warn: Could not add reviews to the store: {store_e}", file=sys.stderr) # The text file stays complete; re-render rebuilds the store # noqa
+    if line_index is not None:
+        try: line_index.extend(file_handle.tell())
+        except OSError as index_e: print(f"\nreviews.py: Warn: Could not extend the line index: {index_e}", file=sys.stderr) # Rebuilt on its next open # noqa
+    return review_count
+
+
+def write_review_batch(file_handle, reviews_to_process, ids_handle=None, archive_handle=None, store=None, line_index=None): # noqa
+    """Formats and writes one page of reviews (IDs to the sidecar, raw dicts to the archive, rows to the store), then flushes.""" # noqa
+    formatted = format_review_batch(reviews_to_process, with_archive=archive_handle is not None, with_store=store is not None) # noqa
+    return write_formatted_batch(file_handle, formatted, len(reviews_to_process), ids_handle, archive_handle, store, line_index) # noqa
+
+
+# --- Partitioned Scraping ---
+def _partition_values(dimension):
+    """API values walked for one filter dimension when it is split (the 'all' entry excluded)."""
+    mapping = {'review_type': STEAM_REVIEW_TYPES, 'purchase_type': STEAM_PURCHASE_TYPES, 'language': STEAM_LANGUAGES}[dimension] # noqa
+    return [value for value in mapping.values() if value != 'all']
+
+
+def build_partitions(args, dimensions):
+    """
+    Splits one scrape into disjoint filter combinations, each walked as its own cursor chain.
+    Only dimensions still set to 'all' are split. Returns a list of {arg_name: value} overrides
+    ([{}] means a single unpartitioned chain).
+    Note: 'language' only covers the languages listed in config.STEAM_LANGUAGES.
+    """
+    partitions = [{}]
+    for dimension in dimensions:
+        if dimension not in PARTITION_DIMENSIONS:
+            print(f"reviews.py: Warn: Unknown partition dimension '{dimension}' ignored.", file=sys.stderr); continue # noqa
+        if getattr(args, dimension) != 'all':
+            print(f"reviews.py: Warn: '{dimension}' is fixed to '{getattr(args, dimension)}', not partitioning it.", file=sys.stderr); continue # noqa
+        partitions = [dict(partition, **{dimension: value}) for partition in partitions for value in _partition_values(dimension)] # noqa
+    return partitions
+
+
+def partition_label(overrides):
+    return "[" + "/".join(overrides.values()) + "] " if overrides else ""
+
+
+def partition_key(overrides):
+    """Stable checkpoint key for one cursor chain."""
+    return "/".join(overrides.values()) or "*"
+
+
+# --- Checkpoints ---
+def checkpoint_path_for(output_filename):
+    return output_filename + CHECKPOINT_SUFFIX
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Atomically replaces the checkpoint file so a kill mid-write never leaves it half written."""
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path, app_id):
+    """Returns the checkpoint dict for this App ID, or None (with the reason on stderr)."""
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f: checkpoint = json.load(f)
+    except FileNotFoundError: print(f"reviews.py: Error: No checkpoint found: {checkpoint_path}", file=sys.stderr); return None # noqa
+    except (OSError, ValueError) as e: print(f"reviews.py: Error: Unreadable checkpoint: {e}", file=sys.stderr); return None # noqa
+    if str(checkpoint.get('app_id')) != str(app_id): print(f"reviews.py: Error: Checkpoint is for App ID {checkpoint.get('app_id')}, not {app_id}.", file=sys.stderr); return None # noqa
+    return checkpoint
+
+
+def new_checkpoint(app_id, args):
+    return {'app_id': str(app_id), 'filters': {name: getattr(args, name) for name in CHECKPOINT_FILTER_ARGS}, 'chains': {}, 'total_fetched': 0, 'output_bytes': 0, 'ids_bytes': 0} # noqa
+
+
+# --- Incremental Scraping ---
+def load_known_reviews(path):
+    """
+    Reads an IDS_SUFFIX sidecar. Returns (set of recommendationids, newest timestamp_created);
+    a missing file gives (set(), 0).
+    """
+    known_ids = set(); newest = 0
+    if not path or not os.path.exists(path): return known_ids, newest
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            rec_id, _, timestamp = line.rstrip('\n').partition('\t')
+            if rec_id: known_ids.add(rec_id)
+            if timestamp.isdigit(): newest = max(newest, int(timestamp))
+    return known_ids, newest
+
+
+def is_known_review(review_dict, known):
+    """True once an incremental (filter=recent) walk reaches a review that is already on disk."""
+    if str(review_dict.get('recommendationid', '')) in known['ids']: return True
+    return known['since'] > 0 and review_dict.get('timestamp_created', 0) < known['since']
+
+
+# --- Raw Archive / Re-render ---
+def archive_path_for(output_filename):
+    return output_filename + ARCHIVE_SUFFIX
+
+
+def iter_archive(archive_path):
+    """Yields archived review dicts in append order; a torn final page (killed mid-write) ends the read with a warning.""" # noqa
+    try:
+        with gzip.open(archive_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try: yield json.loads(line)
+                except json.JSONDecodeError: print(f"reviews.py: Warn: Skipping bad archive line in {archive_path}", file=sys.stderr) # noqa
+    except (EOFError, OSError, zlib.error) as e:
+        print(f"reviews.py: Warn: Archive {archive_path} ends early ({e}); later pages ignored.", file=sys.stderr)
+
+
+def load_archive(archive_path):
+    """Latest archived version of every review keyed by recommendationid, in first-archived order."""
+    records = {}
+    for index, review_dict in enumerate(iter_archive(archive_path)):
+        records[str(review_dict.get('recommendationid') or f"#{index}")] = review_dict # Re-scrapes replace in place
+    return list(records.values())
+
+
+def read_file_header(output_filename):
+    """The '=====' header block of a saved reviews file (with its blank line), or '' if it has none."""
+    header_lines = []
+    with open(output_filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            header_lines.append(line)
+            if len(header_lines) == 1 and not line.startswith('=' * 50): return ''
+            if len(header_lines) > 1 and line.startswith('=' * 50): break
+            if len(header_lines) > 20: return ''
+        blank = f.readline()
+        if blank.strip() == '': header_lines.append(blank)
+    return ''.join(header_lines)
+
+
+def rerender_reviews(output_filename, archive_path=None):
+    """
+    Regenerates a reviews file (and its ID sidecar, review store and line index) from the raw archive
+    with the current format_review_for_file, keeping the existing header. No network. Returns reviews written.
+    """
+    archive_path = archive_path or archive_path_for(output_filename)
+    if not os.path.exists(archive_path): raise ScrapeAbort(f"No raw archive: {archive_path}")
+    reviews = load_archive(archive_path)
+    header = read_file_header(output_filename) if os.path.exists(output_filename) else ''
+    tmp_output = output_filename + '.tmp'; tmp_ids = output_filename + IDS_SUFFIX + '.tmp'; tmp_store = store_path_for(output_filename) + '.tmp' # noqa
+    with open(tmp_output, 'w', encoding='utf-8') as out_f, open(tmp_ids, 'w', encoding='utf-8') as ids_f, ReviewStore(tmp_store, reset=True) as store: # noqa
+        out_f.write(header); store.set_header(header)
+        with LineIndexWriter(tmp_output) as line_index: written = write_review_batch(out_f, reviews, ids_f, store=store, line_index=line_index) # noqa
+    os.replace(tmp_output, output_filename); os.replace(tmp_ids, output_filename + IDS_SUFFIX); os.replace(tmp_store, store_path_for(output_filename)) # noqa
+    os.replace(line_index_path_for(tmp_output), line_index_path_for(output_filename))
+    return written
+
+
+# --- Async Scrape Engine ---
+class PipelineStats:
+    """
+    Per-stage counters for the fetch -> format -> write pipeline. 'busy' is time spent doing the
+    stage's work, 'paced' time waiting on the rate limiter, 'blocked' time waiting for room in the
+    next stage's queue (a stage that blocks a lot is waiting on a slower stage after it).
+    """
+    STAGES = ('fetch', 'format', 'write')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {stage: {'pages': 0, 'reviews': 0, 'busy': 0.0, 'paced': 0.0, 'blocked': 0.0} for stage in self.STAGES} # noqa
+
+    def add(self, stage, pages=0, reviews=0, busy=0.0, paced=0.0, blocked=0.0):
+        counters = self.stages[stage]
+        counters['pages'] += pages; counters['reviews'] += reviews; counters['busy'] += busy; counters['paced'] += paced; counters['blocked'] += blocked; # noqa
+
+    def bottleneck(self):
+        return max(self.STAGES, key=lambda stage: self.stages[stage]['busy'] + self.stages[stage]['paced'])
+
+    def as_dict(self):
+        return {'elapsed': time.perf_counter() - self.started, 'bottleneck': self.bottleneck(), 'stages': {stage: dict(counters) for stage, counters in self.stages.items()}} # noqa
+
+    def summary_lines(self):
+        lines = []
+        for stage in self.STAGES:
+            c = self.stages[stage]
+            line = f"Pipeline {stage}: {c['pages']} pages, {c['reviews']} reviews, busy {c['busy']:.2f}s"
+            if c['busy'] > 0: line += f" ({c['reviews'] / c['busy']:.0f} reviews/s)"
+            if c['paced'] > 0: line += f", paced {c['paced']:.2f}s"
+            if c['blocked'] > 0: line += f", blocked {c['blocked']:.2f}s"
+            lines.append(line)
+        lines.append(f"Pipeline: {time.perf_counter() - self.started:.1f}s elapsed, bottleneck: {self.bottleneck()}")
+        return lines
+
+
+async def fetch_review_page(session, url, params, timeout, limiter, retry_state, stats=None):
+    """
+    Fetches one page in a worker thread once the shared rate limiter allows it. 429/503 responses
+    slow the limiter down (honouring Retry-After) and are retried; timeouts/network errors are
+    retried with exponential backoff. Returns (http_status, response_data). Raises ScrapeAbort
+    once MAX_API_ERRORS (or MAX_THROTTLE_RETRIES) consecutive failures are hit or the body is not JSON.
+    The JSON body is decoded in the worker thread too, keeping the event loop free for the other stages.
+    """
+    while True:
+        response = None
+        paced_from = time.perf_counter(); await limiter.acquire_async(); busy_from = time.perf_counter() # noqa
+        if stats is not None: stats.add('fetch', paced=busy_from - paced_from)
+        try:
+            response = await asyncio.to_thread(session.get, url, params=params, timeout=timeout)
+            if limiter.observe(response):
+                retry_state['throttles'] += 1
+                print(f"\nreviews.py: Throttled (HTTP {response.status_code}). Rate now {limiter.describe()}.", file=sys.stderr) # noqa
+                if retry_state['throttles'] >= MAX_THROTTLE_RETRIES: print("Throttle limit.", file=sys.stderr); raise ScrapeAbort("Throttle limit.") # noqa
+                continue
+            retry_state['throttles'] = 0
+            response.raise_for_status(); response_data = await asyncio.to_thread(response.json); retry_state['api_errors'] = 0; # noqa
+            if stats is not None: stats.add('fetch', pages=1, reviews=len(response_data.get('reviews') or []), busy=time.perf_counter() - busy_from) # noqa
+            return response.status_code, response_data
+        except requests.exceptions.Timeout:
+            print(f"\nreviews.py: Error: Timeout.", file=sys.stderr)
+            limit_msg = "Timeout limit."
+        except requests.exceptions.RequestException as e:
+            print(f"\nreviews.py: Error: Network: {e}", file=sys.stderr)
+            limit_msg = "Network limit."
+        except json.JSONDecodeError:
+            print(f"\nreviews.py: Error: Invalid JSON.", file=sys.stderr)
+            print(f"Response: {response.text[:500] if response is not None else ''}", file=sys.stderr)
+            print("Stopping.", file=sys.stderr)
+            raise ScrapeAbort("Invalid JSON.")
+        limiter.on_error(); retry_state['api_errors'] += 1
+        if retry_state['api_errors'] >= MAX_API_ERRORS:
+            print(limit_msg, file=sys.stderr)
+            raise ScrapeAbort(limit_msg)
+        sleep_time = limiter.interval * (2 ** retry_state['api_errors'])
+        print(f"Retrying after {sleep_time:.1f}s...", file=sys.stderr)
+        await asyncio.sleep(sleep_time)
+
+
+async def walk_cursor_chain(app_id, chain_args, label, key, start_state, shared, page_queue, known=None):
+    """
+    Walks one appreviews cursor chain. Each fetched page is de-duplicated on recommendationid,
+    capped to the global max and handed to the bounded page queue together with the chain state
+    needed to resume after it; the next request goes out while the page is formatted and written,
+    and the chain only pauses when the queue is full.
+    Requests are paced by the process-wide Steam rate limiter shared with the other chains.
+    With `known` (incremental mode) the chain ends at the first review already on disk.
+    Returns (batch_num, max_iterations) for this chain.
+    """
+    max_reviews_to_fetch = chain_args.max; num_per_page_to_fetch = chain_args.num; request_timeout_seconds = DEFAULT_REQUEST_TIMEOUT; # noqa
+    max_iterations = (max_reviews_to_fetch // num_per_page_to_fetch) + 50 if num_per_page_to_fetch > 0 else max_reviews_to_fetch + 50 # noqa
+    url = f'{STEAM_STORE_URL}/appreviews/{app_id}'
+    limiter = get_limiter()
+    cursor = start_state.get('cursor', '*'); seen_cursors = set(start_state.get('seen_cursors', [cursor])); batch_num = start_state.get('batch_num', 0); retry_state = {'api_errors': 0, 'throttles': 0}; # noqa
+    page_offset = start_state.get('page_offset', 0) # Reviews of the checkpointed page already written
+
+    with requests.Session() as session:
+        session.headers.update({'User-Agent': 'Mozilla/5.0 SteamReviewAnalyzer/1.3'})
+        while batch_num < max_iterations:
+            if shared['cancel_event'] is not None and shared['cancel_event'].is_set(): print(f"\n{label}BREAKING: Cancelled.", file=sys.stderr); break # Checkpoint keeps the chain resumable # noqa
+            if shared['total_scheduled'] >= max_reviews_to_fetch: print(f"\n{label}BREAKING: Max reviews.", file=sys.stderr); break # noqa
+            batch_num += 1
+
+            params = build_review_params(chain_args, cursor, num_per_page_to_fetch)
+            status_code, response_data = await fetch_review_page(session, url, params, request_timeout_seconds, limiter, retry_state, shared['stats']) # noqa
+
+            # Check API Success (Unchanged logic)
+            api_success_code = response_data.get('success')
+            next_cursor_from_data = response_data.get('cursor')  # noqa
+            if api_success_code != 1:
+                print(f"\n{label}API fail code: {api_success_code}", file=sys.stderr)
+                print(f"Query: {response_data.get('query_summary', {})}", file=sys.stderr)
+                if not response_data.get('reviews') and next_cursor_from_data is None:
+                    print("API fail but looks like end. Finishing.", file=sys.stderr)
+                    print(f"{label}BREAKING: API fail, no reviews/cursor.", file=sys.stderr)
+                    await page_queue.put((label, key, batch_num, [], {'cursor': cursor, 'seen_cursors': sorted(seen_cursors), 'batch_num': batch_num, 'done': True})) # noqa
+                    break
+                print("Stopping: API failure code.", file=sys.stderr)
+                raise ScrapeAbort("API failure code.")
+
+            new_reviews = response_data.get('reviews', [])
+            room = max(0, max_reviews_to_fetch - shared['total_scheduled'])
+            reviews_to_process = []; consumed = page_offset; dupes = 0; page_offset = 0; reached_known = False; # noqa
+            for review_dict in new_reviews[consumed:]:
+                if len(reviews_to_process) >= room: break
+                if known is not None and is_known_review(review_dict, known): reached_known = True; break
+                consumed += 1
+                rec_id = review_dict.get('recommendationid')
+                if rec_id is not None:
+                    if rec_id in shared['seen_ids']: dupes += 1; continue
+                    shared['seen_ids'].add(rec_id)
+                reviews_to_process.append(review_dict)
+            shared['total_scheduled'] += len(reviews_to_process)
+            print(f"\n{label}Batch {batch_num}: Fetched (Cursor: '{str(cursor)[:20]}...') -> HTTP {status_code}, Got {len(new_reviews)}" + (f" ({dupes} duplicate)" if dupes else "")) # noqa
+
+            # --- Check Loop Termination Conditions ---
+            next_cursor, stop_reason = decide_next_cursor(new_reviews, next_cursor_from_data, cursor, seen_cursors, shared['total_scheduled'], max_reviews_to_fetch) # noqa
+            if reached_known: print(f"\n{label}Reached a review already on disk."); next_cursor, stop_reason = None, "Known review." # noqa
+            chain_state = {'cursor': cursor, 'page_offset': 0, 'batch_num': batch_num, 'done': bool(stop_reason)}
+            if not stop_reason: cursor = next_cursor; seen_cursors.add(cursor); chain_state['cursor'] = cursor # noqa
+            elif stop_reason == "Max reviews.": # Stays resumable if --max is raised later
+                chain_state['done'] = False
+                if consumed < len(new_reviews): chain_state['page_offset'] = consumed; chain_state['batch_num'] = batch_num - 1 # Re-fetch this page, skip what was written # noqa
+                elif next_cursor_from_data and next_cursor_from_data != cursor and next_cursor_from_data not in seen_cursors: chain_state['cursor'] = next_cursor_from_data; seen_cursors.add(next_cursor_from_data) # noqa
+                else: chain_state['done'] = True
+            chain_state['seen_cursors'] = sorted(seen_cursors)
+            blocked_from = time.perf_counter(); await page_queue.put((label, key, batch_num, reviews_to_process, chain_state)) # Backpressure # noqa
+            shared['stats'].add('fetch', blocked=time.perf_counter() - blocked_from)
+            if stop_reason: print(f"{label}BREAKING: {stop_reason}", file=sys.stderr); break
+
+    return batch_num, max_iterations
+
+
+async def review_formatter(page_queue, write_queue, stats, with_store=False):
+    """
+    Middle pipeline stage: formats queued pages (and their review store rows) in arrival order on a
+    worker thread and passes them on to the bounded write queue. Forwards the None sentinel and returns.
+    """
+    while True:
+        item = await page_queue.get()
+        if item is None: await write_queue.put(None); return
+        reviews_to_process = item[3]
+        busy_from = time.perf_counter()
+        formatted = await asyncio.to_thread(format_review_batch, reviews_to_process, True, with_store) if reviews_to_process else None
+        blocked_from = time.perf_counter(); stats.add('format', pages=1, reviews=len(reviews_to_process), busy=blocked_from - busy_from) # noqa
+        await write_queue.put(item + (formatted,))
+        stats.add('format', blocked=time.perf_counter() - blocked_from)
+
+
+async def review_writer(write_queue, file_handle, ids_handle, archive_handle, max_reviews, checkpoint, checkpoint_path, stats, on_event=None, store=None, line_index=None): # noqa
+    """
+    Last pipeline stage: writes formatted pages in arrival order (also into `store` and `line_index`).
+    After each flushed page the chain's resume state, the running total and the output/ID sidecar
+    sizes are checkpointed.
+    Each written page is reported to `on_event` as a 'reviews' and a 'progress' event.
+    Returns total written.
+    """
+    total_written = checkpoint['total_fetched']; pages_written = 0
+    while True:
+        item = await write_queue.get()
+        if item is None: return total_written
+        label, key, batch_num, reviews_to_process, chain_state, formatted = item
+        written = 0; busy_from = time.perf_counter()
+        if reviews_to_process:
+            written = await asyncio.to_thread(write_formatted_batch, file_handle, formatted, len(reviews_to_process), ids_handle, archive_handle, store, line_index) # noqa
+            total_written += written
+            print(f"{label}Batch {batch_num}: Written: {written}. Total written: {total_written}/{max_reviews} (Rate: {get_limiter().describe()})")
+            if on_event is not None:
+                on_event({'type': 'reviews', 'partition': key, 'batch': batch_num, 'reviews': reviews_to_process})
+                on_event({'type': 'progress', 'partition': key, 'batch': batch_num, 'written': written, 'total': total_written, 'max': max_reviews, 'rate': get_limiter().rate}) # noqa
+        checkpoint['chains'][key] = chain_state; checkpoint['total_fetched'] = total_written; checkpoint['output_bytes'] = file_handle.tell(); checkpoint['ids_bytes'] = ids_handle.tell(); checkpoint['archive_bytes'] = archive_handle.tell() # noqa
+        try: save_checkpoint(checkpoint_path, checkpoint)
+        except OSError as ckpt_e: print(f"\nreviews.py: Warn: Could not write checkpoint: {ckpt_e}", file=sys.stderr)
+        stats.add('write', pages=1, reviews=written, busy=time.perf_counter() - busy_from); pages_written += 1
+        if pages_written % PIPELINE_STATS_EVERY == 0: print("\n".join(stats.summary_lines()))
+
+
+async def scrape_reviews_async(app_id, args, output_filename, partitions=None, checkpoint=None, known=None, on_event=None, cancel_event=None): # noqa
+    """
+    Runs one cursor chain per partition concurrently (a single chain when partitions is None)
+    and merges them into one output file through a single writer. Game details for the header
+    are fetched in parallel with the first pages.
+    With a checkpoint, the output is truncated to the last checkpointed size and appended to,
+    and every chain continues from its saved cursor (finished chains are skipped).
+    With `known` (incremental mode) no header is written; the output holds only the new reviews.
+    Raw review dicts are appended to `args.archive` (default: output + ARCHIVE_SUFFIX), which is
+    never truncated except to drop pages written after the checkpoint being resumed.
+    Every page is also inserted into the review store (output + STORE_SUFFIX); rows are keyed by
+    recommendation ID, so pages re-fetched after a resume replace their earlier copies. The output's
+    line index (line_index.py) is extended after every page and cut back with the output on resume.
+    Pages flow fetch -> format -> write through bounded queues (PIPELINE_QUEUE_PAGES), so a slow
+    disk pauses fetching instead of buffering the whole scrape; per-stage throughput is printed
+    and sent to `on_event` as a 'stats' event at the end.
+    Once `cancel_event` is set the chains stop before their next request and the queues drain.
+    Returns (total_fetched, hit_iteration_cap).
+    """
+    partitions = partitions or [{}]
+    resuming = checkpoint is not None
+    checkpoint = checkpoint if resuming else new_checkpoint(app_id, args)
+    checkpoint_path = checkpoint_path_for(output_filename)
+    stats = PipelineStats()
+    shared = {'total_scheduled': checkpoint['total_fetched'], 'seen_ids': set(), 'cancel_event': cancel_event, 'stats': stats}
+    page_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_PAGES); write_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+    ids_filename = output_filename + IDS_SUFFIX; archive_filename = args.archive or archive_path_for(output_filename)
+    output_file_handle = None; ids_file_handle = None; archive_file_handle = None; store = None; line_index = None; writer_task = None; formatter_task = None; gather_task = None; details_task = None; details_session = None; # noqa
+    total_fetched = checkpoint['total_fetched']; hit_iteration_cap = False
+
+    try:
+        if not resuming and known is None:
+            details_session = requests.Session()
+            details_session.headers.update({'User-Agent': 'Mozilla/5.0 SteamReviewAnalyzer/1.3'})
+            print("Fetching game details for header (in parallel with first page)...")
+            details_task = asyncio.create_task(asyncio.to_thread(get_initial_game_data, details_session, app_id))
+        chain_tasks = []
+        for overrides in partitions:
+            start_state = checkpoint['chains'].get(partition_key(overrides), {})
+            if start_state.get('done'): print(f"{partition_label(overrides)}Chain already finished in checkpoint, skipping."); continue # noqa
+            chain_tasks.append(asyncio.create_task(walk_cursor_chain(app_id, argparse.Namespace(**{**vars(args), **overrides}), partition_label(overrides), partition_key(overrides), start_state, shared, page_queue, known))) # noqa
+        gather_task = asyncio.gather(*chain_tasks)
+
+        if resuming:
+            print(f"Resuming output file: {output_filename} ({checkpoint['total_fetched']} reviews, {checkpoint['output_bytes']} bytes)") # noqa
+            with open(output_filename, 'r+b') as f: f.truncate(checkpoint['output_bytes']) # Drop any page written after the last checkpoint # noqa
+            output_file_handle = open(output_filename, 'a', encoding='utf-8')
+            with open(ids_filename, 'a+b') as f: f.truncate(checkpoint.get('ids_bytes', 0))
+            ids_file_handle = open(ids_filename, 'a', encoding='utf-8')
+            if 'archive_bytes' in checkpoint and os.path.exists(archive_filename):
+                with open(archive_filename, 'r+b') as f: f.truncate(checkpoint['archive_bytes'])
+            archive_file_handle = open(archive_filename, 'ab')
+            store = ReviewStore(store_path_for(output_filename))
+            line_index = LineIndexWriter(output_filename, truncate_to=checkpoint['output_bytes'])
+        else:
+            print(f"Opening output file: {output_filename}"); output_file_handle = open(output_filename, 'w', encoding='utf-8'); # noqa
+            ids_file_handle = open(ids_filename, 'w', encoding='utf-8')
+            archive_file_handle = open(archive_filename, 'ab'); archive_file_handle.seek(0, os.SEEK_END) # Appends to earlier scrapes of this game # noqa
+            checkpoint['archive_bytes'] = archive_file_handle.tell()
+            store = ReviewStore(store_path_for(output_filename), reset=True)
+            if known is None: store.set_header(write_file_header(output_file_handle, app_id, await details_task, args.max))
+            checkpoint['output_bytes'] = output_file_handle.tell(); save_checkpoint(checkpoint_path, checkpoint)
+            line_index = LineIndexWriter(output_filename) # The output was just truncated, so this starts a new index
+        print(f"Starting review scraping loop ({len(chain_tasks)} chain{'s' if len(chain_tasks) != 1 else ''})...")
+        formatter_task = asyncio.create_task(review_formatter(page_queue, write_queue, stats, with_store=True))
+        writer_task = asyncio.create_task(review_writer(write_queue, output_file_handle, ids_file_handle, archive_file_handle, args.max, checkpoint, checkpoint_path, stats, on_event, store, line_index)) # noqa
+
+        # A format/write error ends the run even while chains are still fetching
+        done, _ = await asyncio.wait([gather_task, formatter_task, writer_task], return_when=asyncio.FIRST_COMPLETED)
+        for stage_task in (formatter_task, writer_task):
+            if stage_task in done: stage_task.result(); raise ScrapeAbort("Pipeline stage ended early.") # Re-raises the stage's error first # noqa
+        chain_results = gather_task.result()
+        await page_queue.put(None); total_fetched = await writer_task
+        hit_iteration_cap = any(batch_num >= max_iterations for batch_num, max_iterations in chain_results)
+    finally:
+        if gather_task is not None and not gather_task.done(): gather_task.cancel()
+        if details_task is not None and not details_task.done(): details_task.cancel()
+        if details_session is not None: details_session.close()
+        if writer_task is not None and not writer_task.done(): # Drain pages already fetched so partial output is complete
+            if formatter_task is not None and not formatter_task.done(): await page_queue.put(None)
+            else: await write_queue.put(None)
+            try: await writer_task
+            except ScrapeAbort: pass # Already reported
+        if formatter_task is not None and not formatter_task.done(): formatter_task.cancel()
+        if writer_task is not None:
+            print("\n".join(stats.summary_lines()))
+            if on_event is not None: on_event({'type': 'stats', **stats.as_dict()})
+        for sidecar_handle in (ids_file_handle, archive_file_handle):
+            if sidecar_handle:
+                try: sidecar_handle.close()
+                except Exception as close_e: print(f"Error closing {sidecar_handle.name}: {close_e}", file=sys.stderr) # noqa
+        if store is not None:
+            try: store.close()
+            except Exception as close_e: print(f"Error closing {store.path}: {close_e}", file=sys.stderr)
+        if line_index is not None:
+            try: line_index.close()
+            except Exception as close_e: print(f"Error closing {line_index.index_path}: {close_e}", file=sys.stderr)
+        # --- Ensure file is closed ---
+        if output_file_handle:
+            try: output_file_handle.close(); print(f"Output file '{output_filename}' closed."); # noqa
+            except Exception as close_e: print(f"Error closing output: {close_e}", file=sys.stderr); # noqa
+        else: print("Notice: Output file not opened.", file=sys.stderr); # noqa
+
+    return total_fetched, hit_iteration_cap
+
+
+# --- In-Process Scraper ---
+def build_arg_parser():
     parser = argparse.ArgumentParser(description="Scrape Steam reviews.")
     parser.add_argument('--max', type=int, default=DEFAULT_MAX_REVIEWS, help=f"Max reviews (default: {DEFAULT_MAX_REVIEWS})") # noqa
     parser.add_argument('--num', type=int, default=DEFAULT_NUM_PER_PAGE, choices=range(1, 101), metavar='[1-100]', help=f"Reviews per page (default: {DEFAULT_NUM_PER_PAGE})") # noqa
-    parser.add_argument('--sleep', type=float, default=DEFAULT_SLEEP_DURATION, help=f"Sleep (sec, default: {DEFAULT_SLEEP_DURATION})") # noqa
+    parser.add_argument('--sleep', type=float, default=DEFAULT_SLEEP_DURATION, help=f"Initial seconds between requests; the rate then adapts up to {STEAM_RATE_LIMIT['max_rate']} req/s (default: {DEFAULT_SLEEP_DURATION})") # noqa
     parser.add_argument('--language', type=str, default=DEFAULT_LANGUAGE, help=f"Language filter (default: {DEFAULT_LANGUAGE})") # noqa
     parser.add_argument('--review_type', type=str, default=DEFAULT_REVIEW_TYPE, choices=['all', 'positive', 'negative'], help=f"Review type filter (default: {DEFAULT_REVIEW_TYPE})") # noqa
     parser.add_argument('--purchase_type', type=str, default=DEFAULT_PURCHASE_TYPE, choices=['all', 'steam', 'non_steam_purchase'], help=f"Purchase type filter (default: {DEFAULT_PURCHASE_TYPE})") # noqa
@@ -85,146 +633,139 @@ if __name__ == "__main__":
     parser.add_argument('--playtime', type=str, default=DEFAULT_PLAYTIME, help=f"Min playtime filter (hours, 0=any; default: {DEFAULT_PLAYTIME})") # noqa
     parser.add_argument('--filter_by', type=str, default=DEFAULT_FILTER_BY, choices=['all', 'recent', 'updated'], help=f"Filter/Sort order (default: {DEFAULT_FILTER_BY})") # noqa
     parser.add_argument('--beta', type=str, default=DEFAULT_BETA, choices=['0', '1'], help=f"Include beta reviews (0=No, 1=Yes; default: {DEFAULT_BETA})") # noqa
-    args = parser.parse_args()
+    parser.add_argument('--partition', type=str, default="", help=f"Comma-separated filters to split into parallel cursor chains ({', '.join(PARTITION_DIMENSIONS)}; default: none)") # noqa
+    parser.add_argument('--incremental', action='store_true', help="Only fetch reviews newer than those already on disk (forces --filter_by recent, no header)") # noqa
+    parser.add_argument('--known_ids', type=str, default="", help=f"{IDS_SUFFIX} sidecar of reviews already on disk (stops --incremental at the first match)") # noqa
+    parser.add_argument('--since', type=int, default=0, help="Unix time; --incremental also stops at reviews created before it (default: newest in --known_ids)") # noqa
+    parser.add_argument('--archive', type=str, default="", help=f"Raw review archive to append to (default: output + {ARCHIVE_SUFFIX})") # noqa
+    parser.add_argument('--rerender', type=str, default="", metavar='REVIEWS_TXT', help=f"Regenerate REVIEWS_TXT (and its review store) from REVIEWS_TXT{ARCHIVE_SUFFIX} (no network, no App ID) and exit") # noqa
+    parser.add_argument('--resume', action='store_true', help=f"Continue appending to the output from its {CHECKPOINT_SUFFIX} file") # noqa
+    return parser
 
-    # --- Use Parsed Arguments (Unchanged) ---
-    max_reviews_to_fetch = args.max; num_per_page_to_fetch = args.num; sleep_between_requests = args.sleep; request_timeout_seconds = DEFAULT_REQUEST_TIMEOUT; # noqa
-    max_iterations = (max_reviews_to_fetch // num_per_page_to_fetch) + 50 if num_per_page_to_fetch > 0 else max_reviews_to_fetch + 50 # noqa
+
+def scrape_options(**overrides):
+    """Command-line defaults as a Namespace, with keyword overrides (e.g. scrape_options(max=500, resume=True))."""
+    options = build_arg_parser().parse_args([])
+    for name, value in overrides.items():
+        if not hasattr(options, name): raise TypeError(f"Unknown scrape option: {name}")
+        setattr(options, name, value)
+    return options
+
+
+class ReviewScraper:
+    """
+    Importable front end of the scrape engine, used in-process by the GUI and by the
+    command-line wrapper below. Construction validates resume/incremental state and raises
+    ScrapeAbort if the run cannot start.
+
+    `run(on_event)` scrapes on the calling thread; `events()` runs it on a worker thread and
+    yields the same dict events:
+        {'type': 'reviews', 'partition', 'batch', 'reviews': [Steam review dicts]}
+        {'type': 'progress', 'partition', 'batch', 'written', 'total', 'max', 'rate'}
+        {'type': 'stats', 'elapsed', 'bottleneck', 'stages': {stage: {'pages', 'reviews', 'busy', 'paced', 'blocked'}}}
+        {'type': 'done', 'total', 'hit_iteration_cap', 'cancelled'}
+        {'type': 'error', 'message'}
+    Setting `cancel_event` (a threading.Event) stops every chain before its next request; pages
+    already fetched are still written and the checkpoint is kept for a later resume.
+    """
+
+    def __init__(self, app_id, options=None, output_filename=OUTPUT_FILENAME, cancel_event=None):
+        self.app_id = str(app_id); self.options = options or scrape_options(); self.output_filename = output_filename; # noqa
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.checkpoint_path = checkpoint_path_for(output_filename)
+        # --- Resume: filters/partitions come from the checkpoint so the cursors stay valid ---
+        self.checkpoint = None
+        if self.options.resume:
+            self.checkpoint = load_checkpoint(self.checkpoint_path, self.app_id)
+            if self.checkpoint is None or not os.path.exists(output_filename): self._abort("Cannot resume (missing checkpoint or output).") # noqa
+            for name, value in self.checkpoint['filters'].items(): setattr(self.options, name, value)
+        elif os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path) # Stale checkpoint from an earlier run
+        self.known = None
+        if self.options.incremental:
+            if self.options.filter_by != 'recent': print(f"Notice: --incremental walks newest first; using --filter_by recent instead of {self.options.filter_by}.", file=sys.stderr); self.options.filter_by = 'recent' # noqa
+            try: known_ids, newest = load_known_reviews(self.options.known_ids)
+            except (OSError, UnicodeDecodeError) as e: self._abort(f"Unreadable --known_ids: {e}")
+            self.known = {'ids': known_ids, 'since': self.options.since or newest}
+            if not self.known['ids'] and not self.known['since']: self._abort("--incremental needs --known_ids or --since.") # noqa
+        self.partitions = build_partitions(self.options, [d.strip() for d in self.options.partition.split(',') if d.strip()]) # noqa
+
+    @staticmethod
+    def _abort(message):
+        print(f"reviews.py: Error: {message}", file=sys.stderr)
+        raise ScrapeAbort(message)
+
+    def run(self, on_event=None):
+        """Scrapes to completion, cancellation or ScrapeAbort. Returns (total_fetched, hit_iteration_cap, cancelled).""" # noqa
+        # The shared limiter may exist already (game name lookup) or still be slowed by an earlier scrape: start from --sleep # noqa
+        get_limiter().reset(1.0 / self.options.sleep if self.options.sleep > 0 else STEAM_RATE_LIMIT['max_rate'])
+        total_fetched, hit_iteration_cap = asyncio.run(scrape_reviews_async(self.app_id, self.options, self.output_filename, self.partitions, self.checkpoint, self.known, on_event, self.cancel_event)) # noqa
+        cancelled = self.cancel_event.is_set()
+        if not cancelled: # Completed run: nothing left to resume
+            try: os.remove(self.checkpoint_path)
+            except OSError: pass
+        return total_fetched, hit_iteration_cap, cancelled
+
+    def events(self):
+        """Runs the scrape on a worker thread and yields its events; closing the generator early cancels the scrape.""" # noqa
+        event_queue = queue.Queue()
+        def _worker():
+            try:
+                total_fetched, hit_iteration_cap, cancelled = self.run(event_queue.put)
+                event_queue.put({'type': 'done', 'total': total_fetched, 'hit_iteration_cap': hit_iteration_cap, 'cancelled': cancelled}) # noqa
+            except ScrapeAbort as e: event_queue.put({'type': 'error', 'message': str(e)})
+            except Exception as e: print(traceback.format_exc(), file=sys.stderr); event_queue.put({'type': 'error', 'message': f"Unexpected error: {e}"}) # noqa
+            finally: event_queue.put(None)
+        worker = threading.Thread(target=_worker, daemon=True); worker.start()
+        try:
+            while True:
+                event = event_queue.get()
+                if event is None: break
+                yield event
+        finally:
+            if worker.is_alive(): self.cancel_event.set()
+            worker.join()
+
+    def records(self):
+        """Yields every written review dict; raises ScrapeAbort if the scrape fails."""
+        for event in self.events():
+            if event['type'] == 'reviews': yield from event['reviews']
+            elif event['type'] == 'error': raise ScrapeAbort(event['message'])
+
+
+# --- Main Script (subprocess mode: App ID on stdin, progress on stdout) ---
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+
+    # --- Re-render mode: rebuild a reviews file from its raw archive ---
+    if args.rerender:
+        try: print(f"Re-rendered {rerender_reviews(args.rerender, args.archive or None)} reviews into {args.rerender}"); sys.exit(0) # noqa
+        except (ScrapeAbort, OSError) as e: print(f"reviews.py: Error: Re-render failed: {e}", file=sys.stderr); sys.exit(1) # noqa
 
     # --- Get App ID ---
     app_id = get_validated_app_id()
     if app_id is None: sys.exit(1) # Error printed in helper
 
-    # --- Initialize state ---
-    cursor = '*'; seen_cursors = {cursor}; total_fetched = 0; batch_num = 0; api_errors = 0; output_file_handle = None; # noqa
+    try: scraper = ReviewScraper(app_id, args, OUTPUT_FILENAME)
+    except ScrapeAbort: sys.exit(1) # Reason already printed
+    incremental_desc = f"{len(scraper.known['ids'])} known IDs, since {scraper.known['since']}" if scraper.known else "No" # noqa
+    partitions = scraper.partitions
 
     # --- Logging Setup (Unchanged) ---
-    print(f"--- Steam Review Scraper ---"); print(f"App ID: {app_id}"); print(f"Target: {max_reviews_to_fetch}"); print(f"Per Page: {num_per_page_to_fetch}"); print(f"Sleep: {sleep_between_requests}s"); print(f"Timeout: {request_timeout_seconds}s"); print(f"Output: {OUTPUT_FILENAME}"); print("-" * 10 + " Filters " + "-" * 10); print(f"Lang: {args.language}"); print(f"Type: {args.review_type}"); print(f"Purchase: {args.purchase_type}"); print(f"Date: {args.day_range}"); print(f"Playtime: {args.playtime}"); print(f"FilterBy: {args.filter_by}"); print(f"Beta: {'Yes' if args.beta == '1' else 'No'}"); print("-" * 30); # noqa
-
-    try: # Wrap main logic in try/finally
-        with requests.Session() as session:
-            session.headers.update({'User-Agent': 'Mozilla/5.0 SteamReviewAnalyzer/1.3'})
-            print("Fetching game details for header..."); game_details = get_initial_game_data(session, app_id); # noqa
-            print(f"Opening output file: {OUTPUT_FILENAME}"); output_file_handle = open(OUTPUT_FILENAME, 'w', encoding='utf-8'); # noqa
-            output_file_handle.write("="*50 + "\n"); output_file_handle.write(f"Game: {game_details['name']}\n"); output_file_handle.write(f"AppID: {app_id}\n"); output_file_handle.write(f"Release Date: {game_details['release_date']}\n"); output_file_handle.write(f"Review Score: {game_details['review_desc']} ({game_details['total_reviews']} total)\n"); output_file_handle.write(f"Scrape Target: {max_reviews_to_fetch}\n"); output_file_handle.write(f"Scrape Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"); output_file_handle.write("="*50 + "\n\n"); # noqa
-            output_file_handle.flush() # Flush header immediately
-
-            print(f"Starting review scraping loop...")
-
-            # --- Main Fetch Loop ---
-            while total_fetched < max_reviews_to_fetch and batch_num < max_iterations:
-                batch_num += 1
-                print(f"\nBatch {batch_num}: Fetching (Cursor: '{str(cursor)[:20]}...'). Total written: {total_fetched}", end='')  # noqa
-
-                params = { 'json': '1', 'language': args.language, 'review_type': args.review_type, 'purchase_type': args.purchase_type, 'filter': args.filter_by, 'day_range': args.day_range, 'playtime_filter_min': args.playtime, 'review_beta_enabled': args.beta, 'num_per_page': str(num_per_page_to_fetch), 'cursor': cursor }; url = f'https://store.steampowered.com/appreviews/{app_id}'; # noqa
-
-                # API Request with Retries (Unchanged logic)
-                response_data = None
-                try: response = session.get(url, params=params, timeout=request_timeout_seconds); print(f" -> HTTP {response.status_code}", end=''); response.raise_for_status(); response_data = response.json(); api_errors = 0; # noqa
-                except requests.exceptions.Timeout:
-                    print(f"\nreviews.py: Error: Timeout.", file=sys.stderr)
-                    api_errors += 1
-                    if api_errors >= 3:
-                        print("Timeout limit.", file=sys.stderr)
-                        sys.exit(1)
-                    sleep_time = sleep_between_requests * (2 ** api_errors)
-                    print(f"Retrying after {sleep_time:.1f}s...", file=sys.stderr)
-                    time.sleep(sleep_time)
-                    batch_num -= 1
-                    continue  # noqa
-                except requests.exceptions.RequestException as e:
-                    print(f"\nreviews.py: Error: Network: {e}", file=sys.stderr)
-                    api_errors += 1
-                    if api_errors >= 3:
-                        print("Network limit.", file=sys.stderr)
-                        sys.exit(1)
-                    sleep_time = sleep_between_requests * (2 ** api_errors)
-                    print(f"Retrying after {sleep_time:.1f}s...", file=sys.stderr)
-                    time.sleep(sleep_time)
-                    batch_num -= 1
-                    continue
-                except json.JSONDecodeError:
-                    print(f"\nreviews.py: Error: Invalid JSON.", file=sys.stderr)
-                    print(f"Response: {response.text[:500]}", file=sys.stderr)
-                    print("Stopping.", file=sys.stderr)
-                    sys.exit(1)
-
-                # Check API Success (Unchanged logic)
-                api_success_code = response_data.get('success')
-                next_cursor_from_data = response_data.get('cursor')  # noqa
-
-                if api_success_code != 1:
-                    print(f"\nAPI fail code: {api_success_code}", file=sys.stderr)
-                    print(f"Query: {response_data.get('query_summary', {})}", file=sys.stderr)
-                    if not response_data.get('reviews') and next_cursor_from_data is None:
-                        print("API fail but looks like end. Finishing.", file=sys.stderr)
-                        print("BREAKING: API fail, no reviews/cursor.", file=sys.stderr)
-                        break
-                    else:
-                        print("Stopping: API failure code.", file=sys.stderr)
-                        sys.exit(1)  # noqa
-
-                # --- Process & WRITE Reviews ---
-                new_reviews = response_data.get('reviews', [])
-                num_in_batch = len(new_reviews)
-                print(f", Got {num_in_batch}", end='') # Status update
-
-                reviews_actually_written = 0
-                if new_reviews:
-                    reviews_to_process = new_reviews[:max(0, max_reviews_to_fetch - total_fetched)]
-                    for review_dict in reviews_to_process:
-                        formatted_line = format_review_for_file(review_dict)
-                        try: output_file_handle.write(formatted_line); reviews_actually_written += 1; # noqa
-                        except Exception as write_e: rec_id = review_dict.get('recommendationid', 'N/A'); print(f"\nWrite Error ID {rec_id}: {write_e}", file=sys.stderr); print("Stopping: Write error.", file=sys.stderr); sys.exit(1); # noqa
-
-                    total_fetched += reviews_actually_written
-                    print(f". Written: {reviews_actually_written}. Total: {total_fetched}/{max_reviews_to_fetch}") # noqa
-
-                    # --- ADDED FLUSH ---
-                    try:
-                        output_file_handle.flush()
-                        # Optionally sync to ensure OS writes to disk, might be slow:
-                        # os.fsync(output_file_handle.fileno())
-                    except Exception as flush_e:
-                         # Log error but don't necessarily stop the whole process
-                         print(f"\nreviews.py: Warn: Error flushing file buffer: {flush_e}", file=sys.stderr)
-                    # --- END ADDED FLUSH ---
-
-                else: # No new reviews in this batch
-                     print(f". Total: {total_fetched}/{max_reviews_to_fetch}") # Still print total
-
-                # --- Check Loop Termination Conditions (Unchanged logic) ---
-                if not new_reviews and (next_cursor_from_data is None or next_cursor_from_data == ''): print("\nNo reviews/cursor. End.", file=sys.stderr); print("BREAKING: No reviews/cursor.", file=sys.stderr); break; # noqa
-                if not new_reviews and next_cursor_from_data is not None and next_cursor_from_data != '':
-                     if next_cursor_from_data != cursor:
-                          if next_cursor_from_data in seen_cursors: print("\nRepeat cursor empty batch. Stop.", file=sys.stderr); print("BREAKING: Repeat cursor empty batch.", file=sys.stderr); break; # noqa
-                          else: print("\nEmpty batch, new cursor.", file=sys.stderr); cursor = next_cursor_from_data; seen_cursors.add(cursor); print(f"Sleeping {sleep_between_requests}s..."); time.sleep(sleep_between_requests); continue; # noqa
-                     else: print("\nEmpty batch, cursor same. End.", file=sys.stderr); print("BREAKING: Empty batch, cursor same.", file=sys.stderr); break; # noqa
-                if total_fetched >= max_reviews_to_fetch: print(f"\nTarget reached ({max_reviews_to_fetch})."); print("BREAKING: Max reviews.", file=sys.stderr); break; # noqa
-                if next_cursor_from_data and next_cursor_from_data != cursor:
-                    if next_cursor_from_data in seen_cursors: print("\nRepeat cursor. Stop.", file=sys.stderr); print("BREAKING: Repeat cursor.", file=sys.stderr); break; # noqa
-                    cursor = next_cursor_from_data; seen_cursors.add(cursor); # noqa
-                elif not next_cursor_from_data or next_cursor_from_data == cursor: print("\nNo new/changed cursor. End.", file=sys.stderr); print("BREAKING: No new/changed cursor.", file=sys.stderr); break; # noqa
-
-                # Sleep before next request
-                print(f"Sleeping {sleep_between_requests}s...")
-                time.sleep(sleep_between_requests)
-            # --- End of while loop ---
+    print(f"--- Steam Review Scraper ---"); print(f"App ID: {app_id}"); print(f"Target: {args.max}"); print(f"Per Page: {args.num}"); print(f"Sleep: {args.sleep}s (initial, adaptive {STEAM_RATE_LIMIT['min_rate']}-{STEAM_RATE_LIMIT['max_rate']} req/s)"); print(f"Timeout: {DEFAULT_REQUEST_TIMEOUT}s"); print(f"Output: {OUTPUT_FILENAME}" + (" (resume)" if args.resume else "")); print("-" * 10 + " Filters " + "-" * 10); print(f"Lang: {args.language}"); print(f"Type: {args.review_type}"); print(f"Purchase: {args.purchase_type}"); print(f"Date: {args.day_range}"); print(f"Playtime: {args.playtime}"); print(f"FilterBy: {args.filter_by}"); print(f"Beta: {'Yes' if args.beta == '1' else 'No'}"); print(f"Incremental: {incremental_desc}"); print(f"Partitions: {len(partitions)}" + (f" ({', '.join(partition_label(p).strip() for p in partitions)})" if len(partitions) > 1 else "")); print("-" * 30); # noqa
+
+    try: # Wrap main logic
+        total_fetched, hit_iteration_cap, _ = scraper.run()
 
         # --- Loop finished ---
-        if batch_num >= max_iterations and total_fetched < max_reviews_to_fetch: print(f"\nWarn: Max iterations reached ({max_iterations}).", file=sys.stderr); # noqa
+        if hit_iteration_cap and total_fetched < args.max: print(f"\nWarn: Max iterations reached on a cursor chain.", file=sys.stderr); # noqa
         print(f"\nScraping loop finished. Total reviews written: {total_fetched}")
 
+    except ScrapeAbort:
+        sys.exit(1) # Reason already printed by the engine
     except Exception as main_e: # Catch errors outside loop
         print(f"\nreviews.py: CRITICAL ERROR: {main_e}", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr); sys.exit(1); # noqa
 
-    finally:
-        # --- Ensure file is closed ---
-        if output_file_handle:
-            try: output_file_handle.close(); print(f"Output file '{OUTPUT_FILENAME}' closed."); # noqa
-            except Exception as close_e: print(f"Error closing output: {close_e}", file=sys.stderr); # noqa
-        else: print("Notice: Output file not opened.", file=sys.stderr); # noqa
-
     print("\nScraping script execution complete.")
-    sys.exit(0) # Success exit code
\ No newline at end of file
+    sys.exit(0) # Success exit code
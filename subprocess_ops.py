@@ -10,6 +10,7 @@ from tkinter import messagebox
 def execute_reviews_script(root, command, steam_app_id, progress_callback, log_func):
     """
     Executes the reviews.py script as a subprocess, handling I/O and progress.
+    (Out-of-process mode; the GUI drives reviews.ReviewScraper in-process instead.)
 
     Args:
         root: The main Tkinter root window (for update_idletasks).
@@ -76,7 +77,7 @@ def execute_reviews_script(root, command, steam_app_id, progress_callback, log_f
                         log_func(f"SCRIPT: {line_strip}")
 
                         # Match progress line
-                        match = re.search(r'Total so far:\s*(\d+)', line_strip, re.IGNORECASE)
+                        match = re.search(r'Total written:\s*(\d+)', line_strip, re.IGNORECASE) # Progress line printed by reviews.py
                         if match:
                             try:
                                 current_reviews_scraped = int(match.group(1))
@@ -26,20 +26,25 @@ class TaskManager:
                 self.widgets['scrape_button'], self.widgets['stop_button'],
                 self.widgets['optimize_button'], self.widgets['load_button'],
                 self.widgets['strip_button'], # <-- Added strip_button here
+                self.widgets['rerender_button'],
                 self.widgets['ai_send_optimized_button'], self.widgets['ai_send_original_button']
             ]
             setting_entries = [
                 self.widgets['max_reviews_entry'], self.widgets['token_threshold_entry'],
-                self.widgets['sleep_duration_entry'], self.widgets['num_per_page_entry']
+                self.widgets['sleep_duration_entry'], self.widgets['num_per_page_entry'],
+                self.widgets.get('stratified_sampling_checkbox'), self.widgets.get('dedupe_checkbox')
             ]
             filter_widgets = [
                 self.widgets.get('filter_language_combo'), self.widgets.get('filter_review_type_option'), # noqa
                 self.widgets.get('filter_purchase_type_option'), self.widgets.get('filter_date_range_option'), # noqa
                 self.widgets.get('filter_playtime_option'), self.widgets.get('filter_filter_by_option'), # noqa
-                self.widgets.get('filter_beta_checkbox')
+                self.widgets.get('filter_beta_checkbox'), self.widgets.get('filter_partition_checkbox'), self.widgets.get('filter_incremental_checkbox') # noqa
             ]
             other_controls = [
                 self.widgets['fetch_name_button'], self.widgets['model_combobox'],
+                self.widgets.get('ai_retrieval_checkbox'), self.widgets.get('ai_retrieval_budget_entry'),
+                self.widgets.get('ai_map_reduce_checkbox'), self.widgets.get('ai_cache_bypass_checkbox'),
+                self.widgets.get('ai_stream_checkbox'), self.widgets.get('ai_context_cache_checkbox'),
                 self.widgets['game_name_entry'], self.widgets['steam_id_entry'],
                 self.widgets.get('filter_menu'), self.widgets.get('refresh_browser_button'),
             ]
@@ -134,7 +139,7 @@ class TaskManager:
             if action_type in ["ai", "load"]:
                 if isinstance(result, tuple) and len(result) == 3: action_result["success"], action_result["data"], action_result["full_text"] = result # noqa
                 else: self.log_func(f"Warn: Bad return from {action_type}: {result}"); action_result["success"] = False # noqa
-            elif action_type in ["scrape", "optimize", "strip"]: # <-- Added 'strip' here
+            elif action_type in ["scrape", "optimize", "strip", "rerender"]: # <-- Added 'strip' here
                 action_result["success"] = bool(result) # Expecting True/False
             else:
                 action_result["success"] = bool(result) # Default assumption
@@ -176,6 +181,7 @@ class TaskManager:
 
             # --- Update Right Panel (AI/Load) ---
             if action_type in ["ai", "load"]:
+                self.gui_manager.end_stream() # The final result replaces any streamed preview
                 action_succeeded = action_result.get("success", False)
                 returned_csv_data = action_result.get("data"); returned_full_text = action_result.get("full_text"); # noqa
                 if action_succeeded:
@@ -190,7 +196,7 @@ class TaskManager:
             # --- Update Token Display ---
             # Only update after scrape/optimize success, or AI/Load actions.
             # Stripping doesn't currently recalculate tokens, so no update needed.
-            if (action_type in ["scrape", "optimize"] and action_result.get("success")) or \
+            if (action_type in ["scrape", "optimize", "rerender"] and action_result.get("success")) or \
                (action_type in ["ai", "load"]):
                  try: self.root.after(50, self.gui_manager.update_token_display) # noqa
                  except Exception as e: self.log_func(f"Error scheduling token update: {e}") # noqa
@@ -0,0 +1,40 @@
+# test_optimize.py
+"""Tests for optimize.py (run with `python -m pytest`)."""
+import os
+
+import pytest
+
+from optimize import NearDuplicateIndex, clean_line, clean_line_reference
+
+REVIEWS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Games_Reviews') # Saved scrapes, if present
+
+PARITY_LINES = [
+    "", "   \n", "Date 2024-01-02 Playtime 3h 5m Rec Positive Great game!!! 10/10...\n",
+    "see https://example.com/x?y=1, or WWW.Example.org. now", "wait...what?? -- ok;; fine::",
+    "\"quoted\" (parens) [brackets] 'single' --- !!! ...", "tabs\tand\x0bodd\x1fwhitespace here too",
+    "emoji ok 👍👍 ✅done ❌ ☑ ☐ 👎!", "mixed café naïve 日本語 👍x 🙂 ok", "Привет мир, hello world!",
+    "👍️ variation selector", "a.b.c e.g. i.e., U.S.A.", "...--!!", "- - - -", "x" * 50 + "!" * 20,
+]
+
+
+def test_clean_line_matches_reference_on_edge_cases():
+    for line in PARITY_LINES:
+        assert clean_line(line) == clean_line_reference(line), line
+
+
+@pytest.mark.skipif(not os.path.isdir(REVIEWS_DIR), reason="No saved reviews to compare on")
+def test_clean_line_matches_reference_on_saved_reviews():
+    for folder, subfolders, filenames in os.walk(REVIEWS_DIR):
+        for filename in sorted(name for name in filenames if name.endswith('.txt')):
+            with open(os.path.join(folder, filename), 'r', encoding='utf-8', errors='replace') as f:
+                for line_number, line in enumerate(f, 1):
+                    assert clean_line(line) == clean_line_reference(line), f"{filename}:{line_number}"
+
+
+def test_near_duplicate_eviction_keeps_shared_band_keys():
+    # max_clusters=1: the second review evicts the first although they share band 0's key, the third evicts the second
+    index = NearDuplicateIndex(max_clusters=1)
+    signatures = [(1,) * 4 + (2,) * 12, (1,) * 4 + (3,) * 12, (9,) * 16]
+    assert [index.add(signature) for signature in signatures] == [(0, True), (1, True), (2, True)]
+    assert index.add(signatures[0]) == (3, True) # An evicted cluster no longer matches
+    assert set(index.buckets.values()) <= set(index.clusters) # No bucket points at an evicted cluster
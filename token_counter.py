@@ -0,0 +1,253 @@
+# token_counter.py
+"""
+One offline token estimate for everything that budgets Gemini context: optimize.py's threshold,
+the incremental merge, the GUI token display and the large-input warning before an AI request.
+
+A token count is modelled as a weighted sum of cheap per-line features (characters, words,
+punctuation, digits, non-ASCII characters, line breaks) times a per-model correction factor.
+The weights start from PRIOR_COEFFICIENTS and are refitted from the `promptTokenCount` values
+Gemini reports in `usageMetadata`, which api_handler records via record_usage() into
+TOKEN_CALIBRATION_FILE. File counts are cached per (path, size, mtime).
+
+    python token_counter.py FILE... [--model ID]   # count files
+    python token_counter.py --calibration          # show the fitted model and its error on the samples
+"""
+import argparse
+import json
+import os
+import statistics
+import string
+import sys
+import threading
+import zlib
+from itertools import repeat
+from operator import sub
+
+from config import TOKEN_CALIBRATION_FILE
+
+FEATURES = ('chars', 'words', 'punct', 'digits', 'non_ascii', 'newlines')
+
+# Starting weights (tokens per feature unit) for Gemini's SentencePiece vocabulary: English prose
+# lands near the old 4-characters-per-token rule, while punctuation, digit runs and non-Latin
+# scripts cost more per character. Refitted once calibration samples exist.
+PRIOR_COEFFICIENTS = {'chars': 0.05, 'words': 1.0, 'punct': 0.6, 'digits': 0.3, 'non_ascii': 0.8, 'newlines': 1.0}
+# How many samples' worth of weight the prior keeps in the refit (ridge strength).
+PRIOR_STRENGTH = 5.0
+# Below this many samples only the per-model correction factors are fitted.
+MIN_FIT_SAMPLES = 3
+
+_PUNCT_DELETE_TABLE = str.maketrans('', '', string.punctuation)
+_DIGIT_DELETE_TABLE = str.maketrans('', '', string.digits)
+
+
+def line_feature_columns(lines):
+    """
+    Feature columns for a list of lines (trailing newlines excluded), computed column-wise with
+    C-level map() passes instead of a Python loop per character. Returns {feature: [value per line]}.
+    """
+    chars = list(map(len, lines))
+    return {
+        'chars': chars,
+        'words': list(map(len, map(str.split, lines))),
+        'punct': list(map(sub, chars, map(len, map(str.translate, lines, repeat(_PUNCT_DELETE_TABLE))))),
+        'digits': list(map(sub, chars, map(len, map(str.translate, lines, repeat(_DIGIT_DELETE_TABLE))))),
+        'non_ascii': list(map(sub, chars, map(len, map(str.encode, lines, repeat('ascii'), repeat('ignore'))))),
+        'newlines': [1] * len(lines),
+    }
+
+
+def text_features(text):
+    """Summed features of a whole text (what a prompt containing it costs)."""
+    columns = line_feature_columns(text.split('\n'))
+    totals = {name: sum(values) for name, values in columns.items()}
+    totals['newlines'] -= 1 # n lines are joined by n-1 line breaks
+    return totals
+
+
+class TokenEstimator:
+    """Linear token model plus per-model correction factors. Immutable once built; see fit()."""
+
+    def __init__(self, coefficients=None, model_factors=None, sample_count=0):
+        self.coefficients = dict(PRIOR_COEFFICIENTS if coefficients is None else coefficients)
+        self.model_factors = dict(model_factors or {})
+        self.sample_count = sample_count
+
+    def factor(self, model=None):
+        return self.model_factors.get(model, 1.0) if model else 1.0
+
+    def fingerprint(self):
+        """CRC32 of the coefficients, so stored per-line counts can tell when the model was refitted."""
+        return zlib.crc32(json.dumps(self.coefficients, sort_keys=True).encode('utf-8'))
+
+    def raw_estimate(self, features):
+        """Unscaled, unrounded token estimate of one feature dict."""
+        return sum(self.coefficients[name] * features[name] for name in FEATURES)
+
+    def count(self, text, model=None):
+        """Tokens for a whole text (prompt-sized strings)."""
+        if not text: return 0
+        return max(1, round(self.raw_estimate(text_features(text)) * self.factor(model)))
+
+    def count_lines(self, lines, model=None):
+        """
+        Tokens per line, each counted as written to a file (line + newline); lines that are empty
+        after removing their newline count 0, others at least 1. The sum is what the file costs.
+        """
+        lines = [line[:-1] if line.endswith('\n') else line for line in lines]
+        columns = line_feature_columns(lines)
+        weights = [self.coefficients[name] * self.factor(model) for name in FEATURES]
+        return [max(1, round(sum(w * v for w, v in zip(weights, values)))) if values[0] else 0
+                for values in zip(*(columns[name] for name in FEATURES))]
+
+    @classmethod
+    def fit(cls, samples):
+        """
+        Builds an estimator from calibration samples ({'model', 'features', 'tokens'}): a ridge
+        regression of the weights towards PRIOR_COEFFICIENTS (once MIN_FIT_SAMPLES exist), then
+        per model the median ratio of reported to estimated tokens.
+        """
+        samples = [s for s in samples if s.get('tokens') and s.get('features')]
+        coefficients = dict(PRIOR_COEFFICIENTS)
+        if len(samples) >= MIN_FIT_SAMPLES:
+            coefficients = _ridge_fit(samples)
+        estimator = cls(coefficients, sample_count=len(samples))
+        by_model = {}
+        for sample in samples:
+            estimate = estimator.raw_estimate(sample['features'])
+            if estimate > 0: by_model.setdefault(sample.get('model'), []).append(sample['tokens'] / estimate)
+        estimator.model_factors = {model: statistics.median(ratios) for model, ratios in by_model.items() if model}
+        return estimator
+
+
+def _ridge_fit(samples):
+    """Least squares on the feature sums with a pull towards the prior, solved in pure Python; weights stay >= 0."""
+    n = len(FEATURES)
+    rows = [[float(sample['features'].get(name, 0)) for name in FEATURES] for sample in samples]
+    targets = [float(sample['tokens']) for sample in samples]
+    gram = [[sum(row[i] * row[j] for row in rows) for j in range(n)] for i in range(n)]
+    rhs = [sum(row[i] * y for row, y in zip(rows, targets)) for i in range(n)]
+    for i, name in enumerate(FEATURES):
+        penalty = PRIOR_STRENGTH * (gram[i][i] / len(rows) or 1.0)
+        gram[i][i] += penalty; rhs[i] += penalty * PRIOR_COEFFICIENTS[name]
+    solution = _solve(gram, rhs)
+    if solution is None: return dict(PRIOR_COEFFICIENTS)
+    return {name: max(0.0, value) for name, value in zip(FEATURES, solution)}
+
+
+def _solve(matrix, vector):
+    """Gaussian elimination with partial pivoting; None if singular."""
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-12: return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, n):
+            f = a[r][col] / a[col][col]
+            for c in range(col, n + 1): a[r][c] -= f * a[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (a[r][n] - sum(a[r][c] * x[c] for c in range(r + 1, n))) / a[r][r]
+    return x
+
+
+# --- Calibration samples ---
+def load_samples(path=TOKEN_CALIBRATION_FILE):
+    samples = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: samples.append(json.loads(line))
+                except json.JSONDecodeError: continue # Skip a torn last line
+    except FileNotFoundError: pass
+    return samples
+
+
+def record_usage(model, prompt_text, prompt_token_count, path=TOKEN_CALIBRATION_FILE):
+    """
+    Appends one calibration sample (the prompt's features, never its text) for the next fit.
+    Returns True if a sample was written.
+    """
+    if not prompt_text or not isinstance(prompt_token_count, int) or prompt_token_count <= 0: return False
+    sample = {'model': model, 'tokens': prompt_token_count, 'features': text_features(prompt_text)}
+    try:
+        with open(path, 'a', encoding='utf-8') as f: f.write(json.dumps(sample) + '\n')
+    except OSError: return False
+    with _lock: _estimator_cache.clear() # Refit on next use
+    return True
+
+
+# --- Shared estimator and per-file cache ---
+_lock = threading.Lock()
+_estimator_cache = {} # {'key': calibration file (size, mtime), 'estimator': TokenEstimator}
+_file_cache = {} # ((abspath, size, mtime_ns), estimator fingerprint) -> token total without model correction
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def get_estimator():
+    """Process-wide estimator, refitted whenever the calibration file changes."""
+    try: key = _file_signature(TOKEN_CALIBRATION_FILE)
+    except OSError: key = None
+    with _lock:
+        if _estimator_cache.get('key') == key and 'estimator' in _estimator_cache: return _estimator_cache['estimator']
+    estimator = TokenEstimator.fit(load_samples()) if key else TokenEstimator()
+    with _lock: _estimator_cache.update(key=key, estimator=estimator)
+    return estimator
+
+
+def count_tokens(text, model=None):
+    return get_estimator().count(text, model)
+
+
+def count_line_tokens(lines, model=None):
+    return get_estimator().count_lines(lines, model)
+
+
+def count_file_tokens(path, model=None):
+    """
+    Tokens of a UTF-8 text file as the sum of its per-line counts (the same numbers optimize.py
+    budgets with), scaled by `model`'s correction factor. Unscaled totals are cached by (path, size,
+    mtime) and the estimator's fingerprint, so repeated GUI refreshes only re-read files that changed
+    and a refitted factor applies without a re-read; older entries for the path are dropped.
+    """
+    signature = _file_signature(path)
+    estimator = get_estimator(); fingerprint = estimator.fingerprint(); cache_key = (signature, fingerprint)
+    with _lock: total = _file_cache.get(cache_key)
+    if total is None:
+        with open(path, 'r', encoding='utf-8') as f: lines = f.read().split('\n')
+        if lines and lines[-1] == '': lines.pop() # Trailing newline, not an extra line
+        total = sum(estimator.count_lines(lines))
+        with _lock:
+            for stale in [k for k in _file_cache if k[0][0] == signature[0] and k != cache_key]: del _file_cache[stale]
+            _file_cache[cache_key] = total
+    return round(total * estimator.factor(model))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Gemini token estimates for review files.")
+    parser.add_argument('files', nargs='*', help="Text files to count")
+    parser.add_argument('--model', type=str, default=None, help="Model ID whose correction factor to apply")
+    parser.add_argument('--calibration', action='store_true', help=f"Show the model fitted from {TOKEN_CALIBRATION_FILE} and its error") # noqa
+    args = parser.parse_args()
+    if not args.files and not args.calibration: parser.print_help(); sys.exit(1)
+    estimator = get_estimator()
+    if args.calibration:
+        samples = load_samples()
+        print(f"Samples: {len(samples)} ({TOKEN_CALIBRATION_FILE})")
+        print("Weights: " + ", ".join(f"{name}={estimator.coefficients[name]:.3f}" for name in FEATURES))
+        for model, factor in sorted(estimator.model_factors.items()): print(f"  {model}: x{factor:.3f}")
+        prior = TokenEstimator()
+        for label, candidate in (("prior", prior), ("fitted", estimator)):
+            errors = [abs(candidate.raw_estimate(s['features']) * candidate.factor(s.get('model')) - s['tokens']) / s['tokens'] for s in samples if s.get('tokens')] # noqa
+            if errors: print(f"Mean abs error ({label}): {100 * statistics.fmean(errors):.1f}%")
+    for path in args.files:
+        try: print(f"{count_file_tokens(path, args.model):>12,}  {path}")
+        except (OSError, UnicodeDecodeError) as e: print(f"Error: {path}: {e}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
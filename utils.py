@@ -13,8 +13,10 @@ import customtkinter as ctk
 from config import (
     AITEXT_FILENAME, BASE_REVIEW_DIR, STEAM_LANGUAGES, STEAM_REVIEW_TYPES,
     STEAM_PURCHASE_TYPES, STEAM_DATE_RANGES, STEAM_PLAYTIME_FILTERS,
-    STEAM_FILTER_BY
+    STEAM_FILTER_BY, PARALLEL_SCRAPE_PARTITIONS, STEAM_STORE_URL, SUPPORTED_MODELS
 )
+from rate_limiter import get_limiter, THROTTLE_STATUS_CODES
+import game_manifest
 
 # --- Logging (Unchanged) ---
 def log_message(root, log_box, message):
@@ -55,10 +57,16 @@ def load_config_from_file(log_func):
 # --- Steam API Helper (Unchanged) ---
 def fetch_game_name(app_id, log_func):
     if not app_id or not app_id.isdigit(): log_func("Invalid App ID for fetching game name."); return None; # noqa
-    url = f"https://store.steampowered.com/api/appdetails?appids={app_id}"; log_func(f"Fetching name for ID: {app_id}..."); headers = {'User-Agent': 'SteamReviewAnalyzer/1.0'}; # noqa
-    try: response = requests.get(url, timeout=15, headers=headers); response.raise_for_status(); data = response.json(); # noqa
-    except requests.exceptions.Timeout: log_func(f"Timeout fetching name for App ID {app_id}."); messagebox.showerror("API Error", "Timeout fetching game name from Steam API."); return None; # noqa
-    except requests.exceptions.RequestException as e: log_func(f"Network error fetching game name: {e}"); messagebox.showerror("API Error", f"Network error fetching game name: {e}"); return None; # noqa
+    url = f"{STEAM_STORE_URL}/api/appdetails?appids={app_id}"; log_func(f"Fetching name for ID: {app_id}..."); headers = {'User-Agent': 'SteamReviewAnalyzer/1.0'}; # noqa
+    limiter = get_limiter(); limiter.acquire() # Shares the Steam request budget with any scrape in this process
+    try:
+        response = requests.get(url, timeout=15, headers=headers)
+        if limiter.observe(response): log_func(f"Steam is throttling requests (HTTP {response.status_code}). Rate now {limiter.describe()}.") # noqa
+        response.raise_for_status(); data = response.json(); # noqa
+    except requests.exceptions.Timeout: limiter.on_error(); log_func(f"Timeout fetching name for App ID {app_id}."); messagebox.showerror("API Error", "Timeout fetching game name from Steam API."); return None; # noqa
+    except requests.exceptions.RequestException as e:
+        if e.response is None or e.response.status_code not in THROTTLE_STATUS_CODES: limiter.on_error() # 429/503 already fed to observe() # noqa
+        log_func(f"Network error fetching game name: {e}"); messagebox.showerror("API Error", f"Network error fetching game name: {e}"); return None; # noqa
     except json.JSONDecodeError: log_func("JSON decode error fetching game name."); messagebox.showerror("API Error", "Invalid API response (game name)."); return None; # noqa
     except Exception as e: log_func(f"Unexpected error fetching game name: {e}"); messagebox.showerror("Error", f"Unexpected error fetching game name: {e}"); return None; # noqa
     if not isinstance(data, dict) or app_id not in data or not isinstance(data[app_id], dict): log_func(f"Unexpected API structure for App ID {app_id} (name fetch)."); return None; # noqa
@@ -75,14 +83,13 @@ def sanitize_filename(name):
     return sanitized
 
 
-# --- Token Estimation (Unchanged) ---
-def _estimate_tokens(text):
-    """Roughly estimates token count (1 token ~ 4 characters)."""
-    if not text: return 0
-    return len(text) // 4
-
-def calculate_and_format_token_estimates(game_name, steam_id, log_func):
-    """Reads review files and returns formatted token estimate string and raw numbers."""
+# --- Token Estimation (token_counter.py) ---
+def calculate_and_format_token_estimates(game_name, steam_id, log_func, model_id=None, recount=True):
+    """
+    Token estimates of the review files from the game's manifest (game_manifest.py); returns the display
+    string and raw numbers. Entries that no longer match their file are recounted (from the review store
+    or the line index) unless `recount` is False, in which case the display string is None when any is stale.
+    """
     orig_tokens = None; opt_tokens = None; display_text = "Token Estimates: N/A"; # noqa
 
     if not game_name or not steam_id or not steam_id.isdigit():
@@ -102,24 +109,9 @@ def calculate_and_format_token_estimates(game_name, steam_id, log_func):
          log_func(f"Error constructing game folder path for token calc: {e}")
          return display_text, orig_tokens, opt_tokens
 
-    orig_file = os.path.join(game_folder_path, f"{folder_name}_reviews.txt")
-    opt_file = os.path.join(game_folder_path, f"{folder_name}_reviews_optimized.txt")
-
-    # Estimate Original
-    if os.path.exists(orig_file):
-        try:
-            with open(orig_file, 'r', encoding='utf-8') as f: content = f.read()
-            orig_tokens = _estimate_tokens(content)
-        except Exception as e: log_func(f"Warn: Error estimating tokens for original file: {e}") # noqa
-    # else: log_func(f"Info: Original file not found for token count: {os.path.basename(orig_file)}") # Less verbose
-
-    # Estimate Optimized
-    if os.path.exists(opt_file):
-        try:
-            with open(opt_file, 'r', encoding='utf-8') as f: content = f.read()
-            opt_tokens = _estimate_tokens(content)
-        except Exception as e: log_func(f"Warn: Error estimating tokens for optimized file: {e}") # noqa
-    # else: log_func(f"Info: Optimized file not found for token count: {os.path.basename(opt_file)}") # Less verbose
+    try: orig_tokens, opt_tokens, fresh = game_manifest.token_estimates(game_folder_path, model_id, recount, log_func)
+    except Exception as e: log_func(f"Warn: Error estimating tokens: {e}"); fresh = True # noqa
+    if not fresh: return None, orig_tokens, opt_tokens
 
     # Format Display String
     orig_str = f"~{orig_tokens:,}" if orig_tokens is not None else "N/A"
@@ -130,6 +122,12 @@ def calculate_and_format_token_estimates(game_name, steam_id, log_func):
 
 
 # --- GUI Interaction Helpers ---
+def get_selected_model_id(widgets):
+    """API id of the model chosen in the AI section (None if unavailable); token budgets use its correction factor.""" # noqa
+    try: selected_name = widgets['model_combobox'].get()
+    except (KeyError, TclError, AttributeError): return None
+    return next((model['id'] for model in SUPPORTED_MODELS if model['name'] == selected_name), None)
+
 
 def get_settings(widgets, defaults, log_func):
     """Retrieves all settings from GUI widgets, including new filters."""
@@ -171,6 +169,13 @@ def get_settings(widgets, defaults, log_func):
     validate_float('sleep_duration_entry', 'sleep_duration', defaults['sleep_duration'], 0.0, "Sleep Duration") # noqa
     validate_int('num_per_page_entry', 'num_per_page', defaults['num_per_page'], 1, 100, "# Reviews Per Page") # noqa
 
+    # Stratified Sampling (Checkbox) - How optimize.py fills the token budget
+    sampling_widget = widgets.get('stratified_sampling_checkbox')
+    settings['optimize_sampling'] = 'stratified' if sampling_widget and hasattr(sampling_widget, 'get') and sampling_widget.get() == 1 else defaults['optimize_sampling'] # noqa
+    # Collapse Near-Duplicates (Checkbox) - Opt-in: a full pass over the input before the threshold applies
+    dedupe_widget = widgets.get('dedupe_checkbox')
+    settings['optimize_dedupe'] = bool(dedupe_widget.get() == 1) if dedupe_widget and hasattr(dedupe_widget, 'get') else defaults['optimize_dedupe'] # noqa
+
     # --- Get Steam Filter Settings ---
     try:
         # Language (ComboBox) - Map display name to API value
@@ -211,6 +216,17 @@ def get_settings(widgets, defaults, log_func):
         else:
              settings['steam_beta'] = defaults['steam_beta'] # Fallback to default
 
+        # Parallel Partitions (Checkbox) - Split scrape into independent cursor chains
+        partition_widget = widgets.get('filter_partition_checkbox')
+        if partition_widget and hasattr(partition_widget, 'get') and partition_widget.get() == 1:
+             settings['scrape_partitions'] = PARALLEL_SCRAPE_PARTITIONS
+        else:
+             settings['scrape_partitions'] = defaults['scrape_partitions']
+
+        # Incremental Update (Checkbox) - Only fetch reviews newer than the saved file
+        incremental_widget = widgets.get('filter_incremental_checkbox')
+        settings['scrape_incremental'] = bool(incremental_widget and hasattr(incremental_widget, 'get') and incremental_widget.get() == 1)
+
     except Exception as e:
         log_func(f"Error reading filter settings from GUI: {e}. Using defaults for filters.")
         # Reset filter settings to default if error occurs
@@ -221,6 +237,8 @@ def get_settings(widgets, defaults, log_func):
         settings['steam_playtime'] = defaults['steam_playtime']
         settings['steam_filter_by'] = defaults['steam_filter_by']
         settings['steam_beta'] = defaults['steam_beta']
+        settings['scrape_partitions'] = defaults['scrape_partitions']
+        settings['scrape_incremental'] = defaults['scrape_incremental']
         # Optionally reset the GUI elements themselves here if desired
 
     # log_func(f"Retrieved Settings: {settings}") # Debugging log
@@ -0,0 +1,155 @@
+# virtual_table.py
+"""
+Virtualized rows for the ttk.Treeview on the "Extracted Data" tab: AI extractions can have thousands of
+rows, and one Treeview item per row makes every load and filter change cost a Tcl insert per row.
+
+The table is kept as TableData (one list per column) plus an index of the data rows to show, in display
+order (a range for "Show All", an array of row numbers for a filter). The Treeview only ever holds the
+rows in view plus OVERSCAN_ROWS above and below; its items are reused, so paging rows in and out is one
+item update per row of the window. The vertical scrollbar and the mouse wheel move a position in the
+index instead of scrolling the Treeview, and the scrollbar shows that position over all rows.
+"""
+from array import array
+from tkinter import TclError
+
+OVERSCAN_ROWS = 20 # Rows kept materialized above and below the visible ones
+ROW_HEIGHT = 25 # Matches the "Treeview" style's rowheight in gui.py
+HEADING_HEIGHT = 30
+DEFAULT_VISIBLE_ROWS = 20 # Before the widget has been laid out
+
+
+class TableData:
+    """A CSV table stored column-wise: `header` and one list of cell strings per column."""
+
+    def __init__(self, header, rows=()):
+        self.header = list(header)
+        self.columns = [[] for _ in self.header]
+        self.extend(rows)
+
+    def __len__(self): return len(self.columns[0]) if self.columns else 0
+
+    def extend(self, rows):
+        """Appends rows (lists of cells), padded or cut to the header's width."""
+        width = len(self.header)
+        padded = [(list(row) + [''] * width)[:width] for row in rows]
+        for column, cells in zip(self.columns, zip(*padded) if padded else [()] * width): column.extend(cells)
+
+    def row(self, n):
+        return [column[n] for column in self.columns]
+
+    def matching(self, column, value, start=0):
+        """Row numbers (from `start`) whose cell in `column` equals `value`, as an array."""
+        cells = self.columns[column]
+        return array('L', (n for n in range(start, len(cells)) if str(cells[n]) == value))
+
+
+class VirtualTable:
+    """
+    Drives `tree` (and its vertical `scrollbar`) from a TableData. set_data() loads a table, set_filter()
+    swaps the index of shown rows, append_rows() grows the table (streamed answers); none of them touch
+    more Treeview items than fit in the window.
+    """
+
+    def __init__(self, tree, scrollbar=None, tags=('evenrow', 'oddrow'), overscan=OVERSCAN_ROWS):
+        self.tree = tree; self.scrollbar = scrollbar; self.tags = tags; self.overscan = overscan
+        self.data = TableData([]); self.index = range(0); self.filter = None
+        self.top = 0 # Index position of the first visible row
+        self.window = (0, 0) # Index positions materialized in the Treeview
+        self._items = [] # Treeview item IDs, reused for whatever rows the window holds
+        self._selected = set() # Selected data rows, kept across paging
+        tree.configure(yscrollcommand=self._on_tree_scrolled)
+        if scrollbar is not None: scrollbar.configure(command=self.yview)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'): tree.bind(sequence, self._on_wheel)
+        tree.bind('<Configure>', lambda event: self.refresh(), add='+')
+        tree.bind('<<TreeviewSelect>>', self._on_select, add='+')
+
+    # --- Data ---
+    def set_data(self, data):
+        """Shows a new TableData from the top, unfiltered."""
+        self.data = data; self.filter = None; self.index = range(len(data)); self.top = 0; self._selected = set()
+        self.clear()
+        self.refresh(force=True)
+
+    def set_filter(self, column=None, value=None):
+        """Shows only rows whose `column` equals `value` (None: all rows). Only the index is rebuilt."""
+        self.filter = None if column is None else (column, value)
+        self.index = range(len(self.data)) if column is None else self.data.matching(column, value)
+        self.top = 0
+        self.refresh(force=True)
+
+    def append_rows(self, rows):
+        """Adds rows at the end; they join the index if they pass the current filter."""
+        start = len(self.data)
+        self.data.extend(rows)
+        if self.filter is None: self.index = range(len(self.data))
+        else: self.index.extend(self.data.matching(self.filter[0], self.filter[1], start))
+        self.refresh(force=self.window[1] >= start) # Repaint only if the window shows the end of the table
+
+    def __len__(self): return len(self.index)
+
+    # --- Window ---
+    def visible_rows(self):
+        try: height = self.tree.winfo_height()
+        except TclError: height = 0
+        return max(1, (height - HEADING_HEIGHT) // ROW_HEIGHT + 1) if height > 1 else DEFAULT_VISIBLE_ROWS
+
+    def refresh(self, force=False):
+        """Re-materializes the window around `top` if it no longer covers the visible rows (or `force`)."""
+        visible = self.visible_rows()
+        self.top = max(0, min(self.top, len(self.index) - visible))
+        start, stop = self.window
+        if force or self.top < start or min(self.top + visible, len(self.index)) > stop:
+            start = max(0, self.top - self.overscan); stop = min(len(self.index), self.top + visible + self.overscan)
+            self._materialize(start, stop)
+        self._scroll_tree()
+
+    def _materialize(self, start, stop):
+        tree = self.tree
+        while len(self._items) < stop - start: self._items.append(tree.insert("", "end", values=()))
+        while len(self._items) > stop - start: tree.delete(self._items.pop())
+        selected = []
+        for position, item in zip(range(start, stop), self._items):
+            row = self.index[position]
+            tree.item(item, values=self.data.row(row), tags=(self.tags[position % 2],))
+            if row in self._selected: selected.append(item)
+        self.window = (start, stop)
+        tree.selection_set(selected)
+
+    def clear(self):
+        """Deletes the window's Treeview items (before the columns change)."""
+        if self._items: self.tree.delete(*self._items)
+        self._items = []; self.window = (0, 0)
+
+    def _scroll_tree(self):
+        """Scrolls the Treeview so the window's row at `top` is its first visible one."""
+        start, stop = self.window
+        if stop > start: self.tree.yview_moveto((self.top - start) / (stop - start))
+        else: self._on_tree_scrolled(0.0, 1.0)
+
+    # --- Scrolling ---
+    def yview(self, *args):
+        """Scrollbar command: 'moveto FRACTION' or 'scroll N units|pages' over the whole index."""
+        if not args: return
+        if args[0] == 'moveto': self.top = int(float(args[1]) * len(self.index))
+        elif args[0] == 'scroll': self.top += int(args[1]) * (self.visible_rows() - 1 if str(args[2]).startswith('page') else 1)
+        self.refresh()
+
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) in (4, 5): steps = -1 if event.num == 4 else 1 # X11
+        else: steps = -1 if event.delta > 0 else 1
+        self.yview('scroll', steps * 3, 'units')
+        return "break" # The Treeview would only scroll inside the window
+
+    def _on_tree_scrolled(self, first, last):
+        """The Treeview's yscrollcommand: its fractions of the window, reported as fractions of the index."""
+        if self.scrollbar is None: return
+        start, stop = self.window; total = len(self.index)
+        if not total: self.scrollbar.set(0.0, 1.0); return
+        span = stop - start
+        self.scrollbar.set((start + float(first) * span) / total, (start + float(last) * span) / total)
+
+    def _on_select(self, event=None):
+        start, _ = self.window
+        in_window = {self.index[start + n]: item for n, item in enumerate(self._items)}
+        selected = set(self.tree.selection())
+        self._selected = {row for row in self._selected if row not in in_window} | {row for row, item in in_window.items() if item in selected} # noqa